@@ -4,6 +4,7 @@ Generated by 'django-admin startproject' using Django 6.0.
 """
 
 import os
+import sys
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -38,6 +39,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'health.instrumentation.InstrumentationMiddleware',   # no-op unless HEALTH_INSTRUMENTATION
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -67,17 +69,64 @@ TEMPLATES = [
 WSGI_APPLICATION = 'dietplanner.wsgi.application'
 
 # Database
+# health.backends.mysql is Django's MySQL backend plus an optional bounded
+# per-worker connection pool (health.dbpool): connections are validated before
+# reuse and recycled after DB_POOL_MAX_LIFETIME seconds. Off unless DB_POOL_SIZE
+# is set. Use it with DB_CONN_MAX_AGE=0: a persistent connection holds its pool
+# slot for the thread's lifetime, so threads beyond DB_POOL_SIZE would block
+# (health.W001 warns about the combination).
+DB_POOL = {
+    'max_size': int(os.environ.get('DB_POOL_SIZE', '0')),
+    'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+    'max_lifetime': float(os.environ.get('DB_POOL_MAX_LIFETIME', '1800')),
+    'check_after': float(os.environ.get('DB_POOL_CHECK_AFTER', '0')),
+}
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        'ENGINE': 'health.backends.mysql',
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASSWORD'),
         'HOST': os.environ.get('DB_HOST', '127.0.0.1'),
         'PORT': os.environ.get('DB_PORT', '3306'),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '0')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'pool': DB_POOL} if DB_POOL['max_size'] > 0 else {},
     }
 }
 
+# --- CACHING ---
+# health.cache.TieredCache: a per-process L1 (LRU, entries kept at most
+# CACHE_L1_TIMEOUT seconds) in front of the shared L2 alias 'shared' —
+# Redis when REDIS_URL is set, otherwise files under CACHE_DIR. Test runs
+# swap L2 for local memory so nothing leaks between runs.
+TESTING = sys.argv[1:2] == ['test']
+
+if TESTING:
+    _CACHE_L2 = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'health-tests'}
+elif os.environ.get('REDIS_URL'):
+    _CACHE_L2 = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': os.environ['REDIS_URL']}
+else:
+    _CACHE_L2 = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_DIR', str(BASE_DIR / 'django_cache')),
+        'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', '10000'))},
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'health.cache.TieredCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'L1_MAX_ENTRIES': int(os.environ.get('CACHE_L1_MAX_ENTRIES', '1000')),
+            'L1_TIMEOUT': int(os.environ.get('CACHE_L1_TIMEOUT', '5')),
+            'LOCK_TIMEOUT': int(os.environ.get('CACHE_LOCK_TIMEOUT', '10')),
+        },
+    },
+    'shared': _CACHE_L2,
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     { 'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator', },
@@ -115,3 +164,43 @@ SESSION_EXPIRE_AT_BROWSER_CLOSE = True
 
 # 2. (Optional) Auto-logout after X seconds of inactivity (e.g., 30 minutes = 1800 seconds)
 SESSION_COOKIE_AGE = 1800
+
+# --- DIET ENGINE SETTINGS ---
+# Food-pool filter engine used by smart_filter:
+#   'catalog' (in-memory snapshot), 'numpy' (vectorised masks) or 'orm' (queryset chain)
+HEALTH_FOOD_FILTER_ENGINE = os.environ.get('FOOD_FILTER_ENGINE', 'catalog')
+
+# Max distinct disease combinations kept by the memoised restriction resolver
+HEALTH_RESTRICTION_CACHE_SIZE = int(os.environ.get('RESTRICTION_CACHE_SIZE', '256'))
+
+# Plan variety: a food is not served again within this many days (0 = rotation only)
+HEALTH_PLAN_NO_REPEAT_DAYS = int(os.environ.get('PLAN_NO_REPEAT_DAYS', '2'))
+
+# Foods per meal slot: 1 = single food scaled to calories; 2–3 = composed meals
+# whose grams are solved for calories and macros together (health.engine.composer)
+HEALTH_MEAL_MAX_ITEMS = int(os.environ.get('MEAL_MAX_ITEMS', '3'))
+
+# Rendered PDF reports: on-disk cache root and the background render pool
+# ('thread' or 'process' executor, HEALTH_PDF_WORKERS workers)
+HEALTH_PDF_CACHE_DIR = os.environ.get('PDF_CACHE_DIR', str(BASE_DIR / 'pdf_cache'))
+HEALTH_PDF_WORKERS = int(os.environ.get('PDF_WORKERS', '2'))
+HEALTH_PDF_EXECUTOR = os.environ.get('PDF_EXECUTOR', 'thread')
+# Seconds a download waits for its render before answering 202 + Retry-After
+HEALTH_PDF_WAIT = float(os.environ.get('PDF_WAIT', '10'))
+HEALTH_PDF_RETRY_AFTER = int(os.environ.get('PDF_RETRY_AFTER', '3'))
+# Queue the report PDF after every plan write (off under tests)
+HEALTH_PDF_PRERENDER = os.environ.get('PDF_PRERENDER', '0' if TESTING else '1') == '1'
+
+# Seconds a rendered report fragment (plan table, history, analytics) is kept;
+# entries are versioned, so this only bounds how long stale ones linger
+HEALTH_REPORT_CACHE_TIMEOUT = int(os.environ.get('REPORT_CACHE_TIMEOUT', '86400'))
+
+# Seconds the home dashboard statistics are reused; any Patient/Checkup
+# change invalidates them sooner
+HEALTH_DASHBOARD_CACHE_TIMEOUT = int(os.environ.get('DASHBOARD_CACHE_TIMEOUT', '60'))
+
+# Per-view timing / SQL instrumentation (health.instrumentation); off by default.
+# Reports at /metrics/ (staff JSON) and /metrics/prometheus/ (bearer token or staff)
+HEALTH_INSTRUMENTATION = os.environ.get('INSTRUMENTATION', '') in ('1', 'true', 'True')
+HEALTH_INSTRUMENTATION_WINDOW = int(os.environ.get('INSTRUMENTATION_WINDOW', '1000'))
+HEALTH_METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
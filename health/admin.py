@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Patient, Checkup, FoodItem, Disease, AssignedMeal
+from .models import Patient, Checkup, FoodItem, Disease, AssignedMeal, PatientLatestCheckup
 
 
 @admin.register(Disease)
@@ -38,3 +38,11 @@ class AssignedMealAdmin(admin.ModelAdmin):
     list_display  = ('checkup', 'day', 'meal_type', 'food_item', 'quantity_text', 'total_calories')
     list_filter   = ('day', 'meal_type')
     search_fields = ('checkup__patient__name', 'food_item__name')
+
+
+@admin.register(PatientLatestCheckup)
+class PatientLatestCheckupAdmin(admin.ModelAdmin):
+    list_display  = ('patient', 'checkup', 'date', 'bmi', 'category', 'visit_count')
+    list_filter   = ('category',)
+    search_fields = ('patient__name', 'patient__phone')
+    ordering      = ('-date',)
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.core import checks
 
 
 class HealthConfig(AppConfig):
@@ -6,3 +7,5 @@ class HealthConfig(AppConfig):
 
     def ready(self):
         import health.signals
+        from health.dbpool import check_pool_settings
+        checks.register(check_pool_settings)
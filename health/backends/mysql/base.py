@@ -0,0 +1,10 @@
+"""Django's MySQL backend (PyMySQL as MySQLdb) with the health.dbpool connection pool."""
+from django.db.backends.mysql import base
+
+from health.dbpool import PooledDatabaseWrapper
+
+
+class DatabaseWrapper(PooledDatabaseWrapper, base.DatabaseWrapper):
+
+    def validate_pooled(self, conn):
+        conn.ping(False)        # one round trip, never silently reconnects
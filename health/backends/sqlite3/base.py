@@ -0,0 +1,11 @@
+"""Django's SQLite backend with the health.dbpool pool — a local stand-in for MySQL."""
+from django.db.backends.sqlite3 import base
+
+from health.dbpool import PooledDatabaseWrapper
+
+
+class DatabaseWrapper(PooledDatabaseWrapper, base.DatabaseWrapper):
+
+    def pool_options(self):
+        # An in-memory database lives and dies with its one connection
+        return None if self.is_in_memory_db() else super().pool_options()
@@ -0,0 +1,317 @@
+"""
+Latency / query-count benchmarks for the diet-planning hot paths.
+
+    manage.py benchmark --patients 500 --save benchmarks/baseline.json
+    manage.py benchmark --compare benchmarks/baseline.json --threshold 0.25
+
+A run seeds N synthetic patients (one checkup each, random measurements,
+diseases drawn from the disease.json fixture, plans generated in bulk) inside
+a transaction that is rolled back afterwards, so it is safe against a dev
+database. The rollback does not reach the shared cache, so the namespaces the
+cases write to (report fragments and history stamps, dashboard) are retired
+afterwards — the rolled-back ids are reused by the next real rows. Every
+case is timed per call and summarised as p50/p90/p99/mean milliseconds plus
+the SQL queries it issued.
+
+`instrumentation_overhead` times the report view with and without
+health.instrumentation's middleware, alternating the two on the same warm
+requests, and reports the p50 slowdown against INSTRUMENTATION_BUDGET
+(run it alone with `--only instrumentation.overhead`).
+
+Baselines are the JSON written by `--save`. `compare` flags a case when its
+latency metric grows by more than `threshold` (a fraction) or when it issues
+more queries per call than the baseline did.
+"""
+import json
+import math
+import platform
+import random
+import time
+from dataclasses import dataclass
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+
+from .cache import namespace
+from .catalog import get_catalog
+from .dashboard import dashboard_stats
+from .engine import generate_week, meal_splits
+from .filters import selected_engine
+from .generation import generate_plan, generate_plans, plan_seed, profile_for
+from .instrumentation import InstrumentationMiddleware
+from .models import Patient, Checkup, Disease, FoodItem
+from .pdf import render_html, render_pdf_bytes
+from .restrictions import restrictions_for_checkup
+from .search import search_patients
+
+
+FIRST_NAMES = ['Aarav', 'Meera', 'Rohan', 'Priya', 'Kabir', 'Ananya', 'Vikram', 'Sara', 'Arjun', 'Divya']
+LAST_NAMES  = ['Nair', 'Sharma', 'Iyer', 'Khan', 'Reddy', 'Das', 'Mehta', 'Pillai', 'Rao', 'Joshi']
+ACTIVITY    = [1.2, 1.375, 1.55, 1.725, 1.9]
+DIETS       = ['Veg', 'Non-Veg', 'Vegan', 'Eggetarian']
+PLAN_TYPES  = ['3-Meal', '4-Meal']
+
+# Cache namespaces holding entries keyed by seeded (rolled-back) rows
+CACHED_NAMESPACES = ('report', 'dashboard')
+
+# Allowed slowdown of report.view with the instrumentation middleware on
+INSTRUMENTATION_BUDGET = 0.02
+
+
+@dataclass
+class Case:
+    name:       str
+    run:        object        # callable(rng) → None
+    iterations: int
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already-sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarise(timings, query_counts):
+    ms = sorted(t * 1000 for t in timings)
+    return {
+        'calls':       len(ms),
+        'p50_ms':      round(percentile(ms, 50), 3),
+        'p90_ms':      round(percentile(ms, 90), 3),
+        'p99_ms':      round(percentile(ms, 99), 3),
+        'mean_ms':     round(sum(ms) / len(ms), 3) if ms else 0.0,
+        'queries':     round(sum(query_counts) / len(query_counts), 2) if query_counts else 0,
+        'max_queries': max(query_counts) if query_counts else 0,
+    }
+
+
+def ensure_fixtures():
+    if not FoodItem.objects.exists():
+        call_command('loaddata', 'food.json', verbosity=0)
+    if not Disease.objects.exists():
+        call_command('loaddata', 'disease.json', verbosity=0)
+
+
+def seed_patients(count, rng):
+    """N synthetic patients, one checkup each, with diseases and generated plans."""
+    disease_ids = list(Disease.objects.values_list('id', flat=True))
+    base_phone = 7_000_000_000 + rng.randrange(1_000_000)
+    checkups = []
+    for n in range(count):
+        patient = Patient.objects.create(
+            name=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {n}",
+            gender=rng.choice(['Male', 'Female']),
+            phone=str(base_phone + n), address='Benchmark Lane',
+        )
+        age, height, weight = rng.randint(18, 80), rng.uniform(150, 190), rng.uniform(45, 120)
+        activity = rng.choice(ACTIVITY)
+        checkup = Checkup(
+            patient=patient, age=age, height=height, weight=weight, activity=activity,
+            dietary=rng.choice(DIETS), plan_type=rng.choice(PLAN_TYPES),
+        )
+        checkup.compute_metrics(patient.gender)
+        checkup.save()
+        if disease_ids:
+            checkup.disease_links.set(rng.sample(disease_ids, rng.randint(0, 3)))
+        checkups.append(checkup)
+    generate_plans(Checkup.objects.select_related('patient').filter(id__in=[c.id for c in checkups]))
+    return checkups
+
+
+def build_cases(checkups, iterations):
+    """The benchmarked operations; each gets a random seeded checkup per call."""
+    from .views import build_pdf_context
+
+    factory = RequestFactory()
+    user = User(username='benchmark')         # unsaved; login_required only checks it
+    catalog = get_catalog()
+    pool_filter = selected_engine()
+    max_items = settings.HEALTH_MEAL_MAX_ITEMS
+
+    def engine_week(rng):
+        checkup = rng.choice(checkups)
+        generate_week(profile_for(checkup), catalog, restrictions_for_checkup(checkup),
+                      meal_splits(checkup.plan_type), seed=plan_seed(checkup),
+                      pool_filter=pool_filter, max_items=max_items,
+                      no_repeat_days=settings.HEALTH_PLAN_NO_REPEAT_DAYS)
+
+    def plan_generate(rng):
+        generate_plan(rng.choice(checkups), replace=True)
+
+    def report_view(rng):
+        dispatch(report_request(factory, user, rng.choice(checkups)))
+
+    def pdf_render(rng):
+        checkup = rng.choice(checkups)
+        render_pdf_bytes(render_html(build_pdf_context(checkup, 'Benchmark')))
+
+    def dashboard(rng):
+        dashboard_stats()
+
+    def search(rng):
+        search_patients(rng.choice(FIRST_NAMES + LAST_NAMES)[:rng.randint(2, 5)])
+
+    return [
+        Case('engine.generate_week', engine_week,   iterations),
+        Case('plan.generate',        plan_generate, iterations),
+        Case('report.view',          report_view,   iterations),
+        Case('pdf.render',           pdf_render,    max(1, iterations // 10)),
+        Case('dashboard.stats',      dashboard,     iterations),
+        Case('search.patients',      search,        iterations),
+    ]
+
+
+def report_request(factory, user, checkup):
+    path = f'/report/{checkup.patient_id}/{checkup.id}/'
+    request = factory.get(path)
+    request.user = user
+    request.resolver_match = resolve(path)
+    return request
+
+
+def dispatch(request):
+    """Call the resolved view, as the handler does after the middleware chain."""
+    match = request.resolver_match
+    return match.func(request, *match.args, **match.kwargs)
+
+
+def instrumentation_overhead(checkups, iterations, seed):
+    """
+    p50 of the report view alone and wrapped in InstrumentationMiddleware.
+    Each sampled checkup is rendered once to warm its cached fragments, then
+    timed both ways in alternating order, so the two series see the same
+    requests and the same cache state.
+    """
+    rng = random.Random(f"{seed}_instrumentation")
+    factory, user = RequestFactory(), User(username='benchmark')
+    sample = [rng.choice(checkups) for _ in range(iterations)]
+    for checkup in set(sample):
+        dispatch(report_request(factory, user, checkup))
+    with override_settings(HEALTH_INSTRUMENTATION=True):
+        instrumented = InstrumentationMiddleware(dispatch)
+
+    timings = {False: [], True: []}
+    for n, checkup in enumerate(sample):
+        for wrapped in ((False, True) if n % 2 else (True, False)):
+            request = report_request(factory, user, checkup)
+            started = time.perf_counter()
+            (instrumented if wrapped else dispatch)(request)
+            timings[wrapped].append(time.perf_counter() - started)
+
+    plain = percentile(sorted(timings[False]), 50) * 1000
+    wrapped = percentile(sorted(timings[True]), 50) * 1000
+    return {
+        'plain_p50_ms':        round(plain, 3),
+        'instrumented_p50_ms': round(wrapped, 3),
+        'overhead':            round(wrapped / plain - 1, 4) if plain else 0.0,
+        'budget':              INSTRUMENTATION_BUDGET,
+    }
+
+
+def run_case(case, seed):
+    rng = random.Random(f"{seed}_{case.name}")
+    case.run(rng)                                   # warm-up, not recorded
+    timings, query_counts = [], []
+    for _ in range(case.iterations):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            case.run(rng)
+            timings.append(time.perf_counter() - started)
+        query_counts.append(len(queries))
+    return summarise(timings, query_counts)
+
+
+def run(patients=200, iterations=50, seed=0, only=None, log=None):
+    """Seed, time every case (optionally only names in `only`), roll back."""
+    ensure_fixtures()
+    results, overhead = {}, None
+    try:
+        with transaction.atomic():
+            rng = random.Random(seed)
+            started = time.perf_counter()
+            checkups = seed_patients(patients, rng)
+            if log:
+                log(f"Seeded {patients} patient(s) in {time.perf_counter() - started:.1f}s.")
+
+            for case in build_cases(checkups, iterations):
+                if only and case.name not in only:
+                    continue
+                results[case.name] = run_case(case, seed)
+                if log:
+                    log(format_row(case.name, results[case.name]))
+
+            # Last: the middleware wraps template rendering for the whole process
+            if not only or 'instrumentation.overhead' in only:
+                overhead = instrumentation_overhead(checkups, iterations, seed)
+                if log:
+                    log(format_overhead(overhead))
+            transaction.set_rollback(True)
+    finally:
+        for name in CACHED_NAMESPACES:
+            namespace(name).bump()
+
+    report = {
+        'meta': {
+            'created':    timezone.now().isoformat(timespec='seconds'),
+            'patients':   patients,
+            'iterations': iterations,
+            'seed':       seed,
+            'database':   connection.vendor,
+            'python':     platform.python_version(),
+            'django':     django.get_version(),
+        },
+        'results': results,
+    }
+    if overhead:
+        report['instrumentation'] = overhead
+    return report
+
+
+def format_row(name, r):
+    return (f"{name:<22} p50 {r['p50_ms']:>9.2f} ms  p90 {r['p90_ms']:>9.2f} ms  "
+            f"p99 {r['p99_ms']:>9.2f} ms  queries {r['queries']:>6}")
+
+
+def format_overhead(o):
+    verdict = 'within' if o['overhead'] <= o['budget'] else 'OVER'
+    return (f"{'instrumentation':<22} p50 {o['plain_p50_ms']:>9.2f} ms → "
+            f"{o['instrumented_p50_ms']:.2f} ms  overhead {o['overhead']:+.1%} "
+            f"({verdict} the {o['budget']:.0%} budget)")
+
+
+def compare(baseline, current, threshold=0.2, metric='p50_ms'):
+    """
+    [(case, reason)] for every case slower than baseline·(1 + threshold) on
+    `metric`, or issuing more queries per call. Cases missing from either side
+    are ignored.
+    """
+    regressions = []
+    for name, base in baseline.get('results', {}).items():
+        now = current.get('results', {}).get(name)
+        if now is None:
+            continue
+        if base[metric] and now[metric] > base[metric] * (1 + threshold):
+            change = now[metric] / base[metric] - 1
+            regressions.append((name, f"{metric} {base[metric]} → {now[metric]} (+{change:.0%})"))
+        if now['queries'] > base['queries']:
+            regressions.append((name, f"queries {base['queries']} → {now['queries']}"))
+    return regressions
+
+
+def load(path):
+    with open(path, encoding='utf-8') as fh:
+        return json.load(fh)
+
+
+def save(report, path):
+    with open(path, 'w', encoding='utf-8') as fh:
+        json.dump(report, fh, indent=2, sort_keys=True)
+        fh.write('\n')
@@ -0,0 +1,369 @@
+"""
+Tiered cache backend plus namespaced, versioned keys.
+
+    cache.get(key) ──► L1  per-process, bounded LRU, entries live ≤ L1 TIMEOUT
+                        │ miss
+                        ▼
+                       L2  shared CACHES alias (file-based, or Redis when
+                        │  REDIS_URL is set; local memory under tests)
+                        │ miss
+                        ▼
+                     build()  — once per key: concurrent callers in this process
+                              wait for the leader, other processes wait on an
+                              L2 `add` lock (single flight)
+
+`TieredCache` is a Django cache backend, so `django.core.cache.cache` (the
+'default' alias in settings.CACHES) is tiered for every caller. Writes go to
+both tiers; L1 entries are capped at a few seconds, which bounds how long a
+worker can serve a value another worker has replaced. Values are pickled in
+L1 exactly as in L2, so callers never share mutable objects.
+
+Keys are grouped into namespaces — `health:<namespace>:…` — one per cached
+subsystem:
+
+    catalog       FoodItem snapshot version (health.catalog)
+    restrictions  Disease merge version (health.restrictions)
+    dashboard     home dashboard statistics (health.dashboard)
+    report        report page fragments and history stamps (health.report_cache)
+    pdf           rendered PDF keys (health.pdf)
+
+`namespace(name).key(*parts)` embeds the namespace's version stamp, so
+`invalidate()` retires every key of a namespace at once by minting a new
+stamp; the old entries are never read again and expire on their own. Until
+the invalidating transaction ends, `get_or_set` builds without storing, so a
+rollback cannot leave values built from discarded rows under the new stamp.
+Hits (per tier), misses, coalesced waits, L1 evictions (LRU) and L1
+expirations (TTL) are counted per namespace (`stats.snapshot()`, served with
+views.metrics_json).
+"""
+import hashlib
+import pickle
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.db import connection, transaction
+
+
+PREFIX     = 'health'
+NAMESPACES = ('catalog', 'restrictions', 'dashboard', 'report', 'pdf')
+
+_MISSING = object()
+
+
+def namespace_of(key):
+    """'health:report:…' → 'report'; keys outside the scheme count as 'other'."""
+    head, _, rest = str(key).partition(':')
+    name = rest.partition(':')[0]
+    return name if head == PREFIX and name else 'other'
+
+
+class CacheStats:
+    """Per-namespace counters, safe to update from any thread."""
+
+    FIELDS = ('l1_hits', 'l2_hits', 'misses', 'waits', 'evictions', 'expirations')
+
+    def __init__(self):
+        self.counts = {}
+        self._lock  = threading.Lock()
+
+    def record(self, namespace, field):
+        with self._lock:
+            counts = self.counts.setdefault(namespace, dict.fromkeys(self.FIELDS, 0))
+            counts[field] += 1
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+
+    def snapshot(self):
+        with self._lock:
+            items = sorted((name, dict(counts)) for name, counts in self.counts.items())
+        report = {}
+        for name, counts in items:
+            hits = counts['l1_hits'] + counts['l2_hits']
+            total = hits + counts['misses']
+            counts['hit_rate'] = round(hits / total, 4) if total else 0.0
+            report[name] = counts
+        return report
+
+
+stats = CacheStats()
+
+
+class LocalTier:
+    """Bounded in-process store: entries expire after their TTL, least recently used go first."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()             # key → (expires, pickled value, namespace)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """(True, value) on a live entry, else (False, None)."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return False, None
+            expires, blob, namespace = entry
+            if expires <= time.monotonic():
+                del self._data[key]
+                stats.record(namespace, 'expirations')
+                return False, None
+            self._data.move_to_end(key)
+        return True, pickle.loads(blob)
+
+    def set(self, key, value, timeout, namespace):
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._data[key] = (time.monotonic() + timeout, blob, namespace)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                _, (_, _, evicted) = self._data.popitem(last=False)
+                stats.record(evicted, 'evictions')
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# Django builds one backend instance per thread; the L1 store and the
+# in-flight builds must be per process, so they live here, keyed by L2 alias.
+_tiers   = {}
+_flights = {}
+_lock    = threading.Lock()
+
+
+class TieredCache(BaseCache):
+    """
+    CACHES backend: LOCATION names the shared L2 alias. OPTIONS:
+        L1_MAX_ENTRIES  entries kept per process (default 1000)
+        L1_TIMEOUT      seconds an L1 entry may live (default 5)
+        LOCK_TIMEOUT    seconds a single-flight follower waits for the leader (default 10)
+    """
+
+    def __init__(self, location, params):
+        options = params.get('OPTIONS', {})
+        super().__init__(params)
+        self.l2_alias     = location or 'shared'
+        self.l1_timeout   = options.get('L1_TIMEOUT', 5)
+        self.lock_timeout = options.get('LOCK_TIMEOUT', 10)
+        with _lock:
+            self.l1 = _tiers.setdefault(self.l2_alias, LocalTier(options.get('L1_MAX_ENTRIES', 1000)))
+
+    @property
+    def l2(self):
+        return caches[self.l2_alias]
+
+    def _local_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        return self.l1_timeout if timeout is None else min(timeout, self.l1_timeout)
+
+    def _keep_local(self, key, value, timeout, version):
+        local_timeout = self._local_timeout(timeout)
+        local_key = self.make_and_validate_key(key, version)
+        if local_timeout > 0:
+            self.l1.set(local_key, value, local_timeout, namespace_of(key))
+        else:
+            self.l1.delete(local_key)
+
+    def get(self, key, default=None, version=None):
+        namespace = namespace_of(key)
+        hit, value = self.l1.get(self.make_and_validate_key(key, version))
+        if hit:
+            stats.record(namespace, 'l1_hits')
+            return value
+        value = self.l2.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            stats.record(namespace, 'misses')
+            return default
+        stats.record(namespace, 'l2_hits')
+        self._keep_local(key, value, None, version)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version=version)
+        self._keep_local(key, value, timeout, version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if not self.l2.add(key, value, timeout, version=version):
+            return False
+        self._keep_local(key, value, timeout, version)
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.l2.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self.l1.delete(self.make_and_validate_key(key, version))
+        return self.l2.delete(key, version=version)
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version=version) is not _MISSING
+
+    def incr(self, key, delta=1, version=None):
+        self.l1.delete(self.make_and_validate_key(key, version))
+        return self.l2.incr(key, delta, version=version)
+
+    def clear(self):
+        self.l1.clear()
+        self.l2.clear()
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        """
+        Cached value, or `default` (called if callable) stored under `key` —
+        built once however many callers miss at the same time.
+        """
+        value = self.get(key, _MISSING, version=version)
+        if value is not _MISSING:
+            return value
+
+        flight_key = (self.l2_alias, self.make_and_validate_key(key, version))
+        with _lock:
+            done = _flights.get(flight_key)
+            leader = done is None
+            if leader:
+                done = _flights[flight_key] = threading.Event()
+        if not leader:
+            stats.record(namespace_of(key), 'waits')
+            done.wait(self.lock_timeout)
+            value = self.get(key, _MISSING, version=version)
+            if value is not _MISSING:
+                return value
+            return self._build(key, default, timeout, version)   # the leader failed
+
+        try:
+            return self._build_shared(key, default, timeout, version)
+        finally:
+            with _lock:
+                _flights.pop(flight_key, None)
+            done.set()
+
+    def _build_shared(self, key, default, timeout, version):
+        """Build under an L2 lock so other processes wait rather than rebuild."""
+        lock_key = f"{key}:lock"
+        if self.l2.add(lock_key, 1, self.lock_timeout, version=version):
+            try:
+                return self._build(key, default, timeout, version)
+            finally:
+                self.l2.delete(lock_key, version=version)
+
+        stats.record(namespace_of(key), 'waits')
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            value = self.l2.get(key, _MISSING, version=version)
+            if value is not _MISSING:
+                self._keep_local(key, value, timeout, version)
+                return value
+            if not self.l2.has_key(lock_key, version=version):
+                break
+        return self._build(key, default, timeout, version)
+
+    def _build(self, key, default, timeout, version):
+        value = default() if callable(default) else default
+        if not self.l2.add(key, value, timeout, version=version):
+            value = self.l2.get(key, value, version=version)   # another process won the race
+        self._keep_local(key, value, timeout, version)
+        return value
+
+
+def _new_stamp():
+    return uuid.uuid4().hex
+
+
+# This thread's invalidations whose transaction is still open. The set holds
+# the on-commit callbacks weakly: running one removes it, and a rollback (of
+# the transaction or of the savepoint it was queued in) discards the callback,
+# which drops it from the set with it.
+_pending = threading.local()
+
+
+def _pending_bumps():
+    bumps = getattr(_pending, 'bumps', None)
+    if bumps is None:
+        bumps = _pending.bumps = weakref.WeakSet()
+    return bumps
+
+
+class _CommitBump:
+    """The on-commit half of `Namespace.invalidate`."""
+
+    __slots__ = ('namespace', '__weakref__')
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+
+    def __call__(self):
+        _pending_bumps().discard(self)
+        self.namespace.bump()
+
+
+class Namespace:
+    """`health:<name>:<version>:…` keys; `invalidate()` retires all of them at once."""
+
+    def __init__(self, name):
+        self.name = name
+        self.version_key = f"{PREFIX}:{name}:version"
+
+    def version(self):
+        """Shared stamp; minted on first use so cold caches never match old keys."""
+        return cache.get_or_set(self.version_key, _new_stamp, timeout=None)
+
+    def key(self, *parts):
+        tail = ':'.join(str(part) for part in parts)
+        if len(tail) > 160 or any(ch.isspace() for ch in tail):
+            tail = hashlib.sha1(tail.encode('utf-8')).hexdigest()
+        return f"{PREFIX}:{self.name}:{self.version()}:{tail}"
+
+    def get_or_set(self, parts, build, timeout=DEFAULT_TIMEOUT):
+        """Cached value for `parts`, or `build()` stored under the current version."""
+        if self.invalidated_in_transaction():
+            return build()                  # may see uncommitted rows: never stored
+        return cache.get_or_set(self.key(*parts), build, timeout)
+
+    def bump(self):
+        """Mint a new version at once."""
+        cache.set(self.version_key, _new_stamp(), timeout=None)
+
+    def invalidate(self, now=True):
+        """
+        Retire every key now — so this transaction reads its own writes — and
+        again on commit, so no worker keeps a value rebuilt from uncommitted rows.
+        With now=False only the commit moves the stamp, for callers that drop
+        their own copies at once and let other workers keep theirs until then.
+        """
+        if now:
+            self.bump()
+        bump = _CommitBump(self)
+        if connection.in_atomic_block:
+            _pending_bumps().add(bump)
+        transaction.on_commit(bump)
+
+    def invalidated_in_transaction(self):
+        """
+        Whether this thread's open transaction invalidated the namespace. Values
+        built meanwhile may come from uncommitted rows and must not be cached.
+        """
+        if not connection.in_atomic_block:
+            return False
+        return any(bump.namespace is self for bump in _pending_bumps())
+
+
+_namespaces = {name: Namespace(name) for name in NAMESPACES}
+
+
+def namespace(name):
+    return _namespaces[name]
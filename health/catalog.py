@@ -0,0 +1,153 @@
+"""
+In-process, read-only snapshot of the FoodItem catalog.
+
+The catalog (~350 rows) changes only through admin edits or fixture loads,
+yet plan generation used to query it once per meal slot. Instead every worker
+loads it once into immutable FoodRecord tuples, pre-bucketed by
+(category, diet_type), and reuses the snapshot until the shared version stamp
+moves. Any FoodItem save/delete bumps the stamp (see health.signals), which
+makes every worker rebuild on its next access.
+
+The stamp is the 'catalog' namespace version in the tiered cache
+(health.cache), shared across workers through its L2; the local snapshot is
+also dropped immediately by the signal handler.
+"""
+import threading
+from typing import NamedTuple
+
+import numpy as np
+
+from .cache import namespace
+from .engine.rules import NUTRIENT_FIELDS
+from .models import FoodItem
+
+
+CATALOG     = namespace('catalog')
+VERSION_KEY = CATALOG.version_key
+
+
+class FoodRecord(NamedTuple):
+    """Immutable copy of one FoodItem row (tuple-backed, `__slots__ = ()`)."""
+    id:           int
+    name:         str
+    category:     str
+    diet_type:    str
+    calories:     float
+    protein:      float
+    carbs:        float
+    fat:          float
+    fiber:        float
+    sugar:        float
+    sodium:       float
+    potassium:    float
+    calcium:      float
+    phosphorus:   float
+    unit_name:    str
+    serving_desc: str
+
+
+class NutrientMatrix:
+    """
+    Column-oriented view of a catalog for vectorised filtering.
+    Row i of every array describes catalog.records[i].
+    """
+
+    __slots__ = ('values', 'column', 'category', 'diet_type')
+
+    def __init__(self, records):
+        self.values    = np.array(
+            [[getattr(r, f) for f in NUTRIENT_FIELDS] for r in records], dtype=np.float64
+        ).reshape(len(records), len(NUTRIENT_FIELDS))
+        self.column    = {name: i for i, name in enumerate(NUTRIENT_FIELDS)}
+        self.category  = np.array([r.category for r in records], dtype=str)
+        self.diet_type = np.array([r.diet_type for r in records], dtype=str)
+
+    def __getitem__(self, nutrient):
+        return self.values[:, self.column[nutrient]]
+
+
+class FoodCatalog:
+    """A versioned snapshot: records in id order plus lookup indexes."""
+
+    __slots__ = ('version', 'records', 'by_id', 'buckets', '_matrix')
+
+    def __init__(self, version, records):
+        self.version = version
+        self.records = tuple(records)
+        self.by_id   = {r.id: r for r in self.records}
+        buckets = {}
+        for r in self.records:
+            buckets.setdefault((r.category, r.diet_type), []).append(r)
+        self.buckets = {key: tuple(rows) for key, rows in buckets.items()}
+        self._matrix = None
+
+    @property
+    def matrix(self):
+        """NutrientMatrix for this snapshot, built on first use."""
+        if self._matrix is None:
+            self._matrix = NutrientMatrix(self.records)
+        return self._matrix
+
+    def pool(self, category, diet_types=None):
+        """
+        Records for one DB category, restricted to `diet_types` when given.
+        Always returned in id order (the same order the ORM path yields).
+        """
+        if diet_types is None:
+            rows = [r for (cat, _), bucket in self.buckets.items() if cat == category for r in bucket]
+        else:
+            rows = [r for dt in diet_types for r in self.buckets.get((category, dt), ())]
+        rows.sort(key=lambda r: r.id)
+        return rows
+
+    def get(self, food_id):
+        return self.by_id.get(food_id)
+
+    def __len__(self):
+        return len(self.records)
+
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def current_version():
+    """Shared version stamp; minted on first use so cold caches force a reload."""
+    return CATALOG.version()
+
+
+def bump_version():
+    """
+    Invalidate every worker's snapshot (called on FoodItem save/delete).
+    The local snapshot is dropped at once; the shared stamp moves on commit so
+    other workers never reload uncommitted (or rolled-back) rows.
+    """
+    global _snapshot
+    _snapshot = None
+    CATALOG.invalidate(now=False)
+
+
+def load_catalog(version):
+    """Read the whole FoodItem table once into a FoodCatalog."""
+    fields = FoodRecord._fields
+    rows = FoodItem.objects.order_by('id').values_list(*fields)
+    return FoodCatalog(version, (FoodRecord(*row) for row in rows))
+
+
+def get_catalog():
+    """
+    Return the current snapshot, rebuilding it only if the stamp moved. A
+    transaction that edited FoodItems gets a private snapshot: it may hold
+    rows a rollback discards, so it is never kept.
+    """
+    global _snapshot
+    version = current_version()
+    if CATALOG.invalidated_in_transaction():
+        return load_catalog(version)
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    with _lock:
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = load_catalog(version)
+        return _snapshot
@@ -0,0 +1,136 @@
+"""
+Dashboard statistics service.
+
+Computes everything the `home` (and `profile`) dashboards display in a
+constant number of queries, independent of how many patients or checkups
+exist:
+
+    1. total patient count
+    2. BMI histogram + average BMI over the PatientLatestCheckup projection
+    3. grouped date histogram for the 30-day visit series
+    4. plan-type distribution
+    5. recent activity (last 6 checkups, patient joined)
+
+`cached_dashboard_stats` serves the result from the 'dashboard' namespace of
+the tiered cache (health.cache); health.signals invalidates it on every
+Patient/Checkup change, HEALTH_DASHBOARD_CACHE_TIMEOUT bounds it otherwise.
+"""
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Avg, Count, Q
+from django.utils import timezone
+
+from .cache import namespace
+from .engine import diet_goal_for
+from .models import Patient, Checkup, PatientLatestCheckup
+
+
+BMI_CATEGORIES = ('Underweight', 'Normal', 'Overweight', 'Obese')
+TREND_DAYS     = 30
+DASHBOARD      = namespace('dashboard')
+
+
+def latest_checkups():
+    """
+    Queryset of the most recent Checkup for every patient (by date, then id),
+    read from the PatientLatestCheckup projection.
+    """
+    return Checkup.objects.filter(
+        id__in=PatientLatestCheckup.objects.values('checkup_id')
+    )
+
+
+def bmi_histogram():
+    """
+    One aggregate query over the latest-checkup projection.
+    Returns ({'Underweight': n, 'Normal': n, 'Overweight': n, 'Obese': n}, avg_bmi).
+    """
+    aggregates = {
+        key: Count('pk', filter=Q(category=key)) for key in BMI_CATEGORIES
+    }
+    row = PatientLatestCheckup.objects.aggregate(avg_bmi=Avg('bmi'), **aggregates)
+    avg_bmi = round(row['avg_bmi'], 1) if row['avg_bmi'] else 0
+    return {key: row[key] for key in BMI_CATEGORIES}, avg_bmi
+
+
+def daily_visit_series(today=None, days=TREND_DAYS):
+    """
+    One grouped query over the trailing `days` window.
+    Returns (labels, counts) ordered oldest → today, zero-filled.
+    """
+    today = today or timezone.localdate()
+    start = today - timedelta(days=days - 1)
+    per_day = dict(
+        Checkup.objects
+        .filter(date__gte=start, date__lte=today)
+        .values_list('date')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    labels, counts = [], []
+    for i in range(days):
+        d = start + timedelta(days=i)
+        labels.append(d.strftime('%b %d'))
+        counts.append(per_day.get(d, 0))
+    return labels, counts
+
+
+def dashboard_stats(today=None):
+    """
+    Build the full `home.html` context (minus request-specific keys)
+    in a fixed number of queries.
+    """
+    today = today or timezone.localdate()
+    total_patients = Patient.objects.count()
+
+    # ------- BMI category counts (latest checkup per patient) -------
+    histogram, avg_bmi = bmi_histogram()
+    obese = histogram['Obese']
+    high_risk_pct = round((obese / total_patients) * 100) if total_patients else 0
+
+    # ------- 30-day daily trends (last bucket is today) -------
+    days_labels, daily_visits = daily_visit_series(today)
+    today_visits = daily_visits[-1]
+
+    # ------- Plan-type distribution -------
+    plan_counts = {}
+    for c in Checkup.objects.values('plan_type').annotate(cnt=Count('id')).order_by():
+        plan_counts[c['plan_type'] or 'Other'] = c['cnt']
+
+    # ------- Recent activity (last 6 real checkups) -------
+    recent_activity = []
+    for c in Checkup.objects.select_related('patient').order_by('-date', '-id')[:6]:
+        _bmi = float(c.bmi)
+        recent_activity.append({
+            'patient_name': c.patient.name,
+            'patient_id':   c.patient.id,
+            'date':         c.date.strftime('%b %d, %Y'),
+            'bmi':          _bmi,
+            'category':     c.category,
+            'goal':         diet_goal_for(_bmi),
+            'plan':         c.plan_type,
+            'id':           c.id,
+        })
+
+    return {
+        'total_patients':  total_patients,
+        'today_visits':    today_visits,
+        'avg_bmi':         avg_bmi,
+        'high_risk_pct':   high_risk_pct,
+        'underweight': histogram['Underweight'], 'normal': histogram['Normal'],
+        'overweight':  histogram['Overweight'],  'obese':  obese,
+        'days_labels':  json.dumps(days_labels),
+        'daily_visits': json.dumps(daily_visits),
+        'plan_labels':  json.dumps(list(plan_counts.keys())),
+        'plan_values':  json.dumps(list(plan_counts.values())),
+        'recent_activity': recent_activity,
+    }
+
+
+def cached_dashboard_stats(today=None):
+    """`dashboard_stats`, reused until a Patient/Checkup change or the timeout."""
+    today = today or timezone.localdate()
+    return DASHBOARD.get_or_set(('stats', today.isoformat()), lambda: dashboard_stats(today),
+                                timeout=getattr(settings, 'HEALTH_DASHBOARD_CACHE_TIMEOUT', 60))
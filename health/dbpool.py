@@ -0,0 +1,273 @@
+"""
+Bounded per-process database connection pool for the Django backends in
+health.backends (MySQL via PyMySQL, and SQLite as a local stand-in).
+
+Django opens a fresh connection per request (CONN_MAX_AGE = 0) or keeps one
+per thread (CONN_MAX_AGE > 0); either way each new connection pays the TCP +
+auth handshake, and a burst of threads opens as many server connections as
+there are threads. With `OPTIONS['pool']` set, the backend's connect/close
+go through a ConnectionPool instead:
+
+    connect()  ──► wait for a free slot (≤ max_size in use, ≤ timeout seconds)
+                   ──► newest idle connection: recycle it if older than
+                       max_lifetime, validate it (ping) if idle longer than
+                       check_after, else hand it out
+                   ──► no idle connection: open a new one
+    close()    ──► back to the idle stack, unless it broke or was closed
+                   mid-transaction — then it is discarded
+
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'max_size': 8, 'timeout': 10, 'max_lifetime': 1800, 'check_after': 0,
+    }
+
+Per pool it counts checkouts, new connections, recycled and discarded ones,
+errors by kind (connect / validate / timeout) and checkout wait times;
+health.instrumentation exports them with the request metrics.
+"""
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core import checks
+
+
+DEFAULTS = {'max_size': 8, 'timeout': 10.0, 'max_lifetime': 1800.0, 'check_after': 0.0}
+
+
+class PoolTimeout(Exception):
+    """No connection became free within the pool's timeout."""
+
+
+class ConnectionPool:
+    """
+    At most `max_size` connections checked out at once. `connect()` opens a
+    raw DB-API connection, `validate(conn)` raises if it is unusable.
+    """
+
+    def __init__(self, connect, validate, max_size=8, timeout=10.0, max_lifetime=1800.0,
+                 check_after=0.0, window=1000):
+        self.connect      = connect
+        self.validate     = validate
+        self.max_size     = max_size
+        self.timeout      = timeout
+        self.max_lifetime = max_lifetime
+        self.check_after  = check_after
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._idle  = deque()          # (conn, opened, returned), newest on the right
+        self._born  = {}               # id(conn) → opened, for checked-out connections
+        self._lock  = threading.Lock()
+        self.counts = dict.fromkeys(('checkouts', 'connects', 'recycled', 'discarded'), 0)
+        self.errors = dict.fromkeys(('connect', 'validate', 'timeout'), 0)
+        self.waits  = deque(maxlen=window)      # seconds spent waiting for a slot
+
+    def _count(self, table, key):
+        with self._lock:
+            table[key] += 1
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def checkout(self):
+        """A validated connection; raises PoolTimeout when every slot stays busy."""
+        started = time.monotonic()
+        acquired = self._slots.acquire(timeout=self.timeout)
+        waited = time.monotonic() - started
+        with self._lock:
+            self.waits.append(waited)
+        if not acquired:
+            self._count(self.errors, 'timeout')
+            raise PoolTimeout(f"no database connection free after {waited:.1f}s "
+                              f"({self.max_size} in use)")
+        try:
+            conn, opened = self._reuse()
+            if conn is None:
+                try:
+                    conn = self.connect()
+                except Exception:
+                    self._count(self.errors, 'connect')
+                    raise
+                opened = time.monotonic()
+                self._count(self.counts, 'connects')
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._born[id(conn)] = opened
+            self.counts['checkouts'] += 1
+        return conn
+
+    def _reuse(self):
+        """(conn, opened) of a usable idle connection, or (None, None)."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None, None
+                conn, opened, returned = self._idle.pop()
+            now = time.monotonic()
+            if now - opened > self.max_lifetime:
+                self._count(self.counts, 'recycled')
+                self._discard(conn)
+                continue
+            if now - returned >= self.check_after:
+                try:
+                    self.validate(conn)
+                except Exception:
+                    self._count(self.errors, 'validate')
+                    self._discard(conn)
+                    continue
+            return conn, opened
+
+    def checkin(self, conn, reusable=True):
+        """Return a checked-out connection; unusable or over-age ones are closed."""
+        with self._lock:
+            opened = self._born.pop(id(conn), None)
+        if opened is None:              # not ours (or returned twice)
+            self._discard(conn)
+            return
+        now = time.monotonic()
+        if reusable and now - opened <= self.max_lifetime:
+            with self._lock:
+                self._idle.append((conn, opened, now))
+        else:
+            self._count(self.counts, 'recycled' if reusable else 'discarded')
+            self._discard(conn)
+        self._slots.release()
+
+    def close_idle(self):
+        """Close every idle connection (e.g. before forking workers)."""
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn, _, _ in idle:
+            self._discard(conn)
+
+    def reset_stats(self):
+        with self._lock:
+            self.counts = dict.fromkeys(self.counts, 0)
+            self.errors = dict.fromkeys(self.errors, 0)
+            self.waits.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_size': self.max_size,
+                'in_use':   len(self._born),
+                'idle':     len(self._idle),
+                **self.counts,
+                'errors':   dict(self.errors),
+                'waits':    list(self.waits),
+            }
+
+
+_pools = {}
+_lock  = threading.Lock()
+
+
+def pool_for(label, connect, validate, options):
+    """The process-wide pool for `label`, created with `options` on first use."""
+    with _lock:
+        pool = _pools.get(label)
+        if pool is None:
+            pool = _pools[label] = ConnectionPool(connect, validate, **{**DEFAULTS, **options})
+        return pool
+
+
+def stats():
+    """{label: pool stats} for every pool in this process."""
+    with _lock:
+        pools = list(_pools.items())
+    return {label: pool.stats() for label, pool in sorted(pools)}
+
+
+def reset_stats():
+    with _lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.reset_stats()
+
+
+def close_idle():
+    """
+    Close the idle connections of every pool in this process. Call it (after
+    connections.close_all()) before forking workers: a forked child would
+    otherwise check out a socket its parent is still using.
+    """
+    with _lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_idle()
+
+
+class PooledDatabaseWrapper:
+    """
+    DatabaseWrapper mixin: new connections come from, and closed ones go back
+    to, the pool configured in OPTIONS['pool']. Without that option the
+    backend behaves exactly like Django's.
+    """
+
+    def pool_options(self):
+        return self.settings_dict['OPTIONS'].get('pool')
+
+    def pool_label(self):
+        return f"{self.alias}/{self.settings_dict['NAME']}"
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        return params
+
+    def validate_pooled(self, conn):
+        """Raise if `conn` cannot run a query; backends may use a cheaper ping."""
+        cursor = conn.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+
+    def _pool(self, conn_params=None):
+        options = self.pool_options()
+        if not options:
+            return None
+        connect = lambda: super(PooledDatabaseWrapper, self).get_new_connection(conn_params)
+        return pool_for(self.pool_label(), connect, self.validate_pooled,
+                        {} if options is True else options)
+
+    def get_new_connection(self, conn_params):
+        pool = self._pool(conn_params)
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        try:
+            return pool.checkout()
+        except PoolTimeout as exc:
+            raise self.Database.OperationalError(str(exc)) from exc
+
+    def _close(self):
+        pool = self._pool()
+        if pool is None or self.connection is None:
+            return super()._close()
+        # A connection closed mid-transaction or after an error is not handed out again
+        reusable = (not self.in_atomic_block and not self.errors_occurred
+                    and self.autocommit == self.settings_dict['AUTOCOMMIT'])
+        pool.checkin(self.connection, reusable=reusable)
+
+
+def check_pool_settings(app_configs, **kwargs):
+    """
+    health.W001: a pooled database with CONN_MAX_AGE != 0. Each thread then
+    keeps its connection, and its pool slot, between requests; once there are
+    more threads than `max_size`, the next checkout times out.
+    """
+    return [
+        checks.Warning(
+            f"Database '{alias}' uses a connection pool with CONN_MAX_AGE="
+            f"{config.get('CONN_MAX_AGE')}.",
+            hint="Set CONN_MAX_AGE to 0 (DB_CONN_MAX_AGE=0), or make the pool at least "
+                 "as large as the number of server threads.",
+            id='health.W001',
+        )
+        for alias, config in settings.DATABASES.items()
+        if config.get('OPTIONS', {}).get('pool') and config.get('CONN_MAX_AGE', 0) != 0
+    ]
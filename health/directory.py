@@ -0,0 +1,135 @@
+"""
+Patient directory — the query layer behind the `patients` and
+`existing_patient` listings.
+
+Every filter (search text via the trigram index in health.search, BMI
+category, visit date range) is pushed into SQL and pages are cut with keyset
+(cursor) pagination on `-id`, so a page costs the same number of queries at
+100 patients or 100k (plus one to verify trigram candidates for search text
+longer than three characters):
+
+    • no date range → the PatientLatestCheckup projection is joined in
+      (select_related) and BMI filtering hits its indexed `category` column
+    • date range    → the newest in-range checkup is annotated with a
+      correlated Subquery and fetched with one in_bulk() lookup
+"""
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .models import Patient, Checkup
+from .search import verified_patient_ids
+
+
+PAGE_SIZE = 24
+
+
+@dataclass
+class DirectoryPage:
+    rows:        list = field(default_factory=list)   # [{'patient', 'latest', 'total_visits'}]
+    next_cursor: int = None                           # pass as ?after=
+    prev_cursor: int = None                           # pass as ?before=
+
+
+def since_for_range(date_range, today=None):
+    """Map the UI date-range choice to the earliest checkup date to include."""
+    today = today or timezone.localdate()
+    if date_range == 'today':
+        return today
+    if date_range == 'week':
+        return today - timedelta(days=7)
+    if date_range == 'month':
+        return today - timedelta(days=30)
+    return None
+
+
+def _parse_cursor(value):
+    try:
+        return int(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def filtered_patients(query='', bmi_filter='', date_range=''):
+    """
+    Patient queryset with all filters applied in SQL.
+    Adds `range_checkup_id` when a date range is active.
+    """
+    qs = Patient.objects.select_related('latest__checkup')
+    if query:
+        # Same matching as the typeahead: accent- and case-folded names, phone digits
+        matches = verified_patient_ids(query)
+        qs = qs.none() if matches is None else qs.filter(id__in=matches)
+
+    since = since_for_range(date_range)
+    if since:
+        in_range = (
+            Checkup.objects
+            .filter(patient=OuterRef('pk'), date__gte=since)
+            .order_by('-date', '-id')
+        )
+        qs = qs.annotate(
+            range_checkup_id=Subquery(in_range.values('id')[:1]),
+            range_category=Subquery(in_range.values('category')[:1]),
+        ).filter(range_checkup_id__isnull=False)
+        if bmi_filter:
+            qs = qs.filter(range_category=bmi_filter)
+    elif bmi_filter:
+        qs = qs.filter(latest__category=bmi_filter)
+    return qs
+
+
+def patient_page(query='', bmi_filter='', date_range='', after=None, before=None,
+                 page_size=PAGE_SIZE):
+    """
+    One keyset page of the directory, newest patients first.
+    `after` / `before` are patient ids taken from a previous page's cursors.
+    """
+    qs = filtered_patients(query, bmi_filter, date_range)
+    after, before = _parse_cursor(after), _parse_cursor(before)
+
+    if before is not None:
+        # Walk backwards (ascending id) then flip to keep -id display order
+        window = list(qs.filter(id__gt=before).order_by('id')[:page_size + 1])
+        has_more_before = len(window) > page_size
+        patients = list(reversed(window[:page_size]))
+        has_more_after = True
+    else:
+        if after is not None:
+            qs = qs.filter(id__lt=after)
+        window = list(qs.order_by('-id')[:page_size + 1])
+        has_more_after = len(window) > page_size
+        patients = window[:page_size]
+        has_more_before = after is not None
+
+    range_ids = [p.range_checkup_id for p in patients if hasattr(p, 'range_checkup_id')]
+    range_checkups = Checkup.objects.in_bulk(range_ids) if range_ids else {}
+
+    page = DirectoryPage()
+    for p in patients:
+        projection = p.latest if _has_projection(p) else None
+        if hasattr(p, 'range_checkup_id'):
+            latest = range_checkups.get(p.range_checkup_id)
+        else:
+            latest = projection.checkup if projection else None
+        page.rows.append({
+            'patient':      p,
+            'latest':       latest,
+            'total_visits': projection.visit_count if projection else 0,
+        })
+
+    if patients:
+        page.next_cursor = patients[-1].id if has_more_after else None
+        page.prev_cursor = patients[0].id if has_more_before else None
+    return page
+
+
+def _has_projection(patient):
+    """True when the reverse one-to-one `latest` row was joined and exists."""
+    try:
+        patient.latest
+    except Patient.latest.RelatedObjectDoesNotExist:
+        return False
+    return True
@@ -0,0 +1,90 @@
+"""
+In-memory disease-name index used when linking form input to Disease rows.
+
+Resolution rules match the original per-name ORM lookups:
+    1. case-insensitive exact match            (name__iexact)
+    2. otherwise the lowest-id name containing  (name__icontains … .first())
+       the input, case-insensitively
+
+but every comma-separated name is resolved in one pass against a snapshot
+holding an exact-name map plus a trigram → ids index for substring lookups.
+The snapshot shares the disease version stamp with health.restrictions, so
+any Disease save/delete rebuilds it on next use.
+"""
+import threading
+
+from .models import Disease
+from .restrictions import RESTRICTIONS, current_version
+
+
+class DiseaseNameIndex:
+
+    __slots__ = ('version', 'names', 'exact', 'lowered', 'grams')
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.names   = {}      # id → display name
+        self.exact   = {}      # lower(name) → lowest id with that name
+        self.lowered = {}      # id → lower(name)
+        self.grams   = {}      # trigram → sorted tuple of ids
+        grams = {}
+        for disease_id, name in sorted(rows):
+            low = name.lower()
+            self.names[disease_id] = name
+            self.lowered[disease_id] = low
+            self.exact.setdefault(low, disease_id)
+            for i in range(len(low) - 2):
+                grams.setdefault(low[i:i + 3], set()).add(disease_id)
+        self.grams = {g: tuple(sorted(ids)) for g, ids in grams.items()}
+
+    def lookup(self, name):
+        """Disease id for one form entry, or None."""
+        needle = name.strip().lower()
+        if not needle:
+            return None
+        hit = self.exact.get(needle)
+        if hit is not None:
+            return hit
+        if len(needle) < 3:
+            candidates = self.lowered.keys()
+        else:
+            postings = [self.grams.get(needle[i:i + 3], ()) for i in range(len(needle) - 2)]
+            postings.sort(key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+        matches = [i for i in candidates if needle in self.lowered[i]]
+        return min(matches) if matches else None
+
+    def resolve(self, diseases_str):
+        """Distinct Disease ids for a comma-separated string, in input order."""
+        ids = []
+        for name in (diseases_str or '').split(','):
+            disease_id = self.lookup(name)
+            if disease_id is not None and disease_id not in ids:
+                ids.append(disease_id)
+        return ids
+
+    def sorted_names(self, ids=None):
+        """Display names (case-insensitively sorted) for `ids`, or all diseases."""
+        ids = self.names.keys() if ids is None else ids
+        return sorted((self.names[i] for i in ids), key=str.lower)
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_disease_index():
+    """Current index, rebuilt with one query only when the disease version moved."""
+    global _index
+    version = current_version()
+    if RESTRICTIONS.invalidated_in_transaction():
+        # Diseases edited in this transaction: a rollback would leave a kept
+        # index naming rows that never existed, so build one for this caller
+        return DiseaseNameIndex(version, Disease.objects.values_list('id', 'name'))
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    with _lock:
+        if _index is None or _index.version != version:
+            _index = DiseaseNameIndex(version, Disease.objects.values_list('id', 'name'))
+        return _index
@@ -0,0 +1,30 @@
+"""
+Pure diet-planning engine — no ORM, no settings, no request.
+
+    generate_week(profile, catalog, restrictions, splits, seed) -> Plan
+
+`catalog` is anything with `pool(category, diet_types)` returning food records
+in id order (health.catalog.FoodCatalog in the app), `restrictions` the merged
+{nutrient: {'max', 'banned'}} dict, and `seed` makes the rotation repeatable
+(health.engine.variety).
+Views, the PDF path and management commands adapt model rows to these
+dataclasses and persist the result (see health.generation).
+"""
+from .budget import DailyBudget
+from .composer import compose_meal, macro_targets
+from .metrics import FORMULA_VERSION, Metrics, calculate_metrics, diet_goal_for, macro_targets_g
+from .planner import DAYS, generate_week, meal_splits, portion_for, required_grams
+from .rules import (
+    NUTRIENT_FIELDS, SMART_DEFAULTS, allowed_diet_types, db_category,
+    restriction_thresholds, select_pool,
+)
+from .types import Plan, PlannedMeal, Profile
+from .variety import Rotation, slot_seed
+
+__all__ = [
+    'DAYS', 'FORMULA_VERSION', 'NUTRIENT_FIELDS', 'SMART_DEFAULTS',
+    'DailyBudget', 'Metrics', 'Plan', 'PlannedMeal', 'Profile', 'Rotation',
+    'allowed_diet_types', 'calculate_metrics', 'compose_meal', 'db_category', 'diet_goal_for',
+    'generate_week', 'macro_targets', 'macro_targets_g', 'meal_splits', 'portion_for', 'required_grams',
+    'restriction_thresholds', 'select_pool', 'slot_seed',
+]
@@ -0,0 +1,84 @@
+"""
+ENGINE E: DAILY NUTRIENT BUDGET
+
+The pool filters (ENGINE B) only cap nutrients per 100 g (`max / 4`), but a
+portion can reach 500 g, so a day could still blow through a disease's daily
+`max`. `DailyBudget` keeps a running total per capped nutrient for the day
+being planned:
+
+    allowance(meal) = remaining · meal share / shares of the meals still to come
+
+so grams a meal does not use carry over to the later ones and the last meal
+may use everything that is left. A candidate food is rejected when even
+MIN_GRAMS of it would exceed the allowance; otherwise its portion is cut down
+to fit. A daily max is a hard cap: a food of which not even 10 g fits is left
+out of the meal, and a slot left with no food at all is reported in
+`plan.unfilled` rather than served over the cap.
+
+Serving a food adds grams × per-gram amount to the totals — one multiply-add
+per capped nutrient, never a recount of the day.
+"""
+from math import floor
+
+from .composer import MIN_GRAMS
+from .rules import rules_for
+
+
+class DailyBudget:
+    """Running per-day totals for the nutrients with a daily `max`."""
+
+    __slots__ = ('caps', 'shares', 'totals', 'left')
+
+    def __init__(self, restrictions, splits):
+        self.caps = [(rule.nutrient, rule.max) for rule in rules_for(restrictions)
+                     if rule.max is not None]
+        self.shares = dict(splits)
+        self.start_day()
+
+    def __bool__(self):
+        return bool(self.caps)
+
+    def start_day(self):
+        self.totals = {nutrient: 0.0 for nutrient, _ in self.caps}
+        self.left   = sum(self.shares.values())   # calorie share of the meals not yet served
+
+    def allowance(self, meal):
+        """{nutrient: amount} this meal may still add without breaking a daily cap."""
+        share = self.shares[meal]
+        fraction = share / self.left if self.left > 0 else 1.0
+        return {nutrient: max(cap - self.totals[nutrient], 0.0) * fraction
+                for nutrient, cap in self.caps}
+
+    def max_grams(self, food, allowance):
+        """Largest portion of `food` (grams) that fits `allowance`; None = unbounded."""
+        limit = None
+        for nutrient, room in allowance.items():
+            per_gram = getattr(food, nutrient) / 100.0
+            if per_gram > 0:
+                grams = room / per_gram
+                limit = grams if limit is None else min(limit, grams)
+        return limit
+
+    def admits(self, food, allowance):
+        """Whether at least MIN_GRAMS of `food` fits `allowance`."""
+        limit = self.max_grams(food, allowance)
+        return limit is None or limit >= MIN_GRAMS
+
+    def fit(self, food, grams, allowance):
+        """`grams` cut down to a 10 g step so the portion fits `allowance`; 0 = not even 10 g fits."""
+        limit = self.max_grams(food, allowance)
+        if limit is None or grams <= limit:
+            return grams
+        return max(floor(limit / 10) * 10, 0)
+
+    def spend(self, food, grams, allowance=None):
+        """Add a served portion to the day's totals (and to `allowance`, if given)."""
+        for nutrient in self.totals:
+            amount = getattr(food, nutrient) * grams / 100.0
+            self.totals[nutrient] += amount
+            if allowance is not None:
+                allowance[nutrient] -= amount
+
+    def close_meal(self, meal):
+        """Mark `meal` served so later allowances split what is left."""
+        self.left -= self.shares[meal]
@@ -0,0 +1,117 @@
+"""
+ENGINE C2: MEAL COMPOSITION
+
+Picks 1–3 foods for a meal slot and solves their gram amounts so that the
+meal's calories, protein, carbs and fat land on target together, instead of
+scaling one food to calories alone (ENGINE C, `portion_for`).
+
+For a primary food (the slot's rotation pick) plus a short list of
+companions, every candidate set — the primary alone, with one companion, with
+two — is solved at once as a batch of tiny least-squares problems:
+
+    minimise ‖ (A·g − t) / t ‖²      A: per-gram calories/macros of the set
+                                      t: the meal's calorie/macro targets
+
+The normal equations are solved with one batched `np.linalg.solve`. A set
+with more than one food is dropped when any of its solved amounts falls
+outside the portion bounds (clipping it would serve 20 g of a main dish or
+500 g of a side); the primary alone is clipped like ENGINE C. Sets that
+break a nutrient cap are masked out too. Each extra item must buy back
+EXTRA_ITEM_PENALTY of relative error, so simple meals win ties. Grams are
+rounded to 10 g like ENGINE C.
+"""
+from itertools import combinations
+
+import numpy as np
+
+from .metrics import macro_targets_g
+from .rules import NUTRIENT_FIELDS
+
+
+MIN_GRAMS          = 20
+MAX_GRAMS          = 500
+EXTRA_ITEM_PENALTY = 0.03
+COMPANIONS         = 12      # upcoming rotation foods considered alongside the primary
+
+MACRO_COLUMNS = [NUTRIENT_FIELDS.index(n) for n in ('calories', 'protein', 'carbs', 'fat')]
+
+
+def macro_targets(calories):
+    """[kcal, protein g, carbs g, fat g] for a calorie target (split of metrics.macro_targets_g)."""
+    return np.array([calories, *macro_targets_g(calories)])
+
+
+class PoolMatrix:
+    """Per-gram nutrient rows for one slot's pool, addressable by food id."""
+
+    __slots__ = ('foods', 'row', 'values')
+
+    def __init__(self, foods):
+        self.foods  = list(foods)
+        self.row    = {f.id: i for i, f in enumerate(self.foods)}
+        self.values = np.array(
+            [[getattr(f, n) for n in NUTRIENT_FIELDS] for f in self.foods], dtype=np.float64
+        ).reshape(len(self.foods), len(NUTRIENT_FIELDS)) / 100.0
+
+
+def _solve(per_gram, combos, target, caps):
+    """Least-squares grams and scores for an (m, k) array of row combos."""
+    A = per_gram[combos][:, :, MACRO_COLUMNS].transpose(0, 2, 1) / target[:, None]   # (m, 4, k)
+    At = A.transpose(0, 2, 1)
+    k = combos.shape[1]
+    normal = At @ A + np.eye(k) * 1e-9
+    rhs = At @ np.ones((len(combos), 4, 1))
+    solved = np.linalg.solve(normal, rhs)[:, :, 0]
+    grams = np.clip(solved, MIN_GRAMS, MAX_GRAMS)
+
+    residual = (A @ grams[:, :, None])[:, :, 0] - 1.0
+    score = np.sqrt((residual ** 2).mean(axis=1)) + EXTRA_ITEM_PENALTY * (k - 1)
+    if k > 1:
+        score[((solved < MIN_GRAMS) | (solved > MAX_GRAMS)).any(axis=1)] = np.inf
+
+    for column, cap in caps:
+        totals = (per_gram[combos][:, :, column] * grams).sum(axis=1)
+        score[totals > cap] = np.inf
+    return grams, score
+
+
+def compose_meal(matrix, primary, companions, calories, caps=(), max_items=3):
+    """
+    [(food, grams)] for one meal. `caps` is [(nutrient column, max amount for
+    this meal)]. Falls back to the primary alone (bounded to fit the caps)
+    when no candidate set is feasible.
+    """
+    target = macro_targets(calories)
+    first = matrix.row[primary.id]
+    others = [matrix.row[f.id] for f in companions if f.id != primary.id][:COMPANIONS]
+
+    best = (np.inf, None, None)
+    for size in range(1, min(max_items, len(others) + 1) + 1):
+        combos = np.array([(first,) + rest for rest in combinations(others, size - 1)], dtype=np.intp)
+        grams, score = _solve(matrix.values, combos, target, caps)
+        i = int(np.argmin(score))
+        if score[i] < best[0]:
+            best = (score[i], combos[i], grams[i])
+
+    if best[1] is None:
+        grams = np.clip(calories / max(matrix.values[first, MACRO_COLUMNS[0]], 1e-9),
+                        MIN_GRAMS, MAX_GRAMS)
+        for column, cap in caps:
+            per_gram = matrix.values[first, column]
+            if per_gram > 0:
+                grams = min(grams, cap / per_gram)
+        best = (None, [first], [max(grams, 0)])
+
+    _, rows, grams = best
+    return [(matrix.foods[r], g) for r, g in zip(rows, grams)]
+
+
+def round_grams(grams):
+    """Nearest 10 g step (never 0), like ENGINE C."""
+    return int(round(grams / 10) * 10) or 10
+
+
+def rounded_portion(food, grams):
+    """("250 g", kcal) for a solved amount, rounded to 10 g like ENGINE C."""
+    final_grams = round_grams(grams)
+    return f"{final_grams} g", int(final_grams / 100.0 * food.calories)
@@ -0,0 +1,74 @@
+from typing import NamedTuple
+
+
+# Bump when calculate_metrics or the macro split changes: stored checkup
+# metrics stamped with an older version are recomputed on next read.
+FORMULA_VERSION = 1
+
+
+class Metrics(NamedTuple):
+    bmi:             float
+    bmr:             float
+    tdee:            float
+    category:        str
+    target_calories: int
+
+
+def calculate_metrics(weight, height, age, gender, activity):
+    """
+    ENGINE A: METRIC CALCULATION
+    Returns: BMI, BMR, TDEE, Category, TARGET_CALORIES  (as a Metrics tuple)
+    """
+    # 1. BMI
+    height_m = height / 100
+    bmi = round(weight / (height_m ** 2), 2)
+
+    # 2. BMR (Mifflin-St Jeor) — fixed gender check
+    if gender.lower() == 'female':
+        s = -161
+    else:
+        s = 5  # male or other
+
+    bmr = (10 * weight) + (6.25 * height) - (5 * age) + s
+    bmr = round(bmr, 2)
+
+    # 3. TDEE
+    tdee = round(bmr * activity, 2)
+
+    # 4. Clinical Caloric Targeting (TDEE-relative)
+    if bmi < 18.5:
+        category = "Underweight"
+        # Weight Gain (Surplus of 500 kcal is a safe clinical standard)
+        target = tdee + 500
+    elif bmi < 25:
+        category = "Normal"
+        # Maintenance (Matches TDEE exactly)
+        target = tdee
+    elif bmi < 30:
+        category = "Overweight"
+        # Weight Loss (Deficit of 500 kcal)
+        target = tdee - 500
+    else:
+        category = "Obese"
+        # Aggressive Weight Loss (Deficit of 750-1000 kcal, floor at 1200)
+        target = tdee - 750
+
+    # Safety Constraint: Never go below 1200 kcal for general health
+    if target < 1200:
+        target = 1200
+
+    return Metrics(bmi, bmr, tdee, category, int(target))
+
+
+def diet_goal_for(bmi):
+    """Weight Loss / Weight Gain / Maintenance for a BMI (report, PDF and dashboard)."""
+    if bmi >= 25:
+        return "Weight Loss"
+    if bmi < 18.5:
+        return "Weight Gain"
+    return "Maintenance"
+
+
+def macro_targets_g(target_calories):
+    """(protein, carbs, fat) grams for the 30/40/30 calorie split."""
+    return target_calories * 0.3 / 4, target_calories * 0.4 / 4, target_calories * 0.3 / 9
@@ -0,0 +1,147 @@
+import random
+
+from .budget import DailyBudget
+from .composer import COMPANIONS, PoolMatrix, compose_meal, round_grams, rounded_portion
+from .metrics import calculate_metrics
+from .rules import NUTRIENT_FIELDS, select_pool
+from .types import Plan, PlannedMeal
+from .variety import Rotation, slot_seed
+
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def meal_splits(plan_type):
+    """Share of the daily calorie target given to each meal slot."""
+    if plan_type == '3-Meal':
+        return {'Breakfast': 0.30, 'Lunch': 0.40, 'Dinner': 0.30}
+    # 4-Meal Split (Replacing old 5-meal as per user request)
+    return {
+        'Breakfast': 0.25,
+        'Lunch': 0.35,
+        'Evening Snack': 0.10,
+        'Dinner': 0.30
+    }
+
+
+def required_grams(food, meal_target_cal):
+    """Grams of `food` that meet the meal target, bounded to 20–500 g (unrounded)."""
+    if food.calories <= 0:
+        return 100
+
+    # Required grams = (target calories / calories per 100g) * 100
+    grams = (meal_target_cal / food.calories) * 100
+
+    # Sanity checks so we don't prescribe absurd amounts
+    return min(max(grams, 20), 500)
+
+
+def portion_for(food, meal_target_cal):
+    """
+    ENGINE C: DYNAMIC PORTION MATH (Step 7)
+    Adjusts portion to meet the meal target in Grams.
+    """
+    base_cal_per_100g = food.calories
+    if base_cal_per_100g <= 0:
+        return "100 g", 0
+
+    final_grams = round(required_grams(food, meal_target_cal) / 10) * 10 # round to nearest 10g for cleaner UI
+
+    qty_text = f"{final_grams} g"
+    total_cal = int((final_grams / 100.0) * base_cal_per_100g)
+
+    return qty_text, total_cal
+
+
+def generate_week(profile, catalog, restrictions, splits=None, seed=0, pool_filter=select_pool,
+                  avoid=frozenset(), no_repeat_days=0, max_items=1):
+    """
+    ENGINE D: WEEKLY GENERATION LOOP
+    Every day × meal slot gets the next food of a seeded Rotation per slot
+    (see health.engine.variety), so the same seed always yields the same week.
+
+    max_items       1: the rotation pick alone, portioned to calories (ENGINE C);
+                    2–3: ENGINE C2 adds companions and solves grams for
+                    calories and macros together (health.engine.composer)
+    avoid           food ids to queue last (e.g. the previous checkup's plan)
+    no_repeat_days  a food is not served again within this many days
+                    (1 = never twice on one day; 0 = rotation order only)
+    pool_filter     defaults to the pure-Python rules; any health.filters
+                    engine with the same signature can be passed instead
+
+    Daily `max` restrictions are enforced on the portioned amounts by a
+    running DailyBudget (ENGINE E): foods that cannot fit are skipped and
+    portions are cut down to what is left of the day's allowance.
+
+    Slots whose pool is empty (e.g. every food carries a banned nutrient), or
+    where no food fits what is left of a daily max, are listed in
+    `plan.unfilled` rather than served.
+    """
+    metrics = calculate_metrics(
+        profile.weight, profile.height, profile.age, profile.gender, profile.activity
+    )
+    splits = splits or meal_splits(profile.plan_type)
+
+    rotations = {}
+    matrices = {}
+    for meal in splits.keys():
+        pool = pool_filter(meal, profile.dietary, metrics.category, restrictions, catalog=catalog)
+        rotations[meal] = Rotation(pool, random.Random(slot_seed(seed, meal)), avoid)
+        if max_items > 1:
+            matrices[meal] = PoolMatrix(rotations[meal].items)
+
+    budget = DailyBudget(restrictions, splits)
+    last_served = {}                  # food id → index of the last day it was served
+    plan = Plan(category=metrics.category, target_calories=metrics.target_calories)
+    for day_index, day in enumerate(DAYS):
+        budget.start_day()
+        repeated = None
+        if no_repeat_days:
+            repeated = lambda f: day_index - last_served.get(f.id, -no_repeat_days) < no_repeat_days
+
+        for meal_name, pct in splits.items():
+            rotation = rotations[meal_name]
+            if not rotation:
+                plan.unfilled.append((day, meal_name))
+                budget.close_meal(meal_name)
+                continue
+
+            blocked = repeated
+            if budget:
+                allowance = budget.allowance(meal_name)
+                blocked = lambda f: (repeated is not None and repeated(f)) or not budget.admits(f, allowance)
+
+            selected_food = rotation.next(blocked)
+            meal_target = metrics.target_calories * pct
+
+            if max_items > 1:
+                caps = []
+                if budget:
+                    caps = [(NUTRIENT_FIELDS.index(n), room) for n, room in allowance.items()]
+                items = compose_meal(
+                    matrices[meal_name], selected_food, rotation.upcoming(COMPANIONS, blocked),
+                    meal_target, caps, max_items,
+                )
+            else:
+                items = [(selected_food, required_grams(selected_food, meal_target))]
+
+            portions = []
+            for food, grams in items:
+                if budget:
+                    grams = budget.fit(food, round_grams(grams), allowance)
+                    if not grams:
+                        continue                    # not even 10 g fits the cap
+                    budget.spend(food, grams, allowance)
+                portions.append((food, rounded_portion(food, grams)))
+            budget.close_meal(meal_name)
+            if not portions:
+                plan.unfilled.append((day, meal_name))
+
+            for food, (qty_str, final_cal) in portions:
+                last_served[food.id] = day_index
+                plan.meals.append(PlannedMeal(
+                    day=day, meal_type=meal_name,
+                    food_id=food.id, food_name=food.name,
+                    quantity_text=qty_str, calories=final_cal,
+                ))
+    return plan
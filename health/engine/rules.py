@@ -0,0 +1,199 @@
+"""
+Food-pool rules shared by every filter engine (see health.filters):
+
+    1. meal label → DB category (snacks / mid-morning share 'Snack')
+    2. dietary preference → allowed diet_type values
+    3. BMI rules (Obese/Overweight: sugar ≤ 8 and fiber ≥ 3 or protein ≥ 5;
+       Underweight: calories ≥ 100)
+    4. disease restrictions → per-100 g thresholds (banned ⇒ threshold 0)
+
+These only pre-shrink the pools; daily `max` amounts are enforced on real
+portions by health.engine.budget.
+
+Restriction JSON is compiled before any engine sees it: nutrient names are
+normalised through NUTRIENT_ALIASES to FoodItem columns, and each rule becomes
+a compact `Rule(column, threshold, banned, max)`. Names that map to no column
+("saturated fat", "alcohol", …) are dropped here and listed by
+`manage.py audit_nutrients`.
+"""
+import re
+from typing import NamedTuple, Optional
+
+# Per-100 g nutrient columns carried by every food record
+NUTRIENT_FIELDS = (
+    'calories', 'protein', 'carbs', 'fat', 'fiber',
+    'sugar', 'sodium', 'potassium', 'calcium', 'phosphorus',
+)
+
+# Smart defaults are applied when a restriction has no explicit threshold.
+SMART_DEFAULTS = {
+    'sodium':    400,    # mg  per 100 g serving
+    'sugar':      8,     # g   per 100 g serving
+    'fat':       30,     # g   per 100 g
+    'carbs':     50,     # g   per 100 g
+    'protein':   None,   # protein restriction — only filter very high-protein foods for renal
+    'fiber':     None,   # high fiber is usually good; only restrict in IBD
+    'potassium': None,
+    'calcium':   None,
+    'phosphorus':None,
+}
+
+# Spellings and synonyms found in disease data → FoodItem column.
+# Only true aliases: narrower nutrients (saturated fat, lactose, …) stay unmapped.
+NUTRIENT_ALIASES = {
+    'calorie':        'calories',
+    'kcal':           'calories',
+    'energy':         'calories',
+    'proteins':       'protein',
+    'poteins':        'protein',
+    'carb':           'carbs',
+    'carbohydrate':   'carbs',
+    'carbohydrates':  'carbs',
+    'fats':           'fat',
+    'total fat':      'fat',
+    'fibre':          'fiber',
+    'dietary fiber':  'fiber',
+    'sugars':         'sugar',
+    'suagr':          'sugar',
+    'added sugar':    'sugar',
+    'added sugars':   'sugar',
+    'refined sugars': 'sugar',
+    'salt':           'sodium',
+    'calicum':        'calcium',
+    'phosphorous':    'phosphorus',
+    'phosphate':      'phosphorus',
+}
+
+RULE_KEYS = frozenset({'max', 'banned'})
+
+
+class Rule(NamedTuple):
+    """One compiled restriction on a nutrient column."""
+    column:    int                  # index into NUTRIENT_FIELDS
+    threshold: Optional[float]      # per-100 g pool limit (0 when banned, None = none)
+    banned:    bool
+    max:       Optional[float]      # daily maximum, enforced by the budget
+
+    @property
+    def nutrient(self):
+        return NUTRIENT_FIELDS[self.column]
+
+
+def canonical_nutrient(name):
+    """The FoodItem column a restriction name refers to, or None."""
+    key = re.sub(r'\s+', ' ', str(name).strip().lower())
+    if key in NUTRIENT_FIELDS:
+        return key
+    return NUTRIENT_ALIASES.get(key)
+
+
+def compile_restrictions(restricted_nutrients):
+    """
+    Validate one disease's `restricted_nutrients` JSON and compile it to
+    [[column, max, banned], ...] sorted by column (JSON-storable). Raises
+    ValueError on a malformed document; unmapped names are skipped.
+    """
+    if not isinstance(restricted_nutrients, dict):
+        raise ValueError("restricted_nutrients must be an object of {nutrient: rule}.")
+    by_column = {}
+    for name, rule in restricted_nutrients.items():
+        if not isinstance(name, str) or not name.strip():
+            raise ValueError(f"Nutrient names must be non-empty strings, got {name!r}.")
+        if not isinstance(rule, dict):
+            raise ValueError(f"Rule for {name!r} must be an object, got {rule!r}.")
+        unknown = set(rule) - RULE_KEYS
+        if unknown:
+            raise ValueError(f"Rule for {name!r} has unknown keys: {', '.join(sorted(unknown))}.")
+        banned = rule.get('banned', False)
+        if not isinstance(banned, bool):
+            raise ValueError(f"'banned' for {name!r} must be true or false.")
+        limit = rule.get('max')
+        if limit is not None and (isinstance(limit, bool) or not isinstance(limit, (int, float))
+                                  or limit < 0):
+            raise ValueError(f"'max' for {name!r} must be a non-negative number or null.")
+
+        column = canonical_nutrient(name)
+        if column is not None:
+            by_column[NUTRIENT_FIELDS.index(column)] = [limit, banned]
+    return [[column, limit, banned] for column, (limit, banned) in sorted(by_column.items())]
+
+
+def merge_rules(compiled):
+    """
+    (Rule, ...) from compiled rule lists ordered by priority asc — a later
+    list overrides earlier ones per column, like merge_restrictions.
+    """
+    by_column = {}
+    for rules in compiled:
+        for column, limit, banned in rules:
+            by_column[column] = (limit, banned)
+
+    merged = []
+    for column, (limit, banned) in sorted(by_column.items()):
+        if banned:
+            # Completely exclude any food containing this nutrient (value > 0 is excluded)
+            threshold = 0
+        elif limit is not None:
+            # Divide daily limit by ~4 to get a rough per-100g serving threshold
+            # e.g., 1500mg daily Sodium -> 375mg per 100g max limit
+            threshold = limit / 4.0
+        else:
+            # Fallback to Smart Defaults if no specific DB limit is found
+            threshold = SMART_DEFAULTS.get(NUTRIENT_FIELDS[column])
+        merged.append(Rule(column, threshold, banned, limit))
+    return tuple(merged)
+
+
+def rules_for(restrictions):
+    """
+    Compiled rules for a restriction mapping: the `.rules` precompiled by
+    health.restrictions, or compiled here from a plain {nutrient: rule} dict.
+    """
+    rules = getattr(restrictions, 'rules', None)
+    if rules is not None:
+        return rules
+    return merge_rules([compile_restrictions(dict(restrictions or {}))])
+
+
+def db_category(meal_type):
+    """Map high-level meal labels to database categories."""
+    if 'Snack' in meal_type or 'Mid-Morning' in meal_type:
+        return 'Snack'
+    return meal_type
+
+
+def allowed_diet_types(diet_pref):
+    """diet_type values allowed for a preference; None means no restriction."""
+    if diet_pref == 'Veg':
+        return ['Veg', 'Vegan']
+    if diet_pref == 'Vegan':
+        return ['Vegan']
+    if diet_pref == 'Eggetarian':
+        # Eggetarian: vegetarian foods + eggs; exclude meat-based Non-Veg
+        # Note: Add diet_type='Egg' to FoodItem if egg dishes are in the DB
+        return ['Veg', 'Vegan']
+    return None
+
+
+def restriction_thresholds(restrictions):
+    """
+    Flatten restrictions into [(nutrient column, per_100g_limit)] pairs.
+    Foods with nutrient > limit are excluded; a banned nutrient has limit 0.
+    """
+    return [(rule.nutrient, rule.threshold) for rule in rules_for(restrictions)
+            if rule.threshold is not None]
+
+
+def select_pool(meal_type, diet_pref, bmi_category, restrictions=None, catalog=None):
+    """Foods for one meal slot, evaluated in plain Python over `catalog`."""
+    pool = catalog.pool(db_category(meal_type), allowed_diet_types(diet_pref))
+
+    if bmi_category in ['Obese', 'Overweight']:
+        pool = [f for f in pool if f.sugar <= 8 and (f.fiber >= 3 or f.protein >= 5)]
+    elif bmi_category == 'Underweight':
+        pool = [f for f in pool if f.calories >= 100]
+
+    for nutrient, limit in restriction_thresholds(restrictions):
+        pool = [f for f in pool if getattr(f, nutrient) <= limit]
+
+    return pool
@@ -0,0 +1,41 @@
+from dataclasses import dataclass, field
+
+
+@dataclass(frozen=True)
+class Profile:
+    """Everything about a patient visit that the engine needs."""
+    weight:    float           # kg
+    height:    float           # cm
+    age:       int
+    gender:    str
+    activity:  float           # TDEE multiplier, e.g. 1.375
+    dietary:   str = 'Non-Veg'
+    plan_type: str = '3-Meal'
+
+
+@dataclass(frozen=True)
+class PlannedMeal:
+    day:           str
+    meal_type:     str
+    food_id:       int
+    food_name:     str
+    quantity_text: str         # e.g. "250 g"
+    calories:      int         # portion-adjusted
+
+
+@dataclass
+class Plan:
+    category:        str
+    target_calories: int
+    meals:           list = field(default_factory=list)   # [PlannedMeal] in day × slot order
+    unfilled:        list = field(default_factory=list)   # [(day, meal_type)] no food could fill
+
+    @property
+    def total_calories(self):
+        return sum(m.calories for m in self.meals)
+
+    def by_day(self):
+        days = {}
+        for meal in self.meals:
+            days.setdefault(meal.day, []).append(meal)
+        return days
@@ -0,0 +1,68 @@
+"""
+Seeded plan variety.
+
+Each meal slot draws from a `Rotation`: the slot's pool shuffled once with
+its own RNG, then walked with an index cursor, so every pick is O(1) instead
+of the old `pool.pop(0); pool.append(...)` list shift. A no-repeat window
+skips foods served within the last N days (across all slots), and foods from
+the patient's previous plan are queued behind the fresh ones.
+
+The seed combines patient, checkup and plan revision (see
+health.generation.plan_seed): each new checkup and every `regenerate_plan`
+yields a new week, while the same inputs always rebuild the same week, which
+keeps cached reports and PDFs reproducible.
+"""
+
+
+def slot_seed(seed, meal):
+    """RNG seed for one meal slot of a plan."""
+    return f"{seed}_{meal}"
+
+
+class Rotation:
+    """Round-robin over one slot's shuffled pool with an O(1) index cursor."""
+
+    __slots__ = ('items', 'cursor')
+
+    def __init__(self, pool, rng, avoid=frozenset()):
+        items = list(pool)
+        rng.shuffle(items)
+        if avoid:
+            # Stable partition: previous-plan foods only come round once fresh ones are used
+            items = [f for f in items if f.id not in avoid] + [f for f in items if f.id in avoid]
+        self.items  = items
+        self.cursor = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def next(self, blocked=None):
+        """
+        The next food in the rotation. If `blocked(food)` holds for it, the
+        nearest eligible food is swapped into its place; when every food is
+        blocked (a pool smaller than the window) the rotation order wins.
+        """
+        items = self.items
+        n = len(items)
+        i = self.cursor % n
+        if blocked is not None and blocked(items[i]):
+            for step in range(1, n):
+                j = (i + step) % n
+                if not blocked(items[j]):
+                    items[i], items[j] = items[j], items[i]
+                    break
+        self.cursor += 1
+        return items[i]
+
+    def upcoming(self, count, blocked=None):
+        """Up to `count` foods after the cursor, skipping blocked ones (no advance)."""
+        items = self.items
+        n = len(items)
+        picked = []
+        for step in range(min(n, count * 2)):
+            food = items[(self.cursor + step) % n]
+            if blocked is None or not blocked(food):
+                picked.append(food)
+                if len(picked) == count:
+                    break
+        return picked
@@ -0,0 +1,85 @@
+"""
+Food-pool filter engines behind `smart_filter` and plan generation.
+
+All engines apply the rules defined in health.engine.rules and return pools
+in FoodItem id order.
+
+Select with settings.HEALTH_FOOD_FILTER_ENGINE:
+    'catalog' — in-memory FoodCatalog snapshot, zero DB round-trips (default)
+    'numpy'   — boolean masks over the snapshot's NutrientMatrix; cost stays
+                flat however many restrictions a patient's diseases add
+    'orm'     — chained FoodItem queryset filters (original behaviour)
+"""
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+
+from .catalog import get_catalog
+from .engine.rules import allowed_diet_types, db_category, restriction_thresholds, select_pool
+from .models import FoodItem
+
+
+def orm_pool(meal_type, diet_pref, bmi_category, restrictions=None, catalog=None):
+    """ORM engine: one FoodItem query with chained filters/excludes (`catalog` unused)."""
+    items = FoodItem.objects.filter(category=db_category(meal_type))
+
+    diet_types = allowed_diet_types(diet_pref)
+    if diet_types is not None:
+        items = items.filter(diet_type__in=diet_types)
+
+    if bmi_category in ['Obese', 'Overweight']:
+        items = items.exclude(sugar__gt=8)
+        items = items.filter(Q(fiber__gte=3) | Q(protein__gte=5))
+    elif bmi_category == 'Underweight':
+        items = items.filter(calories__gte=100)
+
+    for nutrient, limit in restriction_thresholds(restrictions):
+        # Explicitly apply > limit exclusion using ORM kwargs
+        items = items.exclude(**{f"{nutrient}__gt": limit})
+
+    return list(items.order_by('id'))
+
+
+def catalog_pool(meal_type, diet_pref, bmi_category, restrictions=None, catalog=None):
+    """Catalog engine: the engine's pure-Python rules over the in-memory snapshot."""
+    return select_pool(meal_type, diet_pref, bmi_category, restrictions, catalog=catalog or get_catalog())
+
+
+def numpy_pool(meal_type, diet_pref, bmi_category, restrictions=None, catalog=None):
+    """NumPy engine: every rule is one vectorised mask over the nutrient matrix."""
+    catalog = catalog or get_catalog()
+    m = catalog.matrix
+
+    mask = m.category == db_category(meal_type)
+    diet_types = allowed_diet_types(diet_pref)
+    if diet_types is not None:
+        mask &= np.isin(m.diet_type, diet_types)
+
+    if bmi_category in ['Obese', 'Overweight']:
+        mask &= (m['sugar'] <= 8) & ((m['fiber'] >= 3) | (m['protein'] >= 5))
+    elif bmi_category == 'Underweight':
+        mask &= m['calories'] >= 100
+
+    for nutrient, limit in restriction_thresholds(restrictions):
+        if nutrient in m.column:
+            mask &= m[nutrient] <= limit
+
+    records = catalog.records
+    return [records[i] for i in np.flatnonzero(mask)]
+
+
+ENGINES = {
+    'orm':     orm_pool,
+    'catalog': catalog_pool,
+    'numpy':   numpy_pool,
+}
+
+
+def selected_engine():
+    """The pool function named by settings.HEALTH_FOOD_FILTER_ENGINE."""
+    return ENGINES[getattr(settings, 'HEALTH_FOOD_FILTER_ENGINE', 'catalog')]
+
+
+def filter_pool(meal_type, diet_pref, bmi_category, restrictions=None):
+    """Dispatch to the engine named by settings.HEALTH_FOOD_FILTER_ENGINE."""
+    return selected_engine()(meal_type, diet_pref, bmi_category, restrictions)
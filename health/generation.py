@@ -0,0 +1,166 @@
+"""
+Plan generation service — the single place a Checkup becomes a stored weekly
+plan. Checkup creation, `regenerate_plan` and the `generate_plans` backfill
+command all write through here, so the report view only ever reads.
+
+This module is the ORM adapter around health.engine: it turns a Checkup into
+an engine Profile, runs `generate_week` against the cached food catalog and
+converts the resulting Plan into unsaved AssignedMeal rows.
+
+Single checkups use health.plans.ensure_plan / replace_plan; batches go
+through `generate_plans`, which resolves restrictions for the whole batch in
+one query and writes every plan with one locked bulk INSERT.
+
+A plan avoids the foods of the patient's previous checkup (by date), so
+batches are built oldest first and a checkup whose predecessor is in the same
+batch avoids the predecessor's freshly built rows: the result does not depend
+on how a backfill is chunked.
+"""
+from django.conf import settings
+from django.db.models import Case, Count, F, Value, When
+from django.db.models.functions import Concat
+
+from .catalog import get_catalog
+from .engine import Profile, generate_week, meal_splits
+from .filters import selected_engine
+from .models import Checkup, AssignedMeal
+from .plans import ensure_plan, ensure_plans, replace_plan
+from .restrictions import restrictions_for_checkup, restrictions_for_checkups
+
+
+def expected_slot_count(plan_type):
+    """Day × meal slots in a complete week for this plan type."""
+    return 7 * len(meal_splits(plan_type))
+
+
+def profile_for(checkup):
+    """Engine Profile for a checkup (patient must be loaded or loadable)."""
+    return Profile(
+        weight=checkup.weight, height=checkup.height, age=checkup.age,
+        gender=checkup.patient.gender, activity=checkup.activity,
+        dietary=checkup.dietary, plan_type=checkup.plan_type,
+    )
+
+
+def plan_seed(checkup):
+    """Variety seed: new per checkup and per regeneration, stable otherwise."""
+    return f"{checkup.patient_id}:{checkup.pk}:{checkup.plan_revision}"
+
+
+def previous_checkups(checkups):
+    """{checkup id: id of the same patient's closest earlier checkup, or None}. One query."""
+    checkups = list(checkups)
+    history = (
+        Checkup.objects
+        .filter(patient_id__in={c.patient_id for c in checkups})
+        .order_by('patient_id', 'date', 'id')
+        .values_list('id', 'patient_id')
+    )
+    earlier = {}
+    previous = {}
+    for checkup_id, patient_id in history:
+        previous[checkup_id] = earlier.get(patient_id)
+        earlier[patient_id] = checkup_id
+    return {c.pk: previous.get(c.pk) for c in checkups}
+
+
+def previous_plan_foods(checkups, wanted=None):
+    """
+    {checkup id: frozenset of food ids} served in each checkup's previous plan
+    (the same patient's closest earlier checkup). Two queries for any batch.
+    """
+    if wanted is None:
+        wanted = previous_checkups(checkups)
+    foods = {}
+    served = AssignedMeal.objects.filter(checkup_id__in={p for p in wanted.values() if p})
+    for checkup_id, food_id in served.values_list('checkup_id', 'food_item_id'):
+        foods.setdefault(checkup_id, set()).add(food_id)
+    return {pk: frozenset(foods.get(prev, ())) for pk, prev in wanted.items()}
+
+
+def build_plan_rows(checkup, restricted, catalog=None, avoid=frozenset()):
+    """
+    Run the engine for one checkup and return unsaved AssignedMeal rows.
+    Slots no food could fill are counted on `checkup.unfillable_slots`.
+    """
+    plan = generate_week(
+        profile_for(checkup), catalog or get_catalog(), restricted,
+        meal_splits(checkup.plan_type), seed=plan_seed(checkup),
+        pool_filter=selected_engine(), avoid=avoid,
+        no_repeat_days=getattr(settings, 'HEALTH_PLAN_NO_REPEAT_DAYS', 2),
+        max_items=getattr(settings, 'HEALTH_MEAL_MAX_ITEMS', 3),
+    )
+    checkup.unfillable_slots = len(plan.unfilled)
+    return [
+        AssignedMeal(
+            checkup=checkup, day=m.day, meal_type=m.meal_type,
+            food_item_id=m.food_id, quantity_text=m.quantity_text,
+            total_calories=m.calories,
+        )
+        for m in plan.meals
+    ]
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# SERVICE
+# ──────────────────────────────────────────────────────────────────────────────
+
+def generate_plan(checkup, replace=False):
+    """
+    Write the checkup's weekly plan. Without `replace`, complete plans are left
+    untouched (returns False); with it the plan revision is bumped — so the
+    variety seed moves — and the plan rebuilt atomically.
+    """
+    restricted = restrictions_for_checkup(checkup)
+
+    def build():
+        avoid = previous_plan_foods([checkup])[checkup.pk]
+        return build_plan_rows(checkup, restricted, avoid=avoid)
+
+    if replace:
+        Checkup.objects.filter(pk=checkup.pk).update(plan_revision=F('plan_revision') + 1)
+        checkup.refresh_from_db(fields=['plan_revision'])
+        replace_plan(checkup, build)
+        return True
+    return ensure_plan(checkup, expected_slot_count(checkup.plan_type), build)
+
+
+def pending_checkups():
+    """Checkups with missing or incomplete meal slots (unfillable ones aside)."""
+    expected = Case(
+        When(plan_type='3-Meal', then=Value(expected_slot_count('3-Meal'))),
+        default=Value(expected_slot_count('4-Meal')),
+    )
+    return (
+        Checkup.objects
+        .annotate(
+            slot_total=Count(
+                Concat('assignedmeal__day', Value('|'), 'assignedmeal__meal_type'), distinct=True
+            ),
+            slot_expected=expected,
+        )
+        .exclude(slot_total=F('slot_expected') - F('unfillable_slots'))
+    )
+
+
+def generate_plans(checkups):
+    """
+    Generate plans for a batch of checkups (patients joined). Restrictions and
+    previous-plan foods are resolved in three queries and the rows written by
+    health.plans.ensure_plans in one transaction. Returns the checkups written.
+    """
+    checkups = sorted(checkups, key=lambda c: (c.date, c.pk))    # predecessors first
+    restricted = restrictions_for_checkups([c.pk for c in checkups])
+    previous = previous_checkups(checkups)
+    avoid = previous_plan_foods(checkups, previous)
+    catalog = get_catalog()
+    built = {}                      # checkup id → food ids of the rows built just now
+
+    def build(checkup):
+        prev = previous[checkup.pk]
+        rows = build_plan_rows(checkup, restricted[checkup.pk], catalog,
+                               built.get(prev, avoid[checkup.pk]))
+        built[checkup.pk] = frozenset(row.food_item_id for row in rows)
+        return rows
+
+    return ensure_plans(checkups, lambda c: expected_slot_count(c.plan_type), build)
@@ -0,0 +1,275 @@
+"""
+Opt-in per-view request instrumentation.
+
+Enable with settings.HEALTH_INSTRUMENTATION = True (env INSTRUMENTATION=1);
+when off, the middleware removes itself at startup (MiddlewareNotUsed), so
+the cost is zero. When on, every request records
+
+    wall time · SQL query count · DB time · duplicate queries · template time
+
+keyed by the resolved view name. Query timing uses `connection.execute_wrapper`;
+duplicates are statements whose SQL text (before parameters) already ran in
+the same request — the N+1 signature. Template time wraps the Django template
+backend's `render`.
+
+Per view the registry keeps cumulative counters, fixed-bucket histograms
+(Prometheus style) and a rolling window of recent samples for percentiles.
+Both reports also carry the database connection pools' counters
+(health.dbpool: checkouts, new connections, recycles, errors, wait time).
+Served by views.metrics_json (staff JSON, hottest views first) and
+views.metrics_prometheus (text exposition format).
+"""
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import dbpool
+
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, float('inf'))
+
+_current = ContextVar('health_request_stats', default=None)
+
+
+class RequestStats:
+    """Counters for the request in flight (one per request, never shared)."""
+
+    __slots__ = ('queries', 'duplicates', 'db_time', 'template_time', 'seen')
+
+    def __init__(self):
+        self.queries       = 0
+        self.duplicates    = 0
+        self.db_time       = 0.0
+        self.template_time = 0.0
+        self.seen          = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        """execute_wrapper hook: time the statement and spot repeats."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            if sql in self.seen:
+                self.duplicates += 1
+            else:
+                self.seen.add(sql)
+
+
+class ViewMetrics:
+    """Cumulative totals, bucket counts and a rolling sample window for one view."""
+
+    __slots__ = ('requests', 'errors', 'wall', 'db', 'template', 'queries',
+                 'duplicates', 'buckets', 'window')
+
+    def __init__(self, window):
+        self.requests   = 0
+        self.errors     = 0
+        self.wall       = 0.0
+        self.db         = 0.0
+        self.template   = 0.0
+        self.queries    = 0
+        self.duplicates = 0
+        self.buckets    = [0] * len(BUCKETS)
+        self.window     = deque(maxlen=window)   # (wall, db, template, queries, duplicates)
+
+    def add(self, wall, stats, status):
+        self.requests   += 1
+        self.errors     += status >= 500
+        self.wall       += wall
+        self.db         += stats.db_time
+        self.template   += stats.template_time
+        self.queries    += stats.queries
+        self.duplicates += stats.duplicates
+        for i, bound in enumerate(BUCKETS):
+            if wall <= bound:
+                self.buckets[i] += 1
+                break
+        self.window.append((wall, stats.db_time, stats.template_time,
+                            stats.queries, stats.duplicates))
+
+
+def _summary(values, scale=1.0, digits=2):
+    if not values:
+        return {}
+    ordered = sorted(values)
+    pick = lambda pct: ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+    return {
+        'p50':  round(pick(50) * scale, digits),
+        'p95':  round(pick(95) * scale, digits),
+        'p99':  round(pick(99) * scale, digits),
+        'mean': round(sum(ordered) / len(ordered) * scale, digits),
+        'max':  round(ordered[-1] * scale, digits),
+    }
+
+
+class Registry:
+    """Process-wide store of ViewMetrics, safe to update from any thread."""
+
+    def __init__(self, window=1000):
+        self.window  = window
+        self.views   = {}
+        self.started = time.time()
+        self._lock   = threading.Lock()
+
+    def record(self, view, wall, stats, status):
+        with self._lock:
+            metrics = self.views.get(view)
+            if metrics is None:
+                metrics = self.views[view] = ViewMetrics(self.window)
+            metrics.add(wall, stats, status)
+
+    def reset(self):
+        with self._lock:
+            self.views.clear()
+            self.started = time.time()
+        dbpool.reset_stats()
+
+    def snapshot(self):
+        """JSON-ready hot-path report, views ordered by total wall time."""
+        with self._lock:
+            items = [(name, m, list(m.window)) for name, m in self.views.items()]
+        report = {}
+        for name, m, window in sorted(items, key=lambda item: -item[1].wall):
+            report[name] = {
+                'requests':          m.requests,
+                'errors':            m.errors,
+                'total_wall_s':      round(m.wall, 3),
+                'wall_ms':           _summary([w[0] for w in window], 1000),
+                'db_ms':             _summary([w[1] for w in window], 1000),
+                'template_ms':       _summary([w[2] for w in window], 1000),
+                'queries':           _summary([w[3] for w in window]),
+                'duplicate_queries': _summary([w[4] for w in window]),
+            }
+        pools = {}
+        for label, pool in dbpool.stats().items():
+            waits = pool.pop('waits')
+            pools[label] = {**pool, 'wait_ms': _summary(waits, 1000, 3)}
+        return {'since': self.started, 'window': self.window, 'views': report, 'db_pools': pools}
+
+    def prometheus(self):
+        """Counters and latency histograms in the Prometheus text format."""
+        with self._lock:
+            rows = [(name, m.requests, m.errors, m.wall, m.db, m.template,
+                     m.queries, m.duplicates, list(m.buckets))
+                    for name, m in sorted(self.views.items())]
+
+        lines = [
+            '# HELP health_request_duration_seconds Wall time per request.',
+            '# TYPE health_request_duration_seconds histogram',
+        ]
+        for name, requests, _, wall, *_, buckets in rows:
+            cumulative = 0
+            for bound, count in zip(BUCKETS, buckets):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'health_request_duration_seconds_bucket{{view="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'health_request_duration_seconds_sum{{view="{name}"}} {wall:.6f}')
+            lines.append(f'health_request_duration_seconds_count{{view="{name}"}} {requests}')
+
+        counters = (
+            ('health_request_errors_total',              'Responses with status >= 500.',         2, '{}'),
+            ('health_db_duration_seconds_total',         'Time spent executing SQL.',             4, '{:.6f}'),
+            ('health_template_duration_seconds_total',   'Time spent rendering templates.',       5, '{:.6f}'),
+            ('health_db_queries_total',                  'SQL statements executed.',              6, '{}'),
+            ('health_db_duplicate_queries_total',        'Statements repeated within a request.', 7, '{}'),
+        )
+        for metric, help_text, column, fmt in counters:
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} counter')
+            for row in rows:
+                lines.append(f'{metric}{{view="{row[0]}"}} {fmt.format(row[column])}')
+        return '\n'.join(lines + _pool_lines(dbpool.stats())) + '\n'
+
+
+def _pool_lines(pools):
+    """Connection pool counters and gauges in the Prometheus text format."""
+    lines = []
+    metrics = (
+        ('health_db_pool_checkouts_total',        'counter', 'Connections handed out.',              'checkouts'),
+        ('health_db_pool_connects_total',         'counter', 'New server connections opened.',       'connects'),
+        ('health_db_pool_recycled_total',         'counter', 'Connections closed at max lifetime.',  'recycled'),
+        ('health_db_pool_discarded_total',        'counter', 'Connections dropped as unusable.',     'discarded'),
+        ('health_db_pool_in_use',                 'gauge',   'Connections checked out now.',         'in_use'),
+        ('health_db_pool_idle',                   'gauge',   'Idle pooled connections.',             'idle'),
+    )
+    for metric, kind, help_text, key in metrics:
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for label, pool in pools.items():
+            lines.append(f'{metric}{{pool="{label}"}} {pool[key]}')
+
+    lines.append('# HELP health_db_pool_errors_total Connect, validation and checkout-timeout failures.')
+    lines.append('# TYPE health_db_pool_errors_total counter')
+    for label, pool in pools.items():
+        for kind, count in sorted(pool['errors'].items()):
+            lines.append(f'health_db_pool_errors_total{{pool="{label}",kind="{kind}"}} {count}')
+
+    lines.append('# HELP health_db_pool_wait_seconds Time spent waiting for a free connection (recent window).')
+    lines.append('# TYPE health_db_pool_wait_seconds summary')
+    for label, pool in pools.items():
+        lines.append(f'health_db_pool_wait_seconds_sum{{pool="{label}"}} {sum(pool["waits"]):.6f}')
+        lines.append(f'health_db_pool_wait_seconds_count{{pool="{label}"}} {len(pool["waits"])}')
+    return lines
+
+
+registry = Registry(getattr(settings, 'HEALTH_INSTRUMENTATION_WINDOW', 1000))
+
+
+def _install_template_timer():
+    """Wrap the Django template backend's render once per process."""
+    from django.template.backends.django import Template
+
+    if getattr(Template.render, 'instrumented', False):
+        return
+    original = Template.render
+
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return original(self, context, request)
+        started = time.perf_counter()
+        try:
+            return original(self, context, request)
+        finally:
+            stats.template_time += time.perf_counter() - started
+
+    render.instrumented = True
+    Template.render = render
+
+
+class InstrumentationMiddleware:
+    """Records per-view timing and SQL stats into `registry` (opt-in)."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'HEALTH_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        _install_template_timer()
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status = 500
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(stats))
+                response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            wall = time.perf_counter() - started
+            _current.reset(token)
+            # view_name is the URL name, or the view's dotted path for unnamed URLs
+            match = getattr(request, 'resolver_match', None)
+            registry.record(match.view_name if match else 'unresolved', wall, stats, status)
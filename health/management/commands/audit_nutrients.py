@@ -0,0 +1,68 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from health.engine.rules import canonical_nutrient, compile_restrictions
+from health.models import Disease
+
+
+class Command(BaseCommand):
+    help = (
+        "Report restricted_nutrients names that map to no FoodItem column (and so "
+        "restrict nothing), the aliases in use, and malformed rules, across all diseases."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--examples', type=int, default=3,
+            help="Disease names listed per unmapped nutrient (default: 3)."
+        )
+        parser.add_argument(
+            '--strict', action='store_true',
+            help="Exit with an error when anything is unmapped or malformed."
+        )
+
+    def handle(self, *args, **options):
+        unmapped = defaultdict(list)       # raw name → [disease names]
+        aliased = defaultdict(set)         # raw name → column
+        invalid = []
+        total = 0
+
+        for name, rules in Disease.objects.order_by('name').values_list('name', 'restricted_nutrients'):
+            total += 1
+            try:
+                compile_restrictions(rules)
+            except ValueError as exc:
+                invalid.append((name, str(exc)))
+                continue
+            for nutrient in rules:
+                column = canonical_nutrient(nutrient)
+                if column is None:
+                    unmapped[nutrient].append(name)
+                elif column != nutrient:
+                    aliased[nutrient].add(column)
+
+        for name, error in invalid:
+            self.stderr.write(self.style.ERROR(f"INVALID {name}: {error}"))
+
+        if aliased:
+            self.stdout.write("Aliases in use:")
+            for nutrient, columns in sorted(aliased.items()):
+                self.stdout.write(f"  {nutrient!r:<28} → {', '.join(sorted(columns))}")
+
+        if unmapped:
+            self.stdout.write("Unmapped nutrients (ignored by the planner):")
+            limit = options['examples']
+            for nutrient, diseases in sorted(unmapped.items(), key=lambda item: (-len(item[1]), item[0])):
+                shown = ', '.join(diseases[:limit]) + (', …' if len(diseases) > limit else '')
+                self.stdout.write(f"  {nutrient!r:<28} {len(diseases):>4} disease(s)  {shown}")
+
+        affected = len({d for diseases in unmapped.values() for d in diseases})
+        summary = (
+            f"{total} disease(s): {len(unmapped)} unmapped nutrient name(s) in {affected} disease(s), "
+            f"{len(invalid)} malformed."
+        )
+        if options['strict'] and (unmapped or invalid):
+            raise CommandError(summary)
+        style = self.style.WARNING if unmapped or invalid else self.style.SUCCESS
+        self.stdout.write(style(summary))
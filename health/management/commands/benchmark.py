@@ -0,0 +1,70 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from health import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark plan generation, report/PDF rendering, dashboard and search against "
+        "synthetic patients (rolled back afterwards). Save results as a JSON baseline "
+        "or compare against one and fail on regressions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--patients', type=int, default=200,
+            help="Synthetic patients to seed (default: 200)."
+        )
+        parser.add_argument(
+            '--iterations', type=int, default=50,
+            help="Timed calls per case; PDF rendering runs a tenth of these (default: 50)."
+        )
+        parser.add_argument('--seed', type=int, default=0, help="Random seed (default: 0).")
+        parser.add_argument(
+            '--only', action='append', default=[],
+            help="Run only this case (repeatable), e.g. --only search.patients."
+        )
+        parser.add_argument('--save', help="Write the results to this JSON file.")
+        parser.add_argument('--compare', help="Baseline JSON to compare the results against.")
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help="Allowed slowdown as a fraction of the baseline (default: 0.2 = 20%%)."
+        )
+        parser.add_argument(
+            '--metric', default='p50_ms', choices=['p50_ms', 'p90_ms', 'p99_ms', 'mean_ms'],
+            help="Latency statistic compared against the baseline (default: p50_ms)."
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                baseline = benchmarks.load(options['compare'])
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Cannot read baseline {options['compare']}: {exc}")
+
+        report = benchmarks.run(
+            patients=options['patients'], iterations=options['iterations'],
+            seed=options['seed'], only=set(options['only']), log=self.stdout.write,
+        )
+
+        if options['save']:
+            Path(options['save']).parent.mkdir(parents=True, exist_ok=True)
+            benchmarks.save(report, options['save'])
+            self.stdout.write(f"Saved results to {options['save']}.")
+
+        if baseline is None:
+            return
+
+        regressions = benchmarks.compare(
+            baseline, report, threshold=options['threshold'], metric=options['metric'],
+        )
+        for name, reason in regressions:
+            self.stderr.write(self.style.ERROR(f"REGRESSION {name}: {reason}"))
+        if regressions:
+            raise CommandError(f"{len(regressions)} regression(s) against {options['compare']}.")
+        self.stdout.write(self.style.SUCCESS(
+            f"No regressions beyond {options['threshold']:.0%} on {options['metric']}."
+        ))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from health import query_plans
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN on the hot lookups of home, patients, existing_patient, smart_filter "
+        "and the report view, and flag full table scans and filesorts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--view', action='append', default=[],
+            help="Only check this view's queries (repeatable), e.g. --view report."
+        )
+        parser.add_argument(
+            '--plans', action='store_true',
+            help="Print the plan rows of every query, not only of flagged ones."
+        )
+        parser.add_argument(
+            '--strict', action='store_true',
+            help="Exit with an error when any query scans or sorts unexpectedly."
+        )
+
+    def handle(self, *args, **options):
+        results = query_plans.check(views=set(options['view']))
+        flagged = 0
+        for query, plan, unexpected, allowed in results:
+            label = f"{query.view:<17} {query.name:<28}"
+            if unexpected:
+                flagged += 1
+                self.stdout.write(self.style.WARNING(f"{label} {', '.join(sorted(unexpected)).upper()}"))
+            elif allowed:
+                self.stdout.write(f"{label} ok ({', '.join(sorted(allowed))} expected)")
+            else:
+                self.stdout.write(self.style.SUCCESS(f"{label} ok"))
+            if unexpected or options['plans']:
+                for line in plan:
+                    self.stdout.write(f"    {line}")
+
+        summary = f"{len(results)} quer(ies) explained, {flagged} flagged."
+        if options['strict'] and flagged:
+            raise CommandError(summary)
+        self.stdout.write(self.style.WARNING(summary) if flagged else self.style.SUCCESS(summary))
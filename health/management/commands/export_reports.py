@@ -0,0 +1,137 @@
+import os
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Exists, OuterRef
+from django.utils.dateparse import parse_date
+from django.utils.text import slugify
+
+from health import dbpool
+from health.models import Checkup, AssignedMeal
+from health.pdf import PdfRenderError, render_html, render_pdf_bytes
+from health.views import build_pdf_context
+
+
+class Command(BaseCommand):
+    help = (
+        "Render pdf_report.html for many checkups on a process pool. Files already "
+        "present in the output directory are skipped, so an interrupted run resumes "
+        "where it stopped. Checkups without a generated plan are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Directory the PDFs are written to.")
+        parser.add_argument('--since', help="Only checkups on or after this date (YYYY-MM-DD).")
+        parser.add_argument('--until', help="Only checkups on or before this date (YYYY-MM-DD).")
+        parser.add_argument(
+            '--patient', type=int, action='append', default=[],
+            help="Only this patient id (repeatable)."
+        )
+        parser.add_argument('--category', help="Only checkups in this BMI category, e.g. Obese.")
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help="Render processes (default: CPU count)."
+        )
+        parser.add_argument(
+            '--dietitian', default='Clinic',
+            help="Name printed in the report footer (default: Clinic)."
+        )
+        parser.add_argument(
+            '--zip', action='store_true',
+            help="Also pack the output directory into <output>.zip when done."
+        )
+
+    def selected_checkups(self, options):
+        checkups = (
+            Checkup.objects
+            .select_related('patient')
+            .filter(Exists(AssignedMeal.objects.filter(checkup=OuterRef('pk'))))
+            .order_by('id')
+        )
+        for option, lookup in (('since', 'date__gte'), ('until', 'date__lte')):
+            if options[option]:
+                day = parse_date(options[option])
+                if day is None:
+                    raise CommandError(f"--{option} must be YYYY-MM-DD, got {options[option]!r}.")
+                checkups = checkups.filter(**{lookup: day})
+        if options['patient']:
+            checkups = checkups.filter(patient_id__in=options['patient'])
+        if options['category']:
+            checkups = checkups.filter(category__iexact=options['category'])
+        return checkups
+
+    @staticmethod
+    def filename(checkup):
+        return f"Report_{checkup.id:07d}_{slugify(checkup.patient.name) or 'patient'}.pdf"
+
+    def handle(self, *args, **options):
+        output = Path(options['output'])
+        output.mkdir(parents=True, exist_ok=True)
+        workers = max(1, options['workers'])
+
+        pending = []
+        skipped = 0
+        for checkup in self.selected_checkups(options).iterator():
+            if (output / self.filename(checkup)).exists():
+                skipped += 1       # finished by an earlier run
+            else:
+                pending.append(checkup)
+
+        self.stdout.write(
+            f"{len(pending)} report(s) to render, {skipped} already exported, {workers} worker(s)."
+        )
+
+        # The render processes never touch the database; close our connections
+        # (and the pooled idle ones) so no socket is shared across the fork.
+        connections.close_all()
+        dbpool.close_idle()
+
+        rendered = failed = 0
+        started = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight = {}
+            queue = iter(pending)
+            while True:
+                # Keep a bounded window of HTML documents in flight
+                for checkup in queue:
+                    html = render_html(build_pdf_context(checkup, options['dietitian']))
+                    in_flight[pool.submit(render_pdf_bytes, html)] = checkup
+                    if len(in_flight) >= workers * 2:
+                        break
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    checkup = in_flight.pop(future)
+                    try:
+                        data = future.result()
+                    except PdfRenderError:
+                        failed += 1
+                        self.stderr.write(f"Checkup {checkup.id}: xhtml2pdf reported errors.")
+                        continue
+                    target = output / self.filename(checkup)
+                    partial = target.with_suffix('.part')
+                    partial.write_bytes(data)
+                    partial.replace(target)    # only complete files count on resume
+                    rendered += 1
+
+        elapsed = time.perf_counter() - started
+        rate = rendered / elapsed if elapsed else 0.0
+
+        if options['zip']:
+            archive = output.with_suffix('.zip')
+            with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as bundle:
+                for pdf_file in sorted(output.glob('*.pdf')):
+                    bundle.write(pdf_file, pdf_file.name)
+            self.stdout.write(f"Packed {archive}.")
+
+        summary = f"Rendered {rendered} PDF(s) in {elapsed:.1f}s ({rate:.2f} PDFs/s)."
+        if failed:
+            self.stdout.write(self.style.WARNING(f"{summary} {failed} failed."))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,101 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from health import dbpool
+from health.catalog import get_catalog
+from health.generation import generate_plans, pending_checkups
+from health.models import Checkup
+
+
+def run_chunk(checkup_ids):
+    """Generate one chunk; runs inline or in a worker process."""
+    checkups = Checkup.objects.select_related('patient').filter(id__in=checkup_ids)
+    return len(generate_plans(checkups))
+
+
+def chunk_by_patient(pending, chunk_size):
+    """
+    Split (checkup id, patient id) pairs, oldest first, into chunks of about
+    `chunk_size` ids, never splitting one patient's checkups across chunks.
+    """
+    groups = {}
+    for checkup_id, patient_id in pending:
+        groups.setdefault(patient_id, []).append(checkup_id)
+    chunks, chunk = [], []
+    for ids in groups.values():
+        chunk.extend(ids)
+        if len(chunk) >= chunk_size:
+            chunks.append(chunk)
+            chunk = []
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate weekly plans for every checkup with a missing or incomplete "
+        "AssignedMeal set, oldest first, in parallel chunks sharing one food catalog snapshot."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=200,
+            help="Checkups generated and bulk-inserted per transaction (default: 200)."
+        )
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help="Worker processes, each with its own DB connection (default: CPU count)."
+        )
+        parser.add_argument(
+            '--limit', type=int,
+            help="Stop after this many pending checkups."
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = max(1, options['chunk_size'])
+        workers    = max(1, options['workers'])
+
+        # A plan avoids the foods of the patient's previous checkup. All of a
+        # patient's pending checkups go into one chunk, built oldest first, so
+        # a predecessor is either in the same chunk or already written: no
+        # chunk waits on another and the plans do not depend on scheduling.
+        pending = pending_checkups().order_by('date', 'id').values_list('id', 'patient_id')
+        if options['limit']:
+            pending = pending[:options['limit']]
+        pending = list(pending)
+        chunks = chunk_by_patient(pending, chunk_size)
+
+        # Load the catalog before forking; the workers inherit the snapshot
+        # (restriction merges are likewise shared through the module resolver).
+        catalog = get_catalog()
+        self.stdout.write(
+            f"{len(pending)} checkup(s) pending in {len(chunks)} chunk(s), {workers} worker(s); "
+            f"catalog v{catalog.version[:8]} with {len(catalog)} foods."
+        )
+
+        started = time.perf_counter()
+        if workers == 1 or len(chunks) <= 1:
+            written = sum(run_chunk(chunk) for chunk in chunks)
+        else:
+            # Plan building is CPU-bound Python: processes, not threads. A
+            # connection must not be shared across a fork, so close ours (and
+            # the pooled idle ones) and let every worker open its own.
+            connections.close_all()
+            dbpool.close_idle()
+            context = multiprocessing.get_context('fork') if os.name == 'posix' else None
+            with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=context,
+                                     initializer=django.setup) as pool:
+                written = sum(pool.map(run_chunk, chunks))
+        elapsed = time.perf_counter() - started
+
+        rate = written / elapsed if elapsed else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {written} plan(s) in {elapsed:.1f}s ({rate:.1f} plans/s)."
+        ))
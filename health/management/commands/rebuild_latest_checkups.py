@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+
+from health.models import Patient, Checkup, PatientLatestCheckup
+
+
+class Command(BaseCommand):
+    help = "Rebuild the PatientLatestCheckup projection from the Checkup table in bulk."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=2000,
+            help="Rows per bulk INSERT (default: 2000)."
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        newest = (
+            Checkup.objects
+            .filter(patient=OuterRef('pk'))
+            .order_by('-date', '-id')
+            .values('id')[:1]
+        )
+        visit_counts = dict(
+            Checkup.objects.values_list('patient_id').annotate(n=Count('id')).order_by()
+        )
+        latest_ids = Patient.objects.annotate(latest_id=Subquery(newest)).values('latest_id')
+        latest = (
+            Checkup.objects
+            .filter(id__in=latest_ids)
+            .values_list('id', 'patient_id', 'date', 'bmi', 'category')
+        )
+
+        rows = [
+            PatientLatestCheckup(
+                patient_id=patient_id, checkup_id=checkup_id, date=date,
+                bmi=bmi, category=category, visit_count=visit_counts.get(patient_id, 0),
+            )
+            for checkup_id, patient_id, date, bmi, category in latest.iterator()
+        ]
+
+        with transaction.atomic():
+            PatientLatestCheckup.objects.all().delete()
+            PatientLatestCheckup.objects.bulk_create(rows, batch_size=batch_size)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt latest-checkup projection for {len(rows)} patient(s)."
+        ))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from health.models import Patient, PatientSearchTerm
+from health.search import normalize_name, normalize_phone, trigrams
+
+
+class Command(BaseCommand):
+    help = "Rebuild the patient name/phone trigram search index from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help="Rows per bulk INSERT (default: 5000)."
+        )
+
+    def handle(self, *args, **options):
+        terms = []
+        patients = Patient.objects.values_list('id', 'name', 'phone')
+        for patient_id, name, phone in patients.iterator():
+            terms += [
+                PatientSearchTerm(patient_id=patient_id, field=PatientSearchTerm.NAME, term=g)
+                for g in trigrams(normalize_name(name))
+            ]
+            terms += [
+                PatientSearchTerm(patient_id=patient_id, field=PatientSearchTerm.PHONE, term=g)
+                for g in trigrams(normalize_phone(phone))
+            ]
+
+        with transaction.atomic():
+            PatientSearchTerm.objects.all().delete()
+            PatientSearchTerm.objects.bulk_create(terms, batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {patients.count()} patient(s) into {len(terms)} search term(s)."
+        ))
@@ -0,0 +1,51 @@
+# Generated by Django 6.0.3 on 2026-10-18 19:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+
+
+def backfill_latest_checkups(apps, schema_editor):
+    Patient = apps.get_model('health', 'Patient')
+    Checkup = apps.get_model('health', 'Checkup')
+    PatientLatestCheckup = apps.get_model('health', 'PatientLatestCheckup')
+
+    newest = (
+        Checkup.objects.filter(patient=OuterRef('pk'))
+        .order_by('-date', '-id').values('id')[:1]
+    )
+    visit_counts = dict(
+        Checkup.objects.values_list('patient_id').annotate(n=Count('id')).order_by()
+    )
+    latest = Checkup.objects.filter(
+        id__in=Patient.objects.annotate(latest_id=Subquery(newest)).values('latest_id')
+    )
+    PatientLatestCheckup.objects.bulk_create([
+        PatientLatestCheckup(
+            patient_id=c.patient_id, checkup_id=c.id, date=c.date, bmi=c.bmi,
+            category=c.category, visit_count=visit_counts.get(c.patient_id, 0),
+        )
+        for c in latest.iterator()
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health', '0020_disease_restricted_nutrients_alter_fooditem_calories_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientLatestCheckup',
+            fields=[
+                ('patient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='latest', serialize=False, to='health.patient')),
+                ('date', models.DateField()),
+                ('bmi', models.FloatField()),
+                ('category', models.CharField(db_index=True, max_length=20)),
+                ('visit_count', models.PositiveIntegerField(default=0)),
+                ('checkup', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='health.checkup')),
+            ],
+        ),
+        migrations.RunPython(backfill_latest_checkups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 6.0.3 on 2026-10-18 19:48
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Frozen copies of the health.search helpers this backfill was written with
+def normalize_name(text):
+    chars = []
+    for ch in unicodedata.normalize('NFKD', (text or '').casefold()):
+        kind = unicodedata.category(ch)[0]
+        if kind == 'M':
+            if chars and chars[-1].isascii():
+                continue
+            chars.append(ch)
+        elif kind in 'LN':
+            chars.append(ch)
+        else:
+            chars.append(' ')
+    text = unicodedata.normalize('NFC', ''.join(chars))
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def normalize_phone(text):
+    return re.sub(r'\D+', '', text or '')
+
+
+def trigrams(text):
+    text, stop = text + '$$', len(text)
+    return {text[i:i + 3] for i in range(stop)}
+
+
+def backfill_search_terms(apps, schema_editor):
+    Patient = apps.get_model('health', 'Patient')
+    PatientSearchTerm = apps.get_model('health', 'PatientSearchTerm')
+    terms = []
+    for patient_id, name, phone in Patient.objects.values_list('id', 'name', 'phone').iterator():
+        terms += [PatientSearchTerm(patient_id=patient_id, field='n', term=g)
+                  for g in trigrams(normalize_name(name))]
+        terms += [PatientSearchTerm(patient_id=patient_id, field='p', term=g)
+                  for g in trigrams(normalize_phone(phone))]
+    PatientSearchTerm.objects.bulk_create(terms, batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health', '0021_patientlatestcheckup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(choices=[('n', 'Name'), ('p', 'Phone')], max_length=1)),
+                ('term', models.CharField(max_length=3)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='health.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['field', 'term'], name='health_search_field_term')],
+            },
+        ),
+        migrations.RunPython(backfill_search_terms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.3 on 2026-10-18 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health', '0022_patientsearchterm'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='checkup',
+            name='plan_revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
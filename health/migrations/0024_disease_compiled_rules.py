@@ -0,0 +1,84 @@
+# Generated by Django 6.0.3 on 2026-10-18 23:12
+
+import re
+
+from django.db import migrations, models
+
+
+# Frozen copy of health.engine.rules.compile_restrictions as of this migration
+NUTRIENT_FIELDS = (
+    'calories', 'protein', 'carbs', 'fat', 'fiber',
+    'sugar', 'sodium', 'potassium', 'calcium', 'phosphorus',
+)
+
+NUTRIENT_ALIASES = {
+    'calorie': 'calories', 'kcal': 'calories', 'energy': 'calories',
+    'proteins': 'protein', 'poteins': 'protein',
+    'carb': 'carbs', 'carbohydrate': 'carbs', 'carbohydrates': 'carbs',
+    'fats': 'fat', 'total fat': 'fat',
+    'fibre': 'fiber', 'dietary fiber': 'fiber',
+    'sugars': 'sugar', 'suagr': 'sugar', 'added sugar': 'sugar',
+    'added sugars': 'sugar', 'refined sugars': 'sugar',
+    'salt': 'sodium',
+    'calicum': 'calcium',
+    'phosphorous': 'phosphorus', 'phosphate': 'phosphorus',
+}
+
+RULE_KEYS = frozenset({'max', 'banned'})
+
+
+def canonical_nutrient(name):
+    key = re.sub(r'\s+', ' ', str(name).strip().lower())
+    if key in NUTRIENT_FIELDS:
+        return key
+    return NUTRIENT_ALIASES.get(key)
+
+
+def compile_restrictions(restricted_nutrients):
+    if not isinstance(restricted_nutrients, dict):
+        raise ValueError("restricted_nutrients must be an object of {nutrient: rule}.")
+    by_column = {}
+    for name, rule in restricted_nutrients.items():
+        if not isinstance(name, str) or not name.strip():
+            raise ValueError(f"Nutrient names must be non-empty strings, got {name!r}.")
+        if not isinstance(rule, dict):
+            raise ValueError(f"Rule for {name!r} must be an object, got {rule!r}.")
+        unknown = set(rule) - RULE_KEYS
+        if unknown:
+            raise ValueError(f"Rule for {name!r} has unknown keys: {', '.join(sorted(unknown))}.")
+        banned = rule.get('banned', False)
+        if not isinstance(banned, bool):
+            raise ValueError(f"'banned' for {name!r} must be true or false.")
+        limit = rule.get('max')
+        if limit is not None and (isinstance(limit, bool) or not isinstance(limit, (int, float))
+                                  or limit < 0):
+            raise ValueError(f"'max' for {name!r} must be a non-negative number or null.")
+
+        column = canonical_nutrient(name)
+        if column is not None:
+            by_column[NUTRIENT_FIELDS.index(column)] = [limit, banned]
+    return [[column, limit, banned] for column, (limit, banned) in sorted(by_column.items())]
+
+
+def compile_existing(apps, schema_editor):
+    Disease = apps.get_model('health', 'Disease')
+    diseases = list(Disease.objects.all())
+    for disease in diseases:
+        disease.compiled_rules = compile_restrictions(disease.restricted_nutrients)
+    Disease.objects.bulk_update(diseases, ['compiled_rules'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health', '0023_checkup_plan_revision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='disease',
+            name='compiled_rules',
+            field=models.JSONField(default=list, editable=False),
+        ),
+        migrations.RunPython(compile_existing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 6.0.3 on 2026-10-18 23:48
+
+from django.db import migrations, models
+
+
+# Frozen copy of engine.metrics at FORMULA_VERSION 1 — later formula changes
+# are picked up by Checkup.ensure_metrics, not by re-running this migration.
+def _metrics(weight, height, age, gender, activity):
+    bmi = round(weight / ((height / 100) ** 2), 2)
+    bmr = round(10 * weight + 6.25 * height - 5 * age + (-161 if gender.lower() == 'female' else 5), 2)
+    tdee = round(bmr * activity, 2)
+    if bmi < 18.5:
+        category, target = 'Underweight', tdee + 500
+    elif bmi < 25:
+        category, target = 'Normal', tdee
+    elif bmi < 30:
+        category, target = 'Overweight', tdee - 500
+    else:
+        category, target = 'Obese', tdee - 750
+    return bmi, bmr, tdee, category, int(max(target, 1200))
+
+
+def stamp_metrics(apps, schema_editor):
+    Checkup = apps.get_model('health', 'Checkup')
+    PatientLatestCheckup = apps.get_model('health', 'PatientLatestCheckup')
+    checkups = list(Checkup.objects.select_related('patient'))
+    for c in checkups:
+        c.bmi, c.bmr, c.tdee, c.category, c.target_calories = _metrics(
+            c.weight, c.height, c.age, c.patient.gender, c.activity)
+        c.protein_target = c.target_calories * 0.3 / 4
+        c.carbs_target   = c.target_calories * 0.4 / 4
+        c.fat_target     = c.target_calories * 0.3 / 9
+        c.metrics_version = 1
+    Checkup.objects.bulk_update(checkups, [
+        'bmi', 'bmr', 'tdee', 'category', 'target_calories',
+        'protein_target', 'carbs_target', 'fat_target', 'metrics_version',
+    ], batch_size=1000)
+
+    by_id = {c.id: c for c in checkups}
+    rows = list(PatientLatestCheckup.objects.all())
+    for row in rows:
+        row.bmi, row.category = by_id[row.checkup_id].bmi, by_id[row.checkup_id].category
+    PatientLatestCheckup.objects.bulk_update(rows, ['bmi', 'category'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health', '0024_disease_compiled_rules'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='checkup',
+            name='target_calories',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='checkup',
+            name='metrics_version',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='checkup',
+            name='plan_updated',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(stamp_metrics, migrations.RunPython.noop),
+    ]
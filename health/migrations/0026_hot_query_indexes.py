@@ -0,0 +1,33 @@
+# Generated by Django 6.0.3 on 2026-10-18 23:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health', '0025_checkup_metrics_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='assignedmeal',
+            index=models.Index(fields=['checkup', 'day'], name='health_meal_checkup_day'),
+        ),
+        migrations.AddIndex(
+            model_name='checkup',
+            index=models.Index(fields=['patient', 'date'], name='health_checkup_patient_date'),
+        ),
+        migrations.AddIndex(
+            model_name='checkup',
+            index=models.Index(fields=['date'], name='health_checkup_date'),
+        ),
+        migrations.AddIndex(
+            model_name='checkup',
+            index=models.Index(fields=['category'], name='health_checkup_category'),
+        ),
+        migrations.AddIndex(
+            model_name='fooditem',
+            index=models.Index(fields=['category', 'diet_type'], name='health_food_category_diet'),
+        ),
+    ]
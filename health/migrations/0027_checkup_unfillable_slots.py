@@ -0,0 +1,18 @@
+# Generated by Django 6.0.3 on 2026-10-19 00:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health', '0026_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='checkup',
+            name='unfillable_slots',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 6.0.3 on 2026-10-19 01:06
+
+import re
+import unicodedata
+
+from django.db import migrations
+
+
+# Frozen copies of the health.search helpers (non-Latin letters kept)
+def normalize_name(text):
+    chars = []
+    for ch in unicodedata.normalize('NFKD', (text or '').casefold()):
+        kind = unicodedata.category(ch)[0]
+        if kind == 'M':
+            if chars and chars[-1].isascii():
+                continue
+            chars.append(ch)
+        elif kind in 'LN':
+            chars.append(ch)
+        else:
+            chars.append(' ')
+    text = unicodedata.normalize('NFC', ''.join(chars))
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def trigrams(text):
+    text, stop = text + '$$', len(text)
+    return {text[i:i + 3] for i in range(stop)}
+
+
+def reindex_names(apps, schema_editor):
+    """Names with non-ASCII letters were indexed with those letters stripped."""
+    Patient = apps.get_model('health', 'Patient')
+    PatientSearchTerm = apps.get_model('health', 'PatientSearchTerm')
+    patients = [(pk, name) for pk, name in Patient.objects.values_list('id', 'name').iterator()
+                if not (name or '').isascii()]
+    for start in range(0, len(patients), 1000):
+        batch = patients[start:start + 1000]
+        PatientSearchTerm.objects.filter(patient_id__in=[pk for pk, _ in batch], field='n').delete()
+        PatientSearchTerm.objects.bulk_create([
+            PatientSearchTerm(patient_id=pk, field='n', term=g)
+            for pk, name in batch for g in trigrams(normalize_name(name))
+        ], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health', '0027_checkup_unfillable_slots'),
+    ]
+
+    operations = [
+        migrations.RunPython(reindex_names, migrations.RunPython.noop),
+    ]
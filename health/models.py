@@ -1,5 +1,9 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 
+from .engine.metrics import FORMULA_VERSION, calculate_metrics, macro_targets_g
+from .engine.rules import compile_restrictions
+
 
 # ──────────────────────────────────────────────────────────────────────────────
 # DISEASE CATALOG
@@ -20,10 +24,22 @@ class Disease(models.Model):
         default=dict,
         help_text='Format: {"sodium": {"banned": false, "max": 1500}, "sugar": {"banned": true}}'
     )
+    # [[nutrient column, max, banned], ...] — kept in step by health.signals
+    compiled_rules = models.JSONField(default=list, editable=False)
 
     def __str__(self):
         return self.name
 
+    def compile_rules(self):
+        """Validate restricted_nutrients and refresh compiled_rules (ValidationError if malformed)."""
+        try:
+            self.compiled_rules = compile_restrictions(self.restricted_nutrients)
+        except ValueError as exc:
+            raise ValidationError({'restricted_nutrients': str(exc)})
+
+    def clean(self):
+        self.compile_rules()
+
 
 # NutrientLimit is removed in favor of JSONField in Disease
 
@@ -42,6 +58,25 @@ class Patient(models.Model):
         return f"{self.name} ({self.phone})"
 
 
+class PatientSearchTerm(models.Model):
+    """
+    Trigram index over a patient's normalized name and phone digits.
+    Rebuilt by health.signals whenever a Patient is saved; see health.search.
+    """
+    NAME, PHONE = 'n', 'p'
+    FIELD_CHOICES = [(NAME, 'Name'), (PHONE, 'Phone')]
+
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='search_terms')
+    field   = models.CharField(max_length=1, choices=FIELD_CHOICES)
+    term    = models.CharField(max_length=3)
+
+    class Meta:
+        indexes = [models.Index(fields=['field', 'term'], name='health_search_field_term')]
+
+    def __str__(self):
+        return f"{self.patient_id}:{self.field}:{self.term}"
+
+
 class Checkup(models.Model):
     patient   = models.ForeignKey(Patient, on_delete=models.CASCADE)
     age       = models.IntegerField()
@@ -65,11 +100,14 @@ class Checkup(models.Model):
         help_text="Auto-synced comma-separated names from disease_links."
     )
 
-    # Computed Metrics
+    # Computed Metrics — stamped once by compute_metrics(), recomputed only
+    # when metrics_version falls behind engine.metrics.FORMULA_VERSION
     bmi      = models.FloatField()
     bmr      = models.FloatField()
     tdee     = models.FloatField()
     category = models.CharField(max_length=20)   # Underweight/Normal/Overweight/Obese
+    target_calories = models.IntegerField(default=0)
+    metrics_version = models.PositiveSmallIntegerField(default=0)
     blood_pressure = models.CharField(max_length=20, default="120/80")
 
     # Target Macros (Computed)
@@ -79,17 +117,117 @@ class Checkup(models.Model):
 
     date = models.DateField(auto_now_add=True)
 
-    def sync_diseases_text(self):
-        """Keep legacy diseases CharField in sync with M2M disease_links."""
-        self.diseases = ", ".join(
-            self.disease_links.values_list('name', flat=True).order_by('name')
-        )
+    # Bumped by regenerate_plan; part of the plan's variety seed
+    plan_revision = models.PositiveIntegerField(default=0)
+    # Set by health.plans whenever the plan rows are (re)written
+    plan_updated  = models.DateTimeField(null=True, blank=True)
+    # Day × meal slots the generator found no food for at that write; they
+    # count as complete, so such a plan is not regenerated on every view
+    unfillable_slots = models.PositiveSmallIntegerField(default=0)
+
+    METRIC_FIELDS = ['bmi', 'bmr', 'tdee', 'category', 'target_calories',
+                     'protein_target', 'carbs_target', 'fat_target', 'metrics_version']
+
+    class Meta:
+        # Checked by `manage.py explain_hot_queries`
+        indexes = [
+            # history / latest-per-patient / directory range subquery (InnoDB appends id)
+            models.Index(fields=['patient', 'date'], name='health_checkup_patient_date'),
+            # dashboard visit series, today's count, recent activity
+            models.Index(fields=['date'], name='health_checkup_date'),
+            models.Index(fields=['category'], name='health_checkup_category'),
+        ]
+
+    def compute_metrics(self, gender):
+        """Fill the computed metric and macro fields from the measurements (no save)."""
+        metrics = calculate_metrics(self.weight, self.height, self.age, gender, self.activity)
+        self.bmi, self.bmr, self.tdee, self.category, self.target_calories = metrics
+        self.protein_target, self.carbs_target, self.fat_target = macro_targets_g(metrics.target_calories)
+        self.metrics_version = FORMULA_VERSION
+        return metrics
+
+    def ensure_metrics(self):
+        """
+        Recompute and save the metrics if stamped by an older formula. Returns
+        True if saved. Saved through post_save, so the latest-checkup
+        projection, the report history stamp and the dashboard follow.
+        """
+        if self.metrics_version == FORMULA_VERSION:
+            return False
+        self.compute_metrics(self.patient.gender)
+        self.save(update_fields=self.METRIC_FIELDS)
+        return True
+
+    def sync_diseases_text(self, names=None):
+        """
+        Keep legacy diseases CharField in sync with M2M disease_links.
+        Pass the already-sorted linked `names` to skip re-reading the M2M.
+        """
+        if names is None:
+            names = self.disease_links.values_list('name', flat=True).order_by('name')
+        self.diseases = ", ".join(names)
         Checkup.objects.filter(pk=self.pk).update(diseases=self.diseases)
 
     def __str__(self):
         return f"{self.patient.name} — {self.date}"
 
 
+# ──────────────────────────────────────────────────────────────────────────────
+# LATEST CHECKUP PROJECTION (denormalized, maintained by signals)
+# ──────────────────────────────────────────────────────────────────────────────
+
+class PatientLatestCheckup(models.Model):
+    """
+    One row per patient mirroring their most recent Checkup (by date, then id)
+    plus a running visit count. Kept current by health.signals on every
+    Checkup create/delete; rebuild with `manage.py rebuild_latest_checkups`.
+    """
+    patient     = models.OneToOneField(
+        Patient, on_delete=models.CASCADE, primary_key=True, related_name='latest'
+    )
+    checkup     = models.ForeignKey(Checkup, on_delete=models.CASCADE, related_name='+')
+    date        = models.DateField()
+    bmi         = models.FloatField()
+    category    = models.CharField(max_length=20, db_index=True)
+    visit_count = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def refresh(cls, patient_id):
+        """
+        Recompute the projection row for one patient from the Checkup table.
+        Uses the (patient, date) lookups only — O(1) in the number of patients.
+
+        Call inside a transaction. The patient row is locked first, so two
+        refreshes for one patient run one after the other, and the checkups
+        are read with a locking read: under REPEATABLE READ a plain SELECT
+        could still see the snapshot from before the other refresh committed.
+        """
+        checkups = []
+        if Patient.objects.select_for_update().filter(pk=patient_id).exists():
+            checkups = list(
+                Checkup.objects.select_for_update().filter(patient_id=patient_id)
+                .order_by('-date', '-id').values_list('id', 'date', 'bmi', 'category')
+            )
+        if not checkups:
+            cls.objects.filter(patient_id=patient_id).delete()
+            return None
+        checkup_id, date, bmi, category = checkups[0]
+        row, _ = cls.objects.update_or_create(
+            patient_id=patient_id,
+            defaults={
+                'checkup_id':  checkup_id,
+                'date':        date,
+                'bmi':         bmi,
+                'category':    category,
+                'visit_count': len(checkups),
+            },
+        )
+        return row
+
+    def __str__(self):
+        return f"{self.patient_id} → {self.checkup_id} ({self.category})"
+
+
 # ──────────────────────────────────────────────────────────────────────────────
 # FOOD CATALOG
 # ──────────────────────────────────────────────────────────────────────────────
@@ -125,6 +263,10 @@ class FoodItem(models.Model):
     unit_name    = models.CharField(max_length=20, default="Serving")
     serving_desc = models.CharField(max_length=50, default="1 Serving")
 
+    class Meta:
+        # ORM pool filter: category = … AND diet_type IN (…)
+        indexes = [models.Index(fields=['category', 'diet_type'], name='health_food_category_diet')]
+
     def save(self, *args, **kwargs):
         # Professional Validation: Prevent negative values
         for field in ['calories', 'protein', 'carbs', 'fat', 'sugar', 'fiber', 'sodium']:
@@ -150,5 +292,8 @@ class AssignedMeal(models.Model):
     quantity_text  = models.CharField(max_length=50)   # e.g. "250 g"
     total_calories = models.IntegerField()
 
+    class Meta:
+        indexes = [models.Index(fields=['checkup', 'day'], name='health_meal_checkup_day')]
+
     def __str__(self):
         return f"{self.checkup.patient.name} — {self.day} — {self.meal_type}"
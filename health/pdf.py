@@ -0,0 +1,277 @@
+"""
+PDF render pipeline for `download_pdf`.
+
+    context ──► content key ──► on-disk cache hit?  ──yes──► PDF bytes (+ETag)
+                                      │ no
+                                      ▼
+                          worker pool renders with xhtml2pdf
+                          (single-flight per key), file written atomically
+
+The content key hashes everything that can change the document: the template
+context (plan rows, metrics, patient fields, dietitian) and the template source
+itself. Files live at
+
+    <HEALTH_PDF_CACHE_DIR>/<checkup_id>/<generation>-<key>.pdf
+
+where the generation hashes the template, the 'pdf' namespace version of the
+tiered cache (health.cache) and the plan write. Writing a file removes only
+siblings of an older generation — each dietitian's copy of the current plan
+is kept — and a checkup's directory is dropped whenever health.plans
+rewrites its meals; `PDFS.invalidate()` retires every stored PDF at once.
+File hits and misses are counted under the 'pdf' namespace. Callers get the
+bytes, never a path, so a concurrent cleanup cannot pull a file from under a
+response.
+
+Rendering runs on a local pool — no broker — sized by HEALTH_PDF_WORKERS.
+HEALTH_PDF_EXECUTOR selects 'thread' (default) or 'process'. A download waits
+at most HEALTH_PDF_WAIT seconds for its render; past that it gets a 202 with
+Retry-After while the render finishes into the cache. Plan writes queue a
+render up front (`prerender`), so most downloads are file hits.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from concurrent.futures import TimeoutError as FutureTimeout
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Model
+from django.http import FileResponse, HttpResponse
+from django.template.loader import get_template
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from xhtml2pdf import pisa
+
+from .cache import namespace, stats as cache_stats
+
+
+TEMPLATE_NAME = 'pdf_report.html'
+PDFS          = namespace('pdf')
+
+
+class PdfRenderError(Exception):
+    """xhtml2pdf reported errors; `html` holds the source that failed."""
+
+    def __init__(self, html):
+        super().__init__(html)   # single arg keeps it picklable across processes
+        self.html = html
+
+    def __str__(self):
+        return "PDF rendering failed"
+
+
+class PdfPending(Exception):
+    """The render did not finish within the wait; it completes into the cache."""
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# KEYS & PATHS
+# ──────────────────────────────────────────────────────────────────────────────
+
+@lru_cache(maxsize=None)
+def template_version(name=TEMPLATE_NAME):
+    """Short hash of the template source — edits to the layout bust the cache."""
+    source = get_template(name).template.source
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()[:12]
+
+
+def _jsonable(value):
+    if isinstance(value, Model):
+        # Column values only: model_to_dict would also read every M2M relation
+        return [value._meta.label,
+                {f.attname: getattr(value, f.attname) for f in value._meta.concrete_fields}]
+    return str(value)
+
+
+def content_key(context):
+    """Stable hash of the render inputs plus the template and namespace versions."""
+    payload = json.dumps(context, default=_jsonable, sort_keys=True)
+    digest = hashlib.sha256(f"{template_version()}|{PDFS.version()}|{payload}".encode('utf-8'))
+    return digest.hexdigest()[:32]
+
+
+def cache_dir(checkup_id):
+    return Path(settings.HEALTH_PDF_CACHE_DIR) / str(checkup_id)
+
+
+def generation(context):
+    """Short hash of what retires every copy of a checkup's PDF: template, namespace, plan write."""
+    checkup = context.get('checkup')
+    stamp = f"{template_version()}|{PDFS.version()}|{getattr(checkup, 'plan_updated', None)}"
+    return hashlib.sha1(stamp.encode('utf-8')).hexdigest()[:8]
+
+
+def cache_path(checkup_id, key, context):
+    return cache_dir(checkup_id) / f"{generation(context)}-{key}.pdf"
+
+
+def invalidate(checkup_id):
+    """Drop every cached PDF for a checkup."""
+    shutil.rmtree(cache_dir(checkup_id), ignore_errors=True)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# RENDERING
+# ──────────────────────────────────────────────────────────────────────────────
+
+def render_pdf_bytes(html):
+    """HTML → PDF bytes. Module-level so process pools can pickle it."""
+    buffer = BytesIO()
+    status = pisa.CreatePDF(html, dest=buffer)
+    if status.err:
+        raise PdfRenderError(html)
+    return buffer.getvalue()
+
+
+def render_html(context):
+    return get_template(TEMPLATE_NAME).render(context)
+
+
+def _write_atomically(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.part')
+    with os.fdopen(fd, 'wb') as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+    # Files of an older generation can never be requested again; other keys of
+    # this one (another dietitian's copy) still can
+    current = path.name.partition('-')[0]
+    for sibling in path.parent.glob('*.pdf'):
+        if sibling.name.partition('-')[0] != current:
+            sibling.unlink(missing_ok=True)
+
+
+_executor = None
+_inflight = {}
+_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                workers = getattr(settings, 'HEALTH_PDF_WORKERS', 2)
+                if getattr(settings, 'HEALTH_PDF_EXECUTOR', 'thread') == 'process':
+                    _executor = ProcessPoolExecutor(max_workers=workers)
+                else:
+                    _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pdf')
+    return _executor
+
+
+def submit(checkup_id, context, reuse=True):
+    """
+    Queue a render unless the file is cached (`reuse`) or already being
+    rendered. Returns (path, key, future-or-None).
+    """
+    key = content_key(context)
+    path = cache_path(checkup_id, key, context)
+    if reuse and path.exists():
+        cache_stats.record(PDFS.name, 'l2_hits')
+        return path, key, None
+    cache_stats.record(PDFS.name, 'misses')
+
+    with _lock:
+        future = _inflight.get(path)
+    if future is None:
+        html = render_html(context)
+        executor = get_executor()
+        with _lock:
+            future = _inflight.get(path)
+            if future is None:
+                future = executor.submit(render_pdf_bytes, html)
+                _inflight[path] = future
+                future.add_done_callback(lambda f, p=path: _finish(p, f))
+    return path, key, future
+
+
+def _finish(path, future):
+    try:
+        if future.exception() is None:
+            _write_atomically(path, future.result())
+    finally:
+        with _lock:
+            _inflight.pop(path, None)
+
+
+def _read(path):
+    """(bytes, mtime) of a cached file; FileNotFoundError if it was removed meanwhile."""
+    with open(path, 'rb') as fh:
+        return fh.read(), os.fstat(fh.fileno()).st_mtime
+
+
+def get_or_render(checkup_id, context, timeout=None):
+    """
+    (bytes, key, modified) of the PDF, from the cache or rendered on the pool.
+    Raises PdfPending when the render takes longer than `timeout` seconds.
+    """
+    path, key, future = submit(checkup_id, context)
+    if future is None:
+        try:
+            data, modified = _read(path)
+            return data, key, modified
+        except FileNotFoundError:           # removed since the check: render it again
+            path, key, future = submit(checkup_id, context, reuse=False)
+    try:
+        data = future.result(timeout=timeout)   # re-raises PdfRenderError
+    except FutureTimeout:
+        raise PdfPending(key) from None
+    return data, key, time.time()            # the done-callback stores the file
+
+
+def prerender(checkup_id, context):
+    """Fire-and-forget warm-up of the cache (e.g. after plan generation)."""
+    return submit(checkup_id, context)[2]
+
+
+def drain(timeout=10):
+    """Wait until no render is in flight and every finished one is on disk. True if idle."""
+    deadline = time.monotonic() + timeout
+    while True:
+        with _lock:
+            pending = list(_inflight.values())
+        if not pending:
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        wait_futures(pending, timeout=max(deadline - time.monotonic(), 0))
+        time.sleep(0.01)                    # let the done-callbacks write and drop their entries
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# HTTP
+# ──────────────────────────────────────────────────────────────────────────────
+
+def pdf_response(request, checkup_id, context, filename):
+    """
+    Serve the cached PDF with ETag/Last-Modified, 304 when unchanged, or 202
+    with Retry-After while a slow render is still running.
+    """
+    try:
+        data, key, modified = get_or_render(checkup_id, context,
+                                            timeout=getattr(settings, 'HEALTH_PDF_WAIT', 10))
+    except PdfPending:
+        response = HttpResponse("The PDF is still rendering — retry in a few seconds.",
+                                status=202, content_type='text/plain; charset=utf-8')
+        response['Retry-After'] = str(getattr(settings, 'HEALTH_PDF_RETRY_AFTER', 3))
+        return response
+    etag = quote_etag(key)
+    last_modified = int(modified)
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    response = FileResponse(BytesIO(data), as_attachment=True, filename=filename,
+                            content_type='application/pdf')
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
@@ -0,0 +1,223 @@
+"""
+Plan persistence and retrieval — all AssignedMeal reads and writes for a
+checkup go through here.
+
+A weekly plan is written as one `bulk_create` inside `transaction.atomic`,
+with the parent Checkup row locked (`SELECT … FOR UPDATE`) for the duration.
+That turns 21–28 INSERT round-trips into one, makes delete-then-regenerate an
+atomic swap, and serialises concurrent report loads for the same checkup:
+the second request blocks on the lock, then finds the completed plan and
+writes nothing.
+
+A plan is complete when every day × meal slot has at least one row; a slot
+may hold several foods when the meal composer (health.engine.composer) picks
+companions, so completeness is counted in distinct (day, meal_type) slots.
+Slots the generator could not fill (no food passes the restrictions) are
+recorded in Checkup.unfillable_slots by the row builder and count as filled.
+
+Reads use `load_plan`, which fetches the whole week (food rows joined) in a
+single query and derives every view's per-day lists, nutrient totals and
+shopping list from it in Python.
+"""
+from collections import Counter
+from dataclasses import dataclass, field
+
+from django.db import transaction
+from django.utils import timezone
+
+from .engine import DAYS
+from .models import Checkup, AssignedMeal
+from . import pdf
+
+
+BULK_BATCH_SIZE = 2000
+
+
+def _lock_checkup(checkup):
+    """
+    Take the per-checkup write lock (no-op on backends without row locks) and
+    re-read the unfillable slot count under it.
+    """
+    locked = Checkup.objects.select_for_update().filter(pk=checkup.pk)
+    for unfillable in locked.values_list('unfillable_slots', flat=True):
+        checkup.unfillable_slots = unfillable
+
+
+def _mark_updated(checkups):
+    """
+    Stamp Checkup.plan_updated (the report's Last-Modified and plan fragment
+    version) and store the unfillable slot count the row builder left on each.
+    """
+    now = timezone.now()
+    by_unfillable = {}
+    for checkup in checkups:
+        checkup.plan_updated = now
+        by_unfillable.setdefault(checkup.unfillable_slots, []).append(checkup.pk)
+    for unfillable, pks in by_unfillable.items():
+        Checkup.objects.filter(pk__in=pks).update(plan_updated=now, unfillable_slots=unfillable)
+
+
+def _write(checkup, build_rows):
+    rows = list(build_rows())
+    for row in rows:
+        row.checkup_id = checkup.pk
+    AssignedMeal.objects.bulk_create(rows)
+    _mark_updated([checkup])
+    transaction.on_commit(lambda: pdf.invalidate(checkup.pk))   # cached PDFs show the old plan
+    return rows
+
+
+def slot_count(meals):
+    """Distinct (day, meal_type) slots filled in an AssignedMeal queryset."""
+    return meals.values('day', 'meal_type').distinct().count()
+
+
+def ensure_plan(checkup, expected_count, build_rows):
+    """
+    Make sure `checkup` has exactly `expected_count` filled meal slots.
+    Incomplete or mismatched plans are replaced atomically with `build_rows()`
+    (an iterable of unsaved AssignedMeal instances). Returns True if written.
+    """
+    meals = AssignedMeal.objects.filter(checkup=checkup)
+    if slot_count(meals) + checkup.unfillable_slots == expected_count:
+        return False
+
+    with transaction.atomic():
+        _lock_checkup(checkup)
+        existing = slot_count(meals)          # re-check under the lock
+        if existing + checkup.unfillable_slots == expected_count:
+            return False
+        if existing:
+            meals.delete()
+        _write(checkup, build_rows)
+    return True
+
+
+def ensure_plans(checkups, expected_count, build_rows):
+    """
+    Batch form of `ensure_plan`: one lock, one count, one delete and one
+    batched INSERT for the whole set. `expected_count(checkup)` and
+    `build_rows(checkup)` are called per checkup. Returns the checkups written.
+    """
+    by_id = {c.pk: c for c in checkups}
+    if not by_id:
+        return []
+
+    with transaction.atomic():
+        unfillable = dict(
+            Checkup.objects.select_for_update().filter(pk__in=by_id)
+            .values_list('pk', 'unfillable_slots')
+        )
+        counts = Counter(
+            checkup_id for checkup_id, _, _ in
+            AssignedMeal.objects.filter(checkup_id__in=by_id)
+            .values_list('checkup_id', 'day', 'meal_type').distinct()
+        )
+        stale = [c for pk, c in by_id.items()
+                 if counts.get(pk, 0) + unfillable.get(pk, 0) != expected_count(c)]
+        if not stale:
+            return []
+
+        partial = [c.pk for c in stale if counts.get(c.pk)]
+        if partial:
+            AssignedMeal.objects.filter(checkup_id__in=partial).delete()
+
+        rows = []
+        for checkup in stale:
+            for row in build_rows(checkup):
+                row.checkup_id = checkup.pk
+                rows.append(row)
+        AssignedMeal.objects.bulk_create(rows, batch_size=BULK_BATCH_SIZE)
+        _mark_updated(stale)
+        transaction.on_commit(lambda: [pdf.invalidate(pk) for pk in partial])
+    return stale
+
+
+def replace_plan(checkup, build_rows):
+    """Atomically swap the checkup's plan for freshly built rows."""
+    with transaction.atomic():
+        _lock_checkup(checkup)
+        AssignedMeal.objects.filter(checkup=checkup).delete()
+        return _write(checkup, build_rows)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# RETRIEVAL
+# ──────────────────────────────────────────────────────────────────────────────
+
+@dataclass
+class WeeklyPlan:
+    weekly_plan:   dict = field(default_factory=dict)   # day → [{'meal', 'cal', 'items': [{'food','qty','cal','p','c','f'}]}]
+    weekly_totals: dict = field(default_factory=dict)   # portion-scaled sums over the week
+    shopping_list: dict = field(default_factory=dict)   # food name → {'qty','unit','cat'}
+    meal_count:    int = 0                               # AssignedMeal rows
+    slot_count:    int = 0                               # distinct day × meal slots
+
+    @property
+    def daily_avg(self):
+        return {k: round(v / 7, 1) for k, v in self.weekly_totals.items()}
+
+    @property
+    def total_calories(self):
+        return self.weekly_totals.get('cal', 0)
+
+
+def portion_grams(quantity_text):
+    """Extract numeric grams from text like "250 g"; 100 g if unparseable."""
+    try:
+        return float(quantity_text.split()[0])
+    except (ValueError, IndexError):
+        return 100.0  # safe fallback
+
+
+def load_plan(checkup):
+    """
+    One query: every AssignedMeal for the checkup with its FoodItem joined,
+    grouped by day (Monday → Sunday) and meal slot (insertion order) — one
+    entry per slot, listing the 1–3 foods the composer put in it, so every
+    day has one column per meal.
+    """
+    meals = (
+        AssignedMeal.objects
+        .filter(checkup=checkup)
+        .select_related('food_item')
+        .order_by('id')
+    )
+
+    plan = WeeklyPlan(weekly_plan={day: [] for day in DAYS})
+    totals = {'cal': 0, 'p': 0, 'c': 0, 'f': 0, 'fiber': 0, 'sugar': 0}
+    slots = {}                                  # (day, meal_type) → slot dict
+
+    for m in meals:
+        fi = m.food_item
+        plan.meal_count += 1
+        slot = slots.get((m.day, m.meal_type))
+        if slot is None:
+            slot = slots[(m.day, m.meal_type)] = {'meal': m.meal_type, 'cal': 0, 'items': []}
+            plan.weekly_plan.setdefault(m.day, []).append(slot)
+        slot['cal'] += m.total_calories
+        slot['items'].append({
+            'food': fi.name,
+            'qty': m.quantity_text,
+            'cal': m.total_calories,
+            'p': fi.protein, 'c': fi.carbs, 'f': fi.fat
+        })
+
+        # Scale per-100g nutrient values to the real portion
+        scale = portion_grams(m.quantity_text) / 100.0
+        totals['cal']   += m.total_calories              # already portion-adjusted
+        totals['p']     += round(fi.protein * scale, 2)
+        totals['c']     += round(fi.carbs   * scale, 2)
+        totals['f']     += round(fi.fat     * scale, 2)
+        totals['fiber'] += round(fi.fiber   * scale, 2)
+        totals['sugar'] += round(fi.sugar   * scale, 2)
+
+        entry = plan.shopping_list.get(fi.name)
+        if entry:
+            entry['qty'] += 1
+        else:
+            plan.shopping_list[fi.name] = {'qty': 1, 'unit': fi.unit_name, 'cat': fi.category}
+
+    plan.weekly_totals = totals
+    plan.slot_count = len(slots)
+    return plan
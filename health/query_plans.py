@@ -0,0 +1,168 @@
+"""
+EXPLAIN checks for the hot lookups behind home, patients, existing_patient,
+smart_filter and the report view.
+
+    manage.py explain_hot_queries            # plan + verdict per query
+    manage.py explain_hot_queries --strict   # exit non-zero on any finding
+
+Each HotQuery builds the same queryset its view issues (for a sample patient
+and checkup, or placeholder ids on an empty database) and runs the backend's
+EXPLAIN on it. Plans are scanned for two findings:
+
+    scan   the table is read in full   (MySQL type=ALL, SQLite "SCAN t",
+                                        PostgreSQL "Seq Scan")
+    sort   rows are sorted after the read (MySQL "Using filesort",
+                                        SQLite "TEMP B-TREE", PostgreSQL "Sort")
+
+A query may list findings it `allows` — the BMI histogram reads every
+latest-checkup row by design — those are reported but never fail the check.
+Tiny tables may still be scanned by a cost-based planner; run it against a
+database with production-sized tables for a meaningful answer.
+"""
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import Avg, Count
+from django.utils import timezone
+
+from .directory import filtered_patients, since_for_range
+from .engine.rules import allowed_diet_types, db_category
+from .models import AssignedMeal, Checkup, FoodItem, Patient, PatientLatestCheckup
+
+
+@dataclass
+class HotQuery:
+    view:   str
+    name:   str
+    build:  object          # callable(sample) → QuerySet
+    allows: tuple = ()      # findings expected by design
+
+
+@dataclass
+class Sample:
+    patient_id: int
+    checkup_id: int
+    phone:      str
+    today:      object
+
+
+def sample():
+    """Ids the queries are planned for: the newest checkup, or placeholders."""
+    row = Checkup.objects.order_by('-id').values_list('id', 'patient_id', 'patient__phone').first()
+    checkup_id, patient_id, phone = row or (1, 1, '0000000000')
+    return Sample(patient_id, checkup_id, phone, timezone.localdate())
+
+
+def _visit_series(s):
+    start = s.today - timedelta(days=29)
+    return (Checkup.objects.filter(date__gte=start, date__lte=s.today)
+            .values_list('date').annotate(n=Count('id')).order_by())
+
+
+def _orm_pool(s):
+    return (FoodItem.objects
+            .filter(category=db_category('Lunch'), diet_type__in=allowed_diet_types('Veg'))
+            .order_by('id'))
+
+
+HOT_QUERIES = [
+    # home — health.dashboard
+    HotQuery('home', 'bmi histogram',
+             lambda s: PatientLatestCheckup.objects.values('category')
+             .annotate(n=Count('pk'), avg=Avg('bmi')).order_by(), allows=('scan',)),
+    HotQuery('home', 'visit series (30 days)', _visit_series),
+    HotQuery('home', "today's visits", lambda s: Checkup.objects.filter(date=s.today)),
+    HotQuery('home', 'recent activity',
+             lambda s: Checkup.objects.select_related('patient').order_by('-date', '-id')[:6]),
+
+    # patients — health.directory; the page walks the primary key newest-first
+    # and stops after one page, a category page sorts only that category's rows
+    HotQuery('patients', 'directory page',
+             lambda s: filtered_patients().order_by('-id')[:25], allows=('scan',)),
+    HotQuery('patients', 'directory by BMI category',
+             lambda s: filtered_patients(bmi_filter='Obese').order_by('-id')[:25], allows=('sort',)),
+    HotQuery('patients', 'newest checkup in range',
+             lambda s: Checkup.objects.filter(patient_id=s.patient_id,
+                                              date__gte=since_for_range('month', s.today))
+             .order_by('-date', '-id')[:1]),
+
+    # existing_patient
+    HotQuery('existing_patient', 'patient by phone', lambda s: Patient.objects.filter(phone=s.phone)),
+    HotQuery('existing_patient', 'visit history',
+             lambda s: Checkup.objects.filter(patient_id=s.patient_id).order_by('-date')),
+    HotQuery('existing_patient', 'latest checkup',
+             lambda s: Checkup.objects.filter(patient_id=s.patient_id).order_by('-date', '-id')[:1]),
+
+    # smart_filter — health.filters.orm_pool; one category pool is a few dozen rows
+    HotQuery('smart_filter', 'food pool', _orm_pool, allows=('sort',)),
+
+    # report — generate_dynamic_diet_plan
+    HotQuery('report', 'checkup',
+             lambda s: Checkup.objects.select_related('patient')
+             .filter(id=s.checkup_id, patient_id=s.patient_id)),
+    HotQuery('report', 'plan rows',
+             lambda s: AssignedMeal.objects.filter(checkup_id=s.checkup_id)
+             .select_related('food_item').order_by('id')),
+    HotQuery('report', 'analytics series',
+             lambda s: Checkup.objects.filter(patient_id=s.patient_id).order_by('date')),
+]
+
+
+def explain(queryset):
+    """The backend's EXPLAIN rows for `queryset`, as dicts keyed by column name."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}", params)
+        columns = [col[0].lower() for col in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def findings(rows, vendor=None):
+    """{'scan', 'sort'} ∩ what the plan rows show."""
+    vendor = vendor or connection.vendor
+    found = set()
+    for row in rows:
+        if vendor == 'mysql':
+            extra = str(row.get('extra') or '')
+            if str(row.get('type')).upper() == 'ALL':
+                found.add('scan')
+            if 'filesort' in extra:
+                found.add('sort')
+        elif vendor == 'sqlite':
+            detail = str(row.get('detail', ''))
+            if detail.startswith('SCAN ') and ' INDEX ' not in detail:
+                found.add('scan')
+            if 'TEMP B-TREE' in detail:
+                found.add('sort')
+        else:
+            line = ' '.join(str(v) for v in row.values())
+            if 'Seq Scan' in line:
+                found.add('scan')
+            if 'Sort' in line:
+                found.add('sort')
+    return found
+
+
+def plan_text(rows, vendor=None):
+    vendor = vendor or connection.vendor
+    if vendor == 'sqlite':
+        return [str(row.get('detail', '')) for row in rows]
+    if vendor == 'mysql':
+        return [f"{row.get('table')}: type={row.get('type')} key={row.get('key')} "
+                f"rows={row.get('rows')} {row.get('extra') or ''}".rstrip() for row in rows]
+    return [' '.join(str(v) for v in row.values()) for row in rows]
+
+
+def check(queries=HOT_QUERIES, views=None):
+    """[(query, plan lines, unexpected findings, allowed findings)] for every hot query."""
+    s = sample()
+    results = []
+    for query in queries:
+        if views and query.view not in views:
+            continue
+        rows = explain(query.build(s))
+        found = findings(rows)
+        allowed = found & set(query.allows)
+        results.append((query, plan_text(rows), found - allowed, allowed))
+    return results
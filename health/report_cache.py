@@ -0,0 +1,147 @@
+"""
+Versioned fragment cache for the patient report page.
+
+patient_report.html wraps its heavy, data-driven parts in
+`{% report_fragment "<name>" %}…{% endreport_fragment %}` (see
+health.templatetags.report_cache). Each fragment is cached under the version
+stamps of exactly the data it shows:
+
+    plan_table · wa_plan · plan   checkup id, plan version, food catalog version
+    history · analytics ·         patient id, history stamp, checkup id
+    analytics_data
+    wa_link                       both of the above
+
+plus the template and metric-formula versions. The plan version is read off
+the Checkup row (plan_revision, plan_updated — stamped by health.plans on
+every write, so regenerate_plan and backfills move it). The history stamp is
+a uuid in Django's cache, re-minted on commit by health.signals on Checkup
+save/delete (new checkups, delete_checkup) and Patient save/delete. Food
+catalog edits move the catalog version. A stale entry is never read again
+and simply expires. All keys live in the 'report' namespace of the tiered
+cache (health.cache), so `REPORT.invalidate()` retires every fragment.
+
+`plan` caches the loaded WeeklyPlan itself, so a repeat view needs neither
+the AssignedMeal query nor the generator. Hits and misses are counted per
+fragment (`stats.snapshot()`, served with views.metrics_json); concurrent
+misses on one fragment render it once (single flight).
+"""
+import hashlib
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from . import catalog
+from .cache import namespace
+from .pdf import template_version
+
+
+REPORT   = namespace('report')
+TEMPLATE = 'patient_report.html'
+
+# Which version stamps each fragment depends on
+FRAGMENTS = {
+    'plan':           ('plan',),
+    'plan_table':     ('plan',),
+    'wa_plan':        ('plan',),
+    'history':        ('history',),
+    'analytics':      ('history',),
+    'analytics_data': ('history',),
+    'wa_link':        ('plan', 'history'),
+}
+
+
+class FragmentStats:
+    """Hit/miss counters per fragment name, safe to update from any thread."""
+
+    def __init__(self):
+        self.counts = {}
+        self._lock  = threading.Lock()
+
+    def record(self, name, hit):
+        with self._lock:
+            counts = self.counts.setdefault(name, [0, 0])
+            counts[0 if hit else 1] += 1
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+
+    def snapshot(self):
+        with self._lock:
+            items = sorted(self.counts.items())
+        report = {}
+        for name, (hits, misses) in items:
+            total = hits + misses
+            report[name] = {
+                'hits':     hits,
+                'misses':   misses,
+                'hit_rate': round(hits / total, 4) if total else 0.0,
+            }
+        return report
+
+
+stats = FragmentStats()
+
+
+def _history_key(patient_id):
+    return REPORT.key('history', patient_id)
+
+
+def _history_stamp():
+    """'<unix time>:<random>' — unique, and tells the report when the history last moved."""
+    return f"{time.time():.6f}:{uuid.uuid4().hex[:12]}"
+
+
+def stamp_time(stamp):
+    """Unix time a history stamp was minted (now, for stamps without one)."""
+    try:
+        return float(stamp.partition(':')[0])
+    except ValueError:
+        return time.time()
+
+
+def bump_history(patient_id):
+    """Retire a patient's history/analytics fragments once the transaction commits."""
+    transaction.on_commit(
+        lambda: cache.set(_history_key(patient_id), _history_stamp(), timeout=None)
+    )
+
+
+class ReportVersions:
+    """Version stamps for one report view, fetched once and shared by its fragments."""
+
+    def __init__(self, checkup):
+        self.checkup_id = checkup.pk
+        self.patient_id = checkup.patient_id
+        updated = checkup.plan_updated.isoformat() if checkup.plan_updated else None
+        self.stamps = {
+            'plan':    (checkup.plan_revision, updated),
+            'history': cache.get_or_set(_history_key(checkup.patient_id), _history_stamp,
+                                        timeout=None),
+        }
+        self.base = (checkup.metrics_version, catalog.current_version(), template_version(TEMPLATE))
+        # Newest of the plan write and the last history/patient change
+        plan_time = checkup.plan_updated.timestamp() if checkup.plan_updated else 0
+        self.last_modified = int(max(plan_time, stamp_time(self.stamps['history'])))
+
+    def key(self, name):
+        parts = [name, self.checkup_id, self.patient_id, *self.base]
+        parts += [self.stamps[kind] for kind in FRAGMENTS[name]]
+        return REPORT.key('fragment', name, hashlib.sha1(repr(parts).encode('utf-8')).hexdigest())
+
+    def get_or_build(self, name, build):
+        """Cached value for fragment `name`, or `build()` stored under the current versions."""
+        built = []
+
+        def miss():
+            built.append(True)
+            return build()
+
+        value = cache.get_or_set(self.key(name), miss,
+                                 timeout=getattr(settings, 'HEALTH_REPORT_CACHE_TIMEOUT', 86400))
+        stats.record(name, not built)
+        return value
@@ -0,0 +1,161 @@
+"""
+Memoised disease-restriction resolver.
+
+Merging `Disease.restricted_nutrients` by priority is a pure function of the
+set of linked diseases, and clinics see the same comorbidity combinations
+(diabetes + hypertension, CKD + diabetes, …) over and over. The resolver
+caches the merged dict under a canonical fingerprint
+
+    (sorted disease ids, disease-table version)
+
+in a bounded LRU. Any Disease save/delete moves the version (see
+health.signals), so stale merges are never served; the version stamp is
+the 'restrictions' namespace version in the tiered cache (health.cache), so
+all workers agree through its shared L2.
+
+A merge is a read-only `Restrictions` mapping (the raw names, for display)
+carrying `.rules`: the diseases' precompiled `compiled_rules` merged into
+health.engine.rules.Rule tuples, which the filter engines and the daily
+budget consume without looking at the JSON again.
+"""
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from types import MappingProxyType
+
+from django.conf import settings
+
+from .cache import namespace
+from .engine.rules import merge_rules
+from .models import Checkup, Disease
+
+
+RESTRICTIONS = namespace('restrictions')
+VERSION_KEY  = RESTRICTIONS.version_key
+
+
+def merge_restrictions(diseases):
+    """
+    Merge rules from diseases ordered by priority asc.
+    Higher-priority disease overwrites lower ones on conflicts.
+    Returns a dict: { nutrient: {'max': max_daily_g, 'banned': is_banned} }
+    """
+    restrictions = {}
+    for disease in diseases:
+        for nutrient, rule in disease.restricted_nutrients.items():
+            restrictions[nutrient] = {
+                'max': rule.get('max'),
+                'banned': rule.get('banned', False)
+            }
+    return restrictions
+
+
+class Restrictions(Mapping):
+    """Read-only merged {nutrient: rule} plus its compiled `rules`, safe to share."""
+
+    __slots__ = ('_data', 'rules')
+
+    def __init__(self, restrictions, rules):
+        self._data = MappingProxyType({k: MappingProxyType(v) for k, v in restrictions.items()})
+        self.rules = rules
+
+    def __getitem__(self, nutrient):
+        return self._data[nutrient]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f"Restrictions({dict(self._data)!r})"
+
+
+def compile_merge(diseases):
+    """Restrictions for Disease rows ordered by priority asc."""
+    diseases = list(diseases)
+    return Restrictions(merge_restrictions(diseases),
+                        merge_rules(d.compiled_rules for d in diseases))
+
+
+class RestrictionResolver:
+    """Bounded LRU of merged restriction dicts with hit/miss counters."""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits    = 0
+        self.misses  = 0
+        self._lru    = OrderedDict()
+        self._lock   = threading.Lock()
+
+    def fingerprint(self, disease_ids):
+        return (tuple(sorted(set(disease_ids))), current_version())
+
+    def resolve(self, disease_ids):
+        """Merged restrictions for a set of Disease ids (cached)."""
+        key = self.fingerprint(disease_ids)
+        with self._lock:
+            cached = self._lru.get(key)
+            if cached is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        ids = key[0]
+        diseases = Disease.objects.filter(id__in=ids).order_by('priority', 'id') if ids else []
+        merged = compile_merge(diseases)
+        if RESTRICTIONS.invalidated_in_transaction():
+            return merged               # may hold uncommitted Disease rows
+
+        with self._lock:
+            self._lru[key] = merged
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.maxsize:
+                self._lru.popitem(last=False)
+        return merged
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits':     self.hits,
+                'misses':   self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'size':     len(self._lru),
+                'maxsize':  self.maxsize,
+            }
+
+
+resolver = RestrictionResolver(getattr(settings, 'HEALTH_RESTRICTION_CACHE_SIZE', 256))
+
+
+def current_version():
+    return RESTRICTIONS.version()
+
+
+def bump_version():
+    """Retire cached merges (called on Disease save/delete); published on commit."""
+    resolver.clear()
+    RESTRICTIONS.invalidate(now=False)
+
+
+def restrictions_for_checkup(checkup):
+    """One id lookup on the M2M through table, then a cached merge."""
+    links = checkup.disease_links.through.objects.filter(checkup_id=checkup.pk)
+    return resolver.resolve(links.values_list('disease_id', flat=True))
+
+
+def restrictions_for_checkups(checkup_ids):
+    """{checkup id: merged restrictions} for a batch, from one through-table query."""
+    through = Checkup.disease_links.through
+    links = {pk: [] for pk in checkup_ids}
+    rows = through.objects.filter(checkup_id__in=links).values_list('checkup_id', 'disease_id')
+    for checkup_id, disease_id in rows:
+        links[checkup_id].append(disease_id)
+    return {pk: resolver.resolve(ids) for pk, ids in links.items()}
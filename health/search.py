@@ -0,0 +1,191 @@
+"""
+Patient search — trigram index over normalized names and phone digits.
+
+Replaces leading-wildcard `LIKE '%q%'` scans with indexed lookups on
+PatientSearchTerm(field, term):
+
+    • queries of 3+ characters → every query trigram must be present
+      (GROUP BY patient HAVING COUNT(DISTINCT term) = #trigrams)
+    • 1–2 character queries   → indexed prefix range scan on `term`
+
+Trigram hits are a superset of substring matches. Up to three characters
+they are exact (the query is a prefix of one indexed trigram); longer
+queries verify the candidates against the normalized name or phone, in
+`search_patients` and in `verified_patient_ids` (the directory filter), so
+both fold case and accents the same way.
+"""
+import re
+import unicodedata
+
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from .models import Patient, PatientSearchTerm
+
+
+TOP_K           = 10
+CANDIDATE_LIMIT = 200
+PAD             = '$$'    # end sentinel so 1–2 char suffixes still form a trigram
+
+_SPACES     = re.compile(r'\s+')
+_NON_DIGIT  = re.compile(r'\D+')
+_PHONE_LIKE = re.compile(r'[\d\s+()-]*\d[\d\s+()-]*')
+
+
+def normalize_name(text):
+    """
+    Case-fold, drop accents from Latin letters (José → jose), keep letters and
+    digits of every script, turn everything else into single spaces.
+    """
+    chars = []
+    for ch in unicodedata.normalize('NFKD', (text or '').casefold()):
+        kind = unicodedata.category(ch)[0]
+        if kind == 'M':
+            if chars and chars[-1].isascii():
+                continue                    # accent on a Latin base letter
+            chars.append(ch)                # vowel signs etc. of other scripts
+        elif kind in 'LN':
+            chars.append(ch)
+        else:
+            chars.append(' ')
+    text = unicodedata.normalize('NFC', ''.join(chars))
+    return _SPACES.sub(' ', text).strip()
+
+
+def normalize_phone(text):
+    return _NON_DIGIT.sub('', text or '')
+
+
+def trigrams(text, pad=True):
+    """
+    Distinct trigrams of `text`. Indexed values are end-padded; query strings
+    are not (a query is a substring, not necessarily a suffix).
+    """
+    if pad:
+        text, stop = text + PAD, len(text)
+    else:
+        stop = len(text) - 2
+    return {text[i:i + 3] for i in range(stop)}
+
+
+def index_patient(patient):
+    """(Re)build the search terms for one patient."""
+    PatientSearchTerm.objects.filter(patient=patient).delete()
+    terms = [
+        PatientSearchTerm(patient=patient, field=PatientSearchTerm.NAME, term=g)
+        for g in trigrams(normalize_name(patient.name))
+    ] + [
+        PatientSearchTerm(patient=patient, field=PatientSearchTerm.PHONE, term=g)
+        for g in trigrams(normalize_phone(patient.phone))
+    ]
+    PatientSearchTerm.objects.bulk_create(terms)
+
+
+def _field_candidates(field, needle):
+    """Subquery of patient ids whose `field` contains every trigram of `needle`."""
+    terms = PatientSearchTerm.objects.filter(field=field)
+    if len(needle) < 3:
+        return terms.filter(term__startswith=needle).values('patient_id')
+    grams = trigrams(needle, pad=False)
+    return (
+        terms.filter(term__in=grams)
+        .values('patient_id')
+        .annotate(hits=Count('term', distinct=True))
+        .filter(hits=len(grams))
+        .values('patient_id')
+    )
+
+
+def _split_query(query):
+    """Phone-like queries search phone digits; everything else searches names."""
+    if _PHONE_LIKE.fullmatch(query or ''):
+        return '', normalize_phone(query)
+    return normalize_name(query), ''
+
+
+def matching_patient_ids(query):
+    """
+    Trigram prefilter as a subquery of patient ids (use with `id__in=`).
+    Returns None when the query normalizes to nothing.
+    """
+    name, digits = _split_query(query)
+    if digits:
+        return _field_candidates(PatientSearchTerm.PHONE, digits)
+    if name:
+        return _field_candidates(PatientSearchTerm.NAME, name)
+    return None
+
+
+def _contains(name, phone, needle, digits):
+    if digits:
+        return needle in normalize_phone(phone)
+    return needle in normalize_name(name)
+
+
+def verified_patient_ids(query):
+    """
+    Ids of the patients whose normalized name (or phone digits) contains the
+    normalized query, as a subquery or a list for `id__in=`. Returns None
+    when the query normalizes to nothing.
+    """
+    ids = matching_patient_ids(query)
+    if ids is None:
+        return None
+    name, digits = _split_query(query)
+    needle = digits or name
+    if len(needle) <= 3:
+        return ids                          # the index alone is exact
+    rows = Patient.objects.filter(id__in=ids).values_list('id', 'name', 'phone')
+    return [pid for pid, p_name, p_phone in rows if _contains(p_name, p_phone, needle, digits)]
+
+
+def _prerank(name, digits):
+    """
+    SQL approximation of `_rank` on the raw columns, so the candidate cut
+    keeps the best matches rather than the newest ones.
+    """
+    if digits:
+        whens = [When(phone__startswith=digits, then=Value(0))]
+    else:
+        whens = [When(name__istartswith=name, then=Value(1)),
+                 When(name__icontains=' ' + name, then=Value(2))]
+    return Case(*whens, default=Value(3), output_field=IntegerField())
+
+
+def _rank(patient, name, digits):
+    """Lower is better; None means the trigram hit was a false positive."""
+    p_name, p_phone = normalize_name(patient.name), normalize_phone(patient.phone)
+    if digits:
+        if digits not in p_phone:
+            return None
+        return 0 if p_phone.startswith(digits) else 3
+    if name in p_name:
+        if p_name.startswith(name):
+            return 1
+        if (' ' + name) in (' ' + p_name):
+            return 2
+        return 3
+    return None
+
+
+def search_patients(query, limit=TOP_K):
+    """
+    Ranked top-K patients for a typeahead query.
+    Order: phone prefix, name prefix, word prefix, any substring; newest first on ties.
+    """
+    ids = matching_patient_ids(query)
+    if ids is None:
+        return []
+    name, digits = _split_query(query)
+    candidates = (
+        Patient.objects.filter(id__in=ids)
+        .only('id', 'name', 'phone', 'gender')
+        .annotate(prerank=_prerank(name, digits))
+        .order_by('prerank', '-id')[:CANDIDATE_LIMIT]
+    )
+    ranked = []
+    for p in candidates:
+        rank = _rank(p, name, digits)
+        if rank is not None:
+            ranked.append((rank, -p.id, p))
+    ranked.sort(key=lambda r: r[:2])
+    return [p for _, _, p in ranked[:limit]]
@@ -1,7 +1,13 @@
-from django.db.models.signals import post_migrate
+from django.db import transaction
+from django.db.models.signals import post_migrate, post_save, post_delete, pre_save
 from django.dispatch import receiver
 from django.core.management import call_command
-from .models import Disease, FoodItem
+from .models import Disease, FoodItem, Patient, Checkup, PatientLatestCheckup
+from .search import index_patient
+from .catalog import bump_version as bump_catalog_version
+from .restrictions import bump_version as bump_disease_version
+from .dashboard import DASHBOARD
+from . import report_cache
 
 @receiver(post_migrate)
 def load_initial_data(sender, **kwargs):
@@ -19,3 +25,56 @@ def load_initial_data(sender, **kwargs):
                 print("--- Data loading complete! ---")
             except Exception as e:
                 print(f"--- Error loading fixtures: {e} ---")
+
+
+@receiver(post_save, sender=Checkup)
+@receiver(post_delete, sender=Checkup)
+def refresh_latest_checkup(sender, instance, **kwargs):
+    """
+    Keep the PatientLatestCheckup projection in step with the Checkup table.
+    Runs inside the caller's transaction so the projection never diverges.
+    """
+    with transaction.atomic():
+        PatientLatestCheckup.refresh(instance.patient_id)
+    report_cache.bump_history(instance.patient_id)     # history cards, analytics
+    DASHBOARD.invalidate()
+
+
+@receiver(post_save, sender=Patient)
+def refresh_search_terms(sender, instance, update_fields=None, **kwargs):
+    """Re-index a patient's name/phone trigrams whenever either may have changed."""
+    if update_fields is not None and not {'name', 'phone'} & set(update_fields):
+        return
+    with transaction.atomic():
+        index_patient(instance)
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def invalidate_patient_report(sender, instance, **kwargs):
+    """Name/phone edits show up in cached report fragments (WhatsApp link) and the dashboard."""
+    report_cache.bump_history(instance.pk)
+    DASHBOARD.invalidate()
+
+
+@receiver(post_save, sender=FoodItem)
+@receiver(post_delete, sender=FoodItem)
+def invalidate_food_catalog(sender, **kwargs):
+    """Any catalog edit (admin, fixtures, shell) retires every worker's snapshot."""
+    bump_catalog_version()
+
+
+@receiver(pre_save, sender=Disease)
+def compile_disease_rules(sender, instance, **kwargs):
+    """
+    Validate and compile restricted_nutrients on every save — including raw
+    fixture loads, which skip Model.save() but still send pre_save.
+    """
+    instance.compile_rules()
+
+
+@receiver(post_save, sender=Disease)
+@receiver(post_delete, sender=Disease)
+def invalidate_restriction_cache(sender, **kwargs):
+    """Disease rule edits retire every memoised restriction merge."""
+    bump_disease_version()
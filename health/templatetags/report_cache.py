@@ -0,0 +1,35 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+
+register = template.Library()
+
+
+class ReportFragmentNode(template.Node):
+
+    def __init__(self, name, nodelist):
+        self.name = name
+        self.nodelist = nodelist
+
+    def render(self, context):
+        versions = context.get('report_versions')
+        if versions is None:
+            return self.nodelist.render(context)
+        return mark_safe(versions.get_or_build(self.name, lambda: str(self.nodelist.render(context))))
+
+
+@register.tag
+def report_fragment(parser, token):
+    """
+    {% report_fragment "plan_table" %}…{% endreport_fragment %}
+
+    Renders the block once per version of the data it shows and serves the
+    cached HTML afterwards (health.report_cache). Without `report_versions`
+    in the context the block renders normally.
+    """
+    bits = token.split_contents()
+    if len(bits) != 2 or bits[1][0] not in '"\'' or bits[1][0] != bits[1][-1]:
+        raise template.TemplateSyntaxError(f"{bits[0]} takes one quoted fragment name.")
+    nodelist = parser.parse(('endreport_fragment',))
+    parser.delete_first_token()
+    return ReportFragmentNode(bits[1][1:-1], nodelist)
@@ -1,3 +1,1189 @@
-from django.test import TestCase
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.utils import ConnectionHandler
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .catalog import VERSION_KEY, FoodCatalog, FoodRecord, get_catalog
+from .cache import LocalTier, namespace, stats as cache_stats
+from .dashboard import DASHBOARD, cached_dashboard_stats, dashboard_stats
+from .engine import FORMULA_VERSION, DailyBudget, Profile, compose_meal, generate_week, meal_splits
+from .engine.composer import MACRO_COLUMNS, MAX_GRAMS, MIN_GRAMS, PoolMatrix, macro_targets
+from .engine.rules import NUTRIENT_FIELDS
+from . import benchmarks, dbpool, instrumentation, report_cache
+from .disease_index import get_disease_index
+from .directory import patient_page
+from .search import search_patients
+from .plans import ensure_plan, replace_plan, load_plan, slot_count
+from . import pdf, query_plans
+from .views import _link_diseases_to_checkup, build_pdf_context
+from .generation import (
+    build_plan_rows, generate_plan, generate_plans, pending_checkups, previous_plan_foods,
+)
+from .management.commands.generate_plans import chunk_by_patient
+from .filters import catalog_pool, numpy_pool, orm_pool, selected_engine
+from .models import Patient, Checkup, Disease, FoodItem, AssignedMeal, PatientLatestCheckup
+from .restrictions import RESTRICTIONS, RestrictionResolver
+
+
+def make_checkup(patient, bmi=22.0, category='Normal', days_ago=0, **extra):
+    """Create a Checkup and back-date it (date is auto_now_add)."""
+    fields = dict(
+        patient=patient, age=30, height=170, weight=65, activity=1.2,
+        bmi=bmi, bmr=1500, tdee=1800, category=category,
+    )
+    fields.update(extra)
+    checkup = Checkup.objects.create(**fields)
+    if days_ago:
+        checkup.date = timezone.localdate() - timedelta(days=days_ago)
+        checkup.save(update_fields=['date'])
+    return checkup
+
+
+def make_patient(n, **extra):
+    fields = dict(name=f"Patient {n}", gender='Male', phone=f"9{n:09d}", address='Clinic Road')
+    fields.update(extra)
+    return Patient.objects.create(**fields)
+
+
+class DashboardStatsTests(TestCase):
+
+    def _populate(self, count):
+        for n in range(count):
+            p = make_patient(n)
+            make_checkup(p, bmi=17.0, category='Underweight', days_ago=5)
+            make_checkup(p, bmi=31.0 if n % 2 else 23.0,
+                         category='Obese' if n % 2 else 'Normal', days_ago=n % 3)
+
+    def test_latest_checkup_histogram(self):
+        self._populate(4)
+        stats = dashboard_stats()
+        self.assertEqual(stats['total_patients'], 4)
+        self.assertEqual((stats['underweight'], stats['normal'], stats['obese']), (0, 2, 2))
+        self.assertEqual(stats['avg_bmi'], 27.0)
+        self.assertEqual(stats['high_risk_pct'], 50)
+        self.assertEqual(stats['today_visits'], 2)
+
+    def test_query_count_is_constant(self):
+        self._populate(2)
+        with self.assertNumQueries(5):
+            dashboard_stats()
+        for n in range(2, 14):
+            make_checkup(make_patient(n), days_ago=n)
+        with self.assertNumQueries(5):
+            dashboard_stats()
+
+    def test_cached_stats_follow_patient_changes(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self._populate(2)
+        self.assertEqual(cached_dashboard_stats()['total_patients'], 2)
+        with self.assertNumQueries(0):
+            cached_dashboard_stats()
+        make_checkup(make_patient(2))
+        self.assertEqual(cached_dashboard_stats()['total_patients'], 3)
+
+
+class TieredCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        cache_stats.reset()
+        self.addCleanup(cache.clear)
+
+    def test_l1_serves_reads_until_the_shared_tier_is_asked(self):
+        cache.set('health:report:probe', {'rows': [1, 2]})
+        caches['shared'].delete('health:report:probe')
+        self.assertEqual(cache.get('health:report:probe'), {'rows': [1, 2]})
+        cache.delete('health:report:probe')
+        self.assertIsNone(cache.get('health:report:probe'))
+        counts = cache_stats.snapshot()['report']
+        self.assertEqual((counts['l1_hits'], counts['misses']), (1, 1))
+
+    def test_local_tier_is_bounded_and_expires(self):
+        tier = LocalTier(max_entries=2)
+        for key in 'abc':
+            tier.set(key, key.upper(), timeout=60, namespace='catalog')
+        self.assertEqual(len(tier), 2)
+        self.assertEqual(tier.get('a'), (False, None))
+        tier.set('d', 'D', timeout=-1, namespace='catalog')
+        self.assertEqual(tier.get('d'), (False, None))
+        counts = cache_stats.snapshot()['catalog']
+        self.assertEqual((counts['evictions'], counts['expirations']), (2, 1))
+
+    def test_namespace_invalidation_retires_every_key(self):
+        dashboard = namespace('dashboard')
+        first = dashboard.get_or_set(('stats', 'today'), lambda: 'old')
+        dashboard.invalidate()
+        self.assertEqual(dashboard.get_or_set(('stats', 'today'), lambda: 'new'), 'new')
+        self.assertNotEqual(first, 'new')
+        self.assertEqual(namespace('report').get_or_set(('x',), lambda: 1), 1)
+
+    def test_rolled_back_invalidation_leaves_nothing_cached(self):
+        dashboard = namespace('dashboard')
+        dashboard.get_or_set(('stats', 'today'), lambda: 'committed')
+        try:
+            with transaction.atomic():
+                dashboard.invalidate()
+                self.assertEqual(dashboard.get_or_set(('stats', 'today'), lambda: 'uncommitted'),
+                                 'uncommitted')
+                raise RuntimeError("rollback")
+        except RuntimeError:
+            pass
+        self.assertFalse(dashboard.invalidated_in_transaction())
+        self.assertEqual(dashboard.get_or_set(('stats', 'today'), lambda: 'rebuilt'), 'rebuilt')
+        self.assertEqual(dashboard.get_or_set(('stats', 'today'), lambda: 'again'), 'rebuilt')
+
+    def test_invalidation_is_pending_until_commit(self):
+        dashboard, report = namespace('dashboard'), namespace('report')
+        with self.captureOnCommitCallbacks(execute=True):
+            dashboard.invalidate()
+            self.assertTrue(dashboard.invalidated_in_transaction())
+            self.assertFalse(report.invalidated_in_transaction())
+        self.assertFalse(dashboard.invalidated_in_transaction())
+
+    def test_concurrent_misses_build_once(self):
+        calls, ready = [], threading.Barrier(6)
+
+        def build():
+            calls.append(1)
+            time.sleep(0.1)
+            return 'built'
+
+        def worker(results):
+            ready.wait()
+            results.append(cache.get_or_set('health:report:slow', build, timeout=60))
+
+        results = []
+        threads = [threading.Thread(target=worker, args=(results,)) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['built'] * 6)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache_stats.snapshot()['report']['waits'], 5)
+
+
+class PatientLatestCheckupTests(TestCase):
+
+    def test_projection_follows_create_and_delete(self):
+        p = make_patient(1)
+        older = make_checkup(p, bmi=31.0, category='Obese', days_ago=10)
+        newer = make_checkup(p, bmi=24.0, category='Normal')
+        row = PatientLatestCheckup.objects.get(patient=p)
+        self.assertEqual((row.checkup_id, row.category, row.visit_count), (newer.id, 'Normal', 2))
+
+        newer.delete()
+        row = PatientLatestCheckup.objects.get(patient=p)
+        self.assertEqual((row.checkup_id, row.category, row.visit_count), (older.id, 'Obese', 1))
+
+        older.delete()
+        self.assertFalse(PatientLatestCheckup.objects.filter(patient=p).exists())
+
+    def test_rebuild_command_matches_incremental_state(self):
+        for n in range(3):
+            p = make_patient(n)
+            make_checkup(p, days_ago=3)
+            make_checkup(p, bmi=28.0, category='Overweight', days_ago=1)
+        expected = list(PatientLatestCheckup.objects.order_by('pk').values())
+        PatientLatestCheckup.objects.all().delete()
+        call_command('rebuild_latest_checkups', stdout=StringIO())
+        self.assertEqual(list(PatientLatestCheckup.objects.order_by('pk').values()), expected)
+
+
+class PatientDirectoryTests(TestCase):
+
+    def setUp(self):
+        for n in range(7):
+            p = make_patient(n, name=f"{'Asha' if n % 2 else 'Ravi'} {n}")
+            make_checkup(p, bmi=31.0, category='Obese', days_ago=40)
+            if n < 4:
+                make_checkup(p, bmi=22.0, category='Normal', days_ago=n)
+
+    def test_keyset_pages_cover_every_patient_once(self):
+        seen, after = [], None
+        while True:
+            page = patient_page(after=after, page_size=3)
+            seen += [row['patient'].id for row in page.rows]
+            if not page.next_cursor:
+                break
+            after = page.next_cursor
+        self.assertEqual(seen, sorted(Patient.objects.values_list('id', flat=True), reverse=True))
+
+        back = patient_page(before=page.prev_cursor, page_size=3)
+        self.assertEqual(back.rows[-1]['patient'].id, page.rows[0]['patient'].id + 1)
+
+    def test_filters_run_in_sql(self):
+        obese = patient_page(bmi_filter='Obese')
+        self.assertEqual(len(obese.rows), 3)
+        self.assertTrue(all(r['latest'].category == 'Obese' for r in obese.rows))
+
+        recent = patient_page(date_range='week', bmi_filter='Normal', query='Asha')
+        self.assertEqual(sorted(r['patient'].name for r in recent.rows), ['Asha 1', 'Asha 3'])
+        self.assertEqual({r['total_visits'] for r in recent.rows}, {2})
+
+    def test_page_query_count_is_constant(self):
+        with self.assertNumQueries(1):
+            patient_page(page_size=5)
+        with self.assertNumQueries(2):
+            patient_page(date_range='month', page_size=5)
+
+    def test_views_render_page_with_cursor(self):
+        self.client.force_login(User.objects.create_user('dietitian', password='x' * 10))
+        response = self.client.get('/patients/', {'bmi_filter': 'Normal'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['patients_data']), 4)
+        cursor = Patient.objects.get(name='Ravi 4').id
+        response = self.client.get('/patients/existing/', {'q': 'Ravi', 'after': cursor})
+        self.assertEqual([r['patient'].name for r in response.context['patients_data']], ['Ravi 2', 'Ravi 0'])
+
+
+class PatientSearchTests(TestCase):
+
+    def setUp(self):
+        self.asha  = make_patient(1, name='Asha Verma', phone='9876500001')
+        self.ravi  = make_patient(2, name='Ravi Shastri', phone='9123456780')
+        self.kavya = make_patient(3, name='Kavya Ashok', phone='9000098765')
+
+    def names(self, query):
+        return [p.name for p in search_patients(query)]
+
+    def test_ranks_prefix_before_word_before_substring(self):
+        self.assertEqual(self.names('ash'), ['Asha Verma', 'Kavya Ashok'])
+        self.assertEqual(self.names('sha'), ['Ravi Shastri', 'Asha Verma'])
+        self.assertEqual(self.names('v'), ['Asha Verma', 'Kavya Ashok', 'Ravi Shastri'])
+
+    def test_phone_digits_and_false_positive_rejection(self):
+        self.assertEqual(self.names('98765'), ['Asha Verma', 'Kavya Ashok'])
+        self.assertEqual(self.names('98 765 00'), ['Asha Verma'])
+        # Trigrams split across two different patients must not match either
+        self.assertEqual(self.names('verma ashok'), [])
+
+    def test_non_latin_and_accented_names_are_indexed(self):
+        make_patient(4, name='अमित शर्मा', phone='9000000004')
+        make_patient(5, name='José Núñez', phone='9000000005')
+        self.assertEqual(self.names('शर्मा'), ['अमित शर्मा'])
+        self.assertEqual(self.names('nunez'), ['José Núñez'])
+        self.assertEqual(self.names('JOSÉ'), ['José Núñez'])
+
+    def test_candidate_cut_keeps_the_best_matches(self):
+        for n in range(4, 8):
+            make_patient(n, name=f"Mira Ashokan {n}", phone=f"90000000{n:02d}")
+        with mock.patch('health.search.CANDIDATE_LIMIT', 2):
+            self.assertEqual(self.names('ash')[0], 'Asha Verma')
+
+    def test_directory_folds_accents_like_the_typeahead(self):
+        make_patient(4, name='José Núñez', phone='9000000004')
+        for query in ('jose', 'Nunez', 'JOSÉ N', '98765 00'):
+            typeahead = {p.id for p in search_patients(query)}
+            directory = {row['patient'].id for row in patient_page(query=query).rows}
+            self.assertEqual(directory, typeahead, query)
+        self.assertEqual([r['patient'].name for r in patient_page(query='jose').rows], ['José Núñez'])
+        self.assertEqual(patient_page(query='verma ashok').rows, [])
+
+    def test_index_follows_patient_updates(self):
+        self.ravi.name = 'Ravindra Jadeja'
+        self.ravi.save()
+        self.assertEqual(self.names('shastri'), [])
+        self.assertEqual(self.names('jadeja'), ['Ravindra Jadeja'])
+
+    def test_typeahead_endpoint(self):
+        self.client.force_login(User.objects.create_user('reception', password='x' * 10))
+        data = self.client.get('/search_patients/', {'q': 'kav', 'limit': 5}).json()
+        self.assertEqual([r['id'] for r in data['results']], [self.kavya.id])
+
+
+# Restriction sets built only from real FoodItem columns (parity cases)
+PARITY_RESTRICTIONS = [
+    None,
+    {'sodium': {'max': 1500, 'banned': False}},
+    {'sugar': {'banned': True}, 'fat': {'max': None, 'banned': False}},
+    {'potassium': {'max': 2000}, 'phosphorus': {'max': 800}, 'protein': {}},
+]
+PARITY_MEALS = ['Breakfast', 'Lunch', 'Dinner', 'Evening Snack']
+PARITY_DIETS = ['Non-Veg', 'Veg', 'Vegan', 'Eggetarian']
+PARITY_BMI   = ['Underweight', 'Normal', 'Overweight', 'Obese']
+
+
+class FoodCatalogTests(TestCase):
+
+    def test_engines_match_orm_pool(self):
+        for meal in PARITY_MEALS:
+            for diet in PARITY_DIETS:
+                for bmi in PARITY_BMI:
+                    for restrictions in PARITY_RESTRICTIONS:
+                        case = (meal, diet, bmi, restrictions)
+                        expected = [f.id for f in orm_pool(*case)]
+                        self.assertEqual([f.id for f in catalog_pool(*case)], expected, case)
+                        self.assertEqual([f.id for f in numpy_pool(*case)], expected, case)
+
+    def test_warm_catalog_needs_no_queries(self):
+        get_catalog()
+        with self.assertNumQueries(0):
+            catalog_pool('Lunch', 'Veg', 'Obese', PARITY_RESTRICTIONS[1])
+
+    def test_food_edit_invalidates_snapshot(self):
+        self.addCleanup(cache.delete, VERSION_KEY)
+        food = FoodItem.objects.order_by('id').first()
+        before = get_catalog()
+        with self.captureOnCommitCallbacks(execute=True):
+            food.name = 'Renamed Idli'
+            food.save()
+        after = get_catalog()
+        self.assertNotEqual(before.version, after.version)
+        self.assertEqual(after.get(food.id).name, 'Renamed Idli')
+
+    def test_rolled_back_food_edit_is_not_kept(self):
+        food = FoodItem.objects.order_by('id').first()
+        try:
+            with transaction.atomic():
+                food.name = 'Uncommitted Idli'
+                food.save()
+                self.assertEqual(get_catalog().get(food.id).name, 'Uncommitted Idli')
+                raise RuntimeError("rollback")
+        except RuntimeError:
+            pass
+        self.assertNotEqual(get_catalog().get(food.id).name, 'Uncommitted Idli')
+
+
+class ReportFlowTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('dietitian', password='x' * 10))
+        pdf_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(pdf_dir.cleanup)
+        overrides = override_settings(HEALTH_PDF_CACHE_DIR=pdf_dir.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.addCleanup(pdf.drain)      # runs first: no render still writing into pdf_dir
+        cache.clear()    # rolled-back tests reuse patient ids; drop their report fragments
+
+    def register(self, **overrides):
+        form = {
+            'name': 'Meera Nair', 'gender': 'Female', 'phone': '9988776655',
+            'address': 'MG Road', 'dietary': 'Veg', 'plan_type': '4-Meal',
+            'age': '45', 'height': '160', 'weight': '82', 'activity': '1.375',
+            'diseases': 'Diabetes, Hypertension', 'bp': '140/90',
+        }
+        form.update(overrides)
+        response = self.client.post('/patients/new/', form)
+        self.assertEqual(response.status_code, 302)
+        return Checkup.objects.latest('id')
+
+    def test_report_generates_full_week_and_pdf(self):
+        checkup = self.register()
+        self.assertEqual(checkup.category, 'Obese')
+        response = self.client.get(f'/report/{checkup.patient_id}/{checkup.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(slot_count(AssignedMeal.objects.filter(checkup=checkup)), 28)
+        plan = response.context['weekly_plan']
+        monday = [m['meal'] for m in plan['Monday']]
+        self.assertEqual(len(monday), 4)
+        self.assertEqual([[m['meal'] for m in plan[day]] for day in plan], [monday] * 7)
+
+        pdf = self.client.get(f'/download_pdf/{checkup.id}/')
+        self.assertEqual(pdf['Content-Type'], 'application/pdf')
+
+    @staticmethod
+    def cells_per_row(html, table_class):
+        """[number of th/td cells] for every row of the first table with `table_class`."""
+        start = html.index(f'<table class="{table_class}"')
+        table = html[start:html.index('</table>', start)]
+        return [row.count('<th') + row.count('<td') for row in table.split('<tr')[1:]]
+
+    def test_plan_tables_have_one_column_per_meal_slot(self):
+        checkup = self.register()
+        html = self.client.get(f'/report/{checkup.patient_id}/{checkup.id}/').content.decode()
+        self.assertEqual(self.cells_per_row(html, 'clinical-table'), [5] * 8)    # header + 7 days
+
+        pdf_html = pdf.render_html(build_pdf_context(Checkup.objects.get(pk=checkup.pk), 'Dr. Test'))
+        self.assertEqual(self.cells_per_row(pdf_html, 'diet-table'), [5] * 9)   # + Target row
+
+    def test_plan_is_written_at_checkup_creation_and_report_only_reads(self):
+        checkup = self.register()
+        self.assertEqual(slot_count(AssignedMeal.objects.filter(checkup=checkup)), 28)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/report/{checkup.patient_id}/{checkup.id}/')
+        self.assertEqual(response.status_code, 200)
+        writes = [q['sql'] for q in queries if q['sql'].split()[0] in ('INSERT', 'UPDATE', 'DELETE')]
+        self.assertEqual(writes, [])
+
+    def test_report_revalidates_without_touching_the_plan(self):
+        checkup = self.register()
+        self.assertEqual(checkup.metrics_version, FORMULA_VERSION)
+        self.assertGreater(checkup.target_calories, 0)
+        url = f'/report/{checkup.patient_id}/{checkup.id}/'
+        first = self.client.get(url)
+        self.assertTrue(first.has_header('Last-Modified'))
+
+        with CaptureQueriesContext(connection) as queries:
+            unchanged = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(unchanged.status_code, 304)
+        self.assertFalse([q for q in queries if 'health_assignedmeal' in q['sql']])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(f'/regenerate/{checkup.id}/')
+        # The page carrying the "regenerated" toast is never revalidated or reused
+        toast = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(toast.status_code, 200)
+        self.assertFalse(toast.has_header('ETag'))
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+
+    def test_report_etag_follows_the_session(self):
+        checkup = self.register()
+        url = f'/report/{checkup.patient_id}/{checkup.id}/'
+        first = self.client.get(url)
+        user = User.objects.get(username='dietitian')
+        self.client.logout()
+        self.client.force_login(user)
+        again = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 200)
+        self.assertNotEqual(again['ETag'], first['ETag'])
+
+    def test_repeat_report_is_served_from_fragments(self):
+        checkup = self.register()
+        url = f'/report/{checkup.patient_id}/{checkup.id}/'
+        report_cache.stats.reset()
+        self.client.get(url)
+        self.assertEqual(report_cache.stats.snapshot()['plan_table']['misses'], 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertFalse([q for q in queries if 'health_assignedmeal' in q['sql']])
+        snapshot = report_cache.stats.snapshot()
+        self.assertTrue(all(s['hits'] == 1 for s in snapshot.values()), snapshot)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(f'/regenerate/{checkup.id}/')
+        self.client.get(url)
+        snapshot = report_cache.stats.snapshot()
+        self.assertEqual(snapshot['plan_table']['misses'], 2)
+        self.assertEqual(snapshot['history']['misses'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_checkup(checkup.patient)
+        self.client.get(url)
+        snapshot = report_cache.stats.snapshot()
+        self.assertEqual(snapshot['history']['misses'], 2)
+        self.assertEqual(snapshot['plan_table']['misses'], 2)
+
+    def test_stale_metrics_are_recomputed_once(self):
+        checkup = self.register()
+        Checkup.objects.filter(pk=checkup.pk).update(metrics_version=0, target_calories=0,
+                                                      bmi=0, category='Stale')
+        PatientLatestCheckup.refresh(checkup.patient_id)
+        dashboard_version = DASHBOARD.version()
+        self.client.get(f'/report/{checkup.patient_id}/{checkup.id}/')
+        checkup.refresh_from_db()
+        self.assertEqual(checkup.metrics_version, FORMULA_VERSION)
+        self.assertGreater(checkup.target_calories, 0)
+        latest = PatientLatestCheckup.objects.get(patient_id=checkup.patient_id)
+        self.assertEqual((latest.bmi, latest.category), (checkup.bmi, checkup.category))
+        self.assertNotEqual(DASHBOARD.version(), dashboard_version)
+
+    def test_pdf_is_cached_and_revalidated(self):
+        checkup = self.register()
+        self.client.get(f'/report/{checkup.patient_id}/{checkup.id}/')
+        first = self.client.get(f'/download_pdf/{checkup.id}/')
+        body = b''.join(first.streaming_content)
+        self.assertTrue(body.startswith(b'%PDF'))
+        self.assertTrue(pdf.drain())        # the render's done-callback stores the file
+        self.assertEqual(len(list(pdf.cache_dir(checkup.id).glob('*.pdf'))), 1)
+
+        with self.assertNumQueries(4):   # context only; nothing re-rendered
+            again = self.client.get(f'/download_pdf/{checkup.id}/')
+        self.assertEqual(b''.join(again.streaming_content), body)
+        self.assertEqual(again['ETag'], first['ETag'])
+
+        unchanged = self.client.get(f'/download_pdf/{checkup.id}/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(unchanged.status_code, 304)
+
+    def test_each_dietitians_pdf_stays_cached(self):
+        checkup = self.register()
+        other = Client()
+        other.force_login(User.objects.create_user('second', password='x' * 10))
+        self.client.get(f'/download_pdf/{checkup.id}/')
+        other.get(f'/download_pdf/{checkup.id}/')
+        self.assertTrue(pdf.drain())
+        self.assertEqual(len(list(pdf.cache_dir(checkup.id).glob('*.pdf'))), 2)
+        cache_stats.reset()
+        self.client.get(f'/download_pdf/{checkup.id}/')
+        other.get(f'/download_pdf/{checkup.id}/')
+        self.assertEqual(cache_stats.snapshot()['pdf']['l2_hits'], 2)
+
+    def test_export_reports_resumes(self):
+        checkup = self.register()
+        make_checkup(make_patient(7))       # no plan yet: skipped
+        with tempfile.TemporaryDirectory() as out:
+            call_command('export_reports', out, '--workers', '1', stdout=StringIO())
+            files = list(Path(out).glob('*.pdf'))
+            self.assertEqual(len(files), 1)
+            self.assertIn(f"{checkup.id:07d}", files[0].name)
+
+            log = StringIO()
+            call_command('export_reports', out, '--workers', '1', '--zip', stdout=log)
+            self.assertIn('0 report(s) to render, 1 already exported', log.getvalue())
+            self.assertTrue(Path(out).with_suffix('.zip').exists())
+            Path(out).with_suffix('.zip').unlink()
+
+    def test_regenerating_plan_drops_cached_pdf(self):
+        checkup = self.register()
+        self.client.get(f'/report/{checkup.patient_id}/{checkup.id}/')
+        self.client.get(f'/download_pdf/{checkup.id}/')
+        self.assertTrue(pdf.drain())
+        self.assertTrue(pdf.cache_dir(checkup.id).exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(f'/regenerate/{checkup.id}/')
+        self.assertFalse(pdf.cache_dir(checkup.id).exists())
+
+    def test_slow_pdf_answers_202_then_serves_the_render(self):
+        checkup = self.register()
+        release = threading.Event()
+        real_render = pdf.render_pdf_bytes
+
+        def slow_render(html):
+            release.wait(5)
+            return real_render(html)
+
+        with override_settings(HEALTH_PDF_WAIT=0.05), \
+                mock.patch.object(pdf, 'render_pdf_bytes', slow_render):
+            pending = self.client.get(f'/download_pdf/{checkup.id}/')
+            self.assertEqual(pending.status_code, 202)
+            self.assertEqual(pending['Retry-After'], '3')
+            release.set()
+            self.assertTrue(pdf.drain())
+        done = self.client.get(f'/download_pdf/{checkup.id}/')
+        self.assertEqual(done.status_code, 200)
+        self.assertTrue(b''.join(done.streaming_content).startswith(b'%PDF'))
+
+    @override_settings(HEALTH_PDF_PRERENDER=True)
+    def test_plan_writes_prerender_the_pdf(self):
+        checkup = self.register()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(f'/regenerate/{checkup.id}/')
+        self.assertTrue(pdf.drain())
+        self.assertEqual(len(list(pdf.cache_dir(checkup.id).glob('*.pdf'))), 1)
+        cache_stats.reset()
+        self.client.get(f'/download_pdf/{checkup.id}/')
+        self.assertEqual(cache_stats.snapshot()['pdf']['l2_hits'], 1)
+
+    def test_pdf_content_key_reads_no_relations(self):
+        checkup = self.register()
+        context = build_pdf_context(Checkup.objects.select_related('patient').get(pk=checkup.pk), 'Dr')
+        with self.assertNumQueries(0):
+            first = pdf.content_key(context)
+        self.assertEqual(first, pdf.content_key(context))
+
+
+class RestrictionResolverTests(TestCase):
+
+    def setUp(self):
+        self.resolver = RestrictionResolver(maxsize=2)
+        self.addCleanup(cache.delete, RESTRICTIONS.version_key)
+        with self.captureOnCommitCallbacks(execute=True):     # merges are cached once committed
+            self.low = Disease.objects.create(name='Test Low', priority=2, restricted_nutrients={
+                'sodium': {'max': 2000}, 'sugar': {'banned': False}})
+            self.high = Disease.objects.create(name='Test High', priority=9, restricted_nutrients={
+                'sodium': {'max': 1500, 'banned': False}})
+
+    def test_priority_merge_is_cached_per_disease_set(self):
+        merged = self.resolver.resolve([self.high.id, self.low.id])
+        self.assertEqual(merged['sodium']['max'], 1500)
+        self.assertIn('sugar', merged)
+        with self.assertNumQueries(0):
+            again = self.resolver.resolve([self.low.id, self.high.id, self.low.id])
+        self.assertIs(again, merged)
+        self.assertEqual(self.resolver.stats()['hits'], 1)
+        self.assertEqual(self.resolver.stats()['misses'], 1)
+
+    def test_lru_is_bounded(self):
+        for ids in ([self.low.id], [self.high.id], []):
+            self.resolver.resolve(ids)
+        self.assertEqual(self.resolver.stats()['size'], 2)
+
+    def test_disease_edit_changes_fingerprint(self):
+        before = self.resolver.fingerprint([self.high.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.high.restricted_nutrients = {'sodium': {'max': 1200}}
+            self.high.save()
+        self.assertNotEqual(self.resolver.fingerprint([self.high.id]), before)
+        self.assertEqual(self.resolver.resolve([self.high.id])['sodium']['max'], 1200)
+
+    def test_rolled_back_disease_edit_is_not_cached(self):
+        try:
+            with transaction.atomic():
+                self.high.restricted_nutrients = {'sodium': {'max': 900}}
+                self.high.save()
+                self.assertEqual(self.resolver.resolve([self.high.id])['sodium']['max'], 900)
+                raise RuntimeError("rollback")
+        except RuntimeError:
+            pass
+        self.assertEqual(self.resolver.resolve([self.high.id])['sodium']['max'], 1500)
+
+
+class NutrientRuleTests(TestCase):
+
+    def test_aliases_compile_to_columns_and_unmapped_names_are_dropped(self):
+        disease = Disease.objects.create(name='Test Renal', restricted_nutrients={
+            'Carbohydrates': {'banned': True}, 'phosphorous': {'max': 800},
+            'saturated fat': {'banned': True}})
+        carbs, phosphorus = NUTRIENT_FIELDS.index('carbs'), NUTRIENT_FIELDS.index('phosphorus')
+        self.assertEqual(disease.compiled_rules, [[carbs, None, True], [phosphorus, 800, False]])
+
+    def test_malformed_rules_are_rejected_on_save(self):
+        for bad in ([], {'sodium': 1500}, {'sodium': {'max': -1}}, {'sodium': {'limit': 5}},
+                    {'sugar': {'banned': 'yes'}}):
+            with self.subTest(bad=bad), self.assertRaises(ValidationError):
+                Disease.objects.create(name='Test Bad', restricted_nutrients=bad)
+
+    def test_fixture_diseases_are_compiled_on_load(self):
+        sugar = NUTRIENT_FIELDS.index('sugar')
+        limited = Disease.objects.filter(restricted_nutrients__has_key='sugar')
+        self.assertGreater(limited.count(), 100)
+        self.assertTrue(all([sugar, None, False] in d.compiled_rules for d in limited))
+
+    def test_merged_restrictions_carry_compiled_rules_for_every_engine(self):
+        low = Disease.objects.create(name='Test Low', priority=2, restricted_nutrients={
+            'salt': {'max': 2000}, 'alcohol': {'banned': True}})
+        high = Disease.objects.create(name='Test High', priority=9, restricted_nutrients={
+            'sodium': {'max': 1200}})
+        merged = RestrictionResolver().resolve([low.id, high.id])
+        self.assertEqual(set(merged), {'salt', 'alcohol', 'sodium'})
+        self.assertEqual([(r.nutrient, r.max, r.threshold) for r in merged.rules],
+                         [('sodium', 1200, 300.0)])
+        for engine in (orm_pool, catalog_pool, numpy_pool):
+            pool = engine('Lunch', 'Non-Veg', 'Normal', merged)
+            self.assertTrue(all(food.sodium <= 300 for food in pool))
+
+    def test_audit_command_lists_unmapped_nutrients(self):
+        Disease.objects.create(name='Test Audit', restricted_nutrients={'moonbeams': {'banned': True}})
+        out = StringIO()
+        call_command('audit_nutrients', stdout=out)
+        self.assertIn("'moonbeams'", out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('audit_nutrients', '--strict', stdout=StringIO())
+
+
+class QueryPlanTests(TestCase):
+
+    def test_hot_queries_use_indexes(self):
+        make_checkup(make_patient(1))
+        out = StringIO()
+        call_command('explain_hot_queries', '--strict', stdout=out)
+        self.assertIn('0 flagged', out.getvalue())
+
+    def test_mysql_scans_and_filesorts_are_flagged(self):
+        rows = [
+            {'table': 'health_checkup', 'type': 'ALL', 'key': None, 'extra': 'Using where'},
+            {'table': 'health_fooditem', 'type': 'ref', 'key': 'health_food_category_diet',
+             'extra': 'Using index condition; Using filesort'},
+        ]
+        self.assertEqual(query_plans.findings(rows, vendor='mysql'), {'scan', 'sort'})
+        self.assertEqual(query_plans.findings(rows[1:], vendor='mysql'), {'sort'})
+
+
+class DiseaseNameIndexTests(TestCase):
+
+    INPUTS = ['diabetes', 'Hypertension', 'kidney', 'ASTHMA', 'ca', 'zz-unknown', 'stones', ' acne ']
+
+    def orm_lookup(self, name):
+        name = name.strip()
+        disease = (
+            Disease.objects.filter(name__iexact=name).order_by('id').first()
+            or Disease.objects.filter(name__icontains=name).order_by('id').first()
+        )
+        return disease.id if disease else None
+
+    def test_lookup_matches_orm_rules(self):
+        index = get_disease_index()
+        for name in self.INPUTS:
+            self.assertEqual(index.lookup(name), self.orm_lookup(name), name)
+
+    def test_link_resolves_in_one_pass(self):
+        checkup = make_checkup(make_patient(1))
+        get_disease_index()
+        # M2M set (read + insert) and one UPDATE for the legacy text
+        with self.assertNumQueries(3):
+            _link_diseases_to_checkup(checkup, 'Hypertension, diabetes, unknown-x, Diabetes')
+        linked = sorted(checkup.disease_links.values_list('name', flat=True), key=str.lower)
+        self.assertEqual(len(linked), 2)
+        checkup.refresh_from_db()
+        self.assertEqual(checkup.diseases, ', '.join(linked))
+
+    def test_rolled_back_disease_is_not_indexed(self):
+        try:
+            with transaction.atomic():
+                Disease.objects.create(name='Uncommitted Syndrome')
+                self.assertIsNotNone(get_disease_index().lookup('uncommitted syndrome'))
+                raise RuntimeError("rollback")
+        except RuntimeError:
+            pass
+        self.assertIsNone(get_disease_index().lookup('uncommitted syndrome'))
+
+
+class EngineTests(SimpleTestCase):
+    """health.engine runs on plain records — SimpleTestCase forbids any query."""
+
+    def catalog(self):
+        records = []
+        for i, (category, calories) in enumerate(
+                [('Breakfast', 120), ('Breakfast', 300), ('Lunch', 250), ('Lunch', 90),
+                 ('Dinner', 180), ('Dinner', 400), ('Snack', 60)], start=1):
+            records.append(FoodRecord(
+                id=i, name=f"Food {i}", category=category, diet_type='Veg',
+                calories=calories, protein=6, carbs=20, fat=4, fiber=4, sugar=2,
+                sodium=100 * i, potassium=0, calcium=0, phosphorus=0,
+                unit_name='g', serving_desc='100 g',
+            ))
+        return FoodCatalog('test', records)
+
+    def test_week_is_deterministic_per_seed(self):
+        profile = Profile(weight=70, height=172, age=40, gender='Male', activity=1.375,
+                          dietary='Veg', plan_type='4-Meal')
+        plan = generate_week(profile, self.catalog(), {}, meal_splits('4-Meal'), seed=42)
+        self.assertEqual(plan.category, 'Normal')
+        self.assertEqual([len(meals) for meals in plan.by_day().values()], [4] * 7)
+        again = generate_week(profile, self.catalog(), {}, meal_splits('4-Meal'), seed=42)
+        self.assertEqual(plan.meals, again.meals)
+
+    def test_restrictions_shrink_pools(self):
+        profile = Profile(weight=70, height=172, age=40, gender='Male', activity=1.2)
+        plan = generate_week(profile, self.catalog(), {'sodium': {'max': 1000, 'banned': False}},
+                             seed=1)
+        # sodium ≤ 1000/4 per 100 g leaves only foods 1 and 2, both breakfasts
+        self.assertEqual({m.food_id for m in plan.meals}, {1, 2})
+        self.assertEqual(len(plan.meals), 7)
+
+
+class PlanVarietyTests(SimpleTestCase):
+
+    def snacks(self, count):
+        return FoodCatalog('test', [
+            FoodRecord(id=i, name=f"Snack {i}", category='Snack', diet_type='Veg',
+                       calories=150, protein=6, carbs=20, fat=4, fiber=4, sugar=2,
+                       sodium=0, potassium=0, calcium=0, phosphorus=0,
+                       unit_name='g', serving_desc='100 g')
+            for i in range(1, count + 1)
+        ])
+
+    profile = Profile(weight=70, height=172, age=40, gender='Male', activity=1.2)
+    splits = {'Mid-Morning': 0.5, 'Evening Snack': 0.5}      # both draw from 'Snack'
+
+    def test_no_repeat_window_spans_slots_and_days(self):
+        plan = generate_week(self.profile, self.snacks(5), {}, self.splits, seed='p:1:0',
+                             no_repeat_days=2)
+        served = [[m.food_id for m in meals] for meals in plan.by_day().values()]
+        for today, tomorrow in zip(served, served[1:]):
+            self.assertFalse(set(today) & set(tomorrow))
+            self.assertEqual(len(set(today)), 2)
+
+    def test_previous_plan_foods_are_queued_last(self):
+        plan = generate_week(self.profile, self.snacks(20), {}, {'Evening Snack': 1.0},
+                             seed='p:2:0', avoid=frozenset(range(1, 11)))
+        self.assertTrue(all(m.food_id > 10 for m in plan.meals))
+
+    def test_seed_changes_week_but_is_reproducible(self):
+        week = lambda seed: [m.food_id for m in generate_week(
+            self.profile, self.snacks(20), {}, {'Evening Snack': 1.0}, seed=seed).meals]
+        self.assertEqual(week('p:3:0'), week('p:3:0'))
+        self.assertNotEqual(week('p:3:0'), week('p:3:1'))
+
+
+class MealCompositionTests(SimpleTestCase):
+
+    foods = [
+        FoodRecord(id=1, name="Rice", category='Lunch', diet_type='Veg', calories=130,
+                   protein=3, carbs=28, fat=0.3, fiber=0.4, sugar=0, sodium=1, potassium=35,
+                   calcium=10, phosphorus=43, unit_name='g', serving_desc='100 g'),
+        FoodRecord(id=2, name="Dal", category='Lunch', diet_type='Veg', calories=116,
+                   protein=9, carbs=20, fat=0.4, fiber=8, sugar=2, sodium=400, potassium=370,
+                   calcium=19, phosphorus=180, unit_name='g', serving_desc='100 g'),
+        FoodRecord(id=3, name="Paneer", category='Lunch', diet_type='Veg', calories=265,
+                   protein=18, carbs=1.2, fat=21, fiber=0, sugar=1, sodium=18, potassium=100,
+                   calcium=480, phosphorus=330, unit_name='g', serving_desc='100 g'),
+    ]
+    profile = Profile(weight=70, height=172, age=40, gender='Male', activity=1.2)
+
+    @staticmethod
+    def error(meal, calories):
+        totals = sum(PoolMatrix([food]).values[0][MACRO_COLUMNS] * grams for food, grams in meal)
+        return float((((totals - macro_targets(calories)) / macro_targets(calories)) ** 2).mean())
+
+    def test_companions_bring_macros_closer_than_one_food(self):
+        matrix = PoolMatrix(self.foods)
+        single = compose_meal(matrix, self.foods[0], [], 600)
+        mixed = compose_meal(matrix, self.foods[0], self.foods[1:], 600)
+        self.assertGreater(len(mixed), 1)
+        self.assertEqual(mixed[0][0].id, 1)
+        self.assertLess(self.error(mixed, 600), self.error(single, 600))
+        self.assertTrue(all(MIN_GRAMS <= grams <= MAX_GRAMS for _, grams in mixed))
+
+    def test_companions_never_sit_on_the_portion_bounds(self):
+        matrix = PoolMatrix(self.foods)
+        for calories in (150, 600, 1200, 3000):
+            meal = compose_meal(matrix, self.foods[0], self.foods[1:], calories)
+            if len(meal) > 1:
+                self.assertTrue(all(MIN_GRAMS < grams < MAX_GRAMS for _, grams in meal), meal)
+
+    def test_caps_rule_out_companions(self):
+        matrix = PoolMatrix(self.foods)
+        sodium = NUTRIENT_FIELDS.index('sodium')
+        meal = compose_meal(matrix, self.foods[0], self.foods[1:], 600, caps=[(sodium, 50)])
+        self.assertNotIn(2, [food.id for food, _ in meal])
+
+    def test_week_keeps_every_slot_with_up_to_three_items(self):
+        plan = generate_week(self.profile, FoodCatalog('test', self.foods), {}, {'Lunch': 1.0},
+                             seed=7, max_items=3, no_repeat_days=0)
+        per_day = [len(meals) for meals in plan.by_day().values()]
+        self.assertEqual(len(per_day), 7)
+        self.assertTrue(all(1 <= n <= 3 for n in per_day))
+
+
+class DailyBudgetTests(SimpleTestCase):
+    """Daily `max` caps hold on portioned amounts, summed over the whole day."""
+
+    def catalog(self):
+        records = []
+        for i, (category, sodium) in enumerate(
+                [('Breakfast', 140), ('Breakfast', 20), ('Lunch', 120), ('Lunch', 10),
+                 ('Lunch', 90), ('Dinner', 150), ('Dinner', 5), ('Dinner', 60)], start=1):
+            records.append(FoodRecord(
+                id=i, name=f"Food {i}", category=category, diet_type='Veg',
+                calories=110, protein=6, carbs=15, fat=3, fiber=3, sugar=2,
+                sodium=sodium, potassium=0, calcium=0, phosphorus=0,
+                unit_name='g', serving_desc='100 g',
+            ))
+        return FoodCatalog('test', records)
+
+    profile = Profile(weight=95, height=180, age=30, gender='Male', activity=1.725)
+    restrictions = {'sodium': {'max': 600, 'banned': False}}
+
+    def daily_sodium(self, plan):
+        sodium = {f.id: f.sodium for f in self.catalog().records}
+        return [sum(sodium[m.food_id] * int(m.quantity_text.split()[0]) / 100 for m in meals)
+                for meals in plan.by_day().values()]
+
+    def test_single_food_portions_stay_within_daily_max(self):
+        unbounded = generate_week(self.profile, self.catalog(), {}, seed=3)
+        self.assertGreater(max(self.daily_sodium(unbounded)), 600)
+        plan = generate_week(self.profile, self.catalog(), self.restrictions, seed=3)
+        self.assertEqual(len(plan.meals), 21)
+        self.assertTrue(all(total <= 600 for total in self.daily_sodium(plan)))
+
+    def test_composed_meals_stay_within_daily_max(self):
+        plan = generate_week(self.profile, self.catalog(), self.restrictions, seed=3, max_items=3)
+        self.assertTrue(all(total <= 600 for total in self.daily_sodium(plan)))
+
+    def test_exhausted_allowance_leaves_the_last_meal_unserved(self):
+        budget = DailyBudget(self.restrictions, {'Breakfast': 0.25, 'Lunch': 0.75})
+        salty = self.catalog().records[0]                # 140 mg / 100 g
+        budget.spend(salty, 400)                         # 560 of the 600 mg
+        budget.close_meal('Breakfast')
+        allowance = budget.allowance('Lunch')
+        self.assertEqual(budget.fit(salty, 100, allowance), 20)
+        budget.spend(salty, 20, allowance)               # 588 mg: 12 mg left
+        self.assertEqual(budget.fit(salty, 100, allowance), 0)
+
+        # An engine without per-100 g thresholds: no Dinner food fits even 10 g
+        catalog = FoodCatalog('test', [
+            r._replace(sodium=10000) if r.category == 'Dinner' else r
+            for r in self.catalog().records
+        ])
+        unfiltered = lambda meal, *args, catalog: [r for r in catalog.records if r.category == meal]
+        plan = generate_week(self.profile, catalog, self.restrictions, seed=3, pool_filter=unfiltered)
+        self.assertEqual([slot for _, slot in plan.unfilled], ['Dinner'] * 7)
+        self.assertFalse([m for m in plan.meals if m.meal_type == 'Dinner'])
+        sodium = {f.id: f.sodium for f in catalog.records}
+        for meals in plan.by_day().values():
+            self.assertLessEqual(
+                sum(sodium[m.food_id] * int(m.quantity_text.split()[0]) / 100 for m in meals), 600)
+
+    def test_unused_allowance_carries_to_later_meals(self):
+        budget = DailyBudget(self.restrictions, {'Breakfast': 0.25, 'Lunch': 0.75})
+        self.assertEqual(budget.allowance('Breakfast'), {'sodium': 150})
+        budget.spend(self.catalog().records[1], 100)     # 20 mg of the 150 mg
+        budget.close_meal('Breakfast')
+        self.assertEqual(budget.allowance('Lunch'), {'sodium': 580})
+
+
+class PlanWriterTests(TestCase):
+
+    def setUp(self):
+        self.checkup = make_checkup(make_patient(1), plan_type='3-Meal', dietary='Veg')
+        self.build = lambda: build_plan_rows(self.checkup, {})
+
+    def test_plan_is_written_with_one_insert(self):
+        get_catalog()
+        # count, SAVEPOINT, lock, re-count, INSERT, plan_updated stamp, RELEASE
+        with self.assertNumQueries(7):
+            self.assertTrue(ensure_plan(self.checkup, 21, self.build))
+        with self.assertNumQueries(1):
+            self.assertFalse(ensure_plan(self.checkup, 21, self.build))
+        self.assertEqual(slot_count(AssignedMeal.objects.filter(checkup=self.checkup)), 21)
+
+    def test_mismatched_plan_is_replaced(self):
+        ensure_plan(self.checkup, 21, self.build)
+        AssignedMeal.objects.filter(checkup=self.checkup, day='Sunday').delete()
+        self.assertTrue(ensure_plan(self.checkup, 21, self.build))
+        self.assertEqual(slot_count(AssignedMeal.objects.filter(checkup=self.checkup)), 21)
+
+    def test_plan_loads_in_one_query(self):
+        ensure_plan(self.checkup, 21, self.build)
+        with self.assertNumQueries(1):
+            plan = load_plan(self.checkup)
+        self.assertEqual([len(meals) for meals in plan.weekly_plan.values()], [3] * 7)
+        self.assertEqual(sum(len(m['items']) for meals in plan.weekly_plan.values() for m in meals),
+                         plan.meal_count)
+        self.assertEqual(plan.slot_count, 21)
+        self.assertEqual(plan.total_calories,
+                         sum(AssignedMeal.objects.filter(checkup=self.checkup)
+                             .values_list('total_calories', flat=True)))
+        self.assertEqual(sum(item['qty'] for item in plan.shopping_list.values()), plan.meal_count)
+
+    def test_failed_rebuild_keeps_previous_plan(self):
+        ensure_plan(self.checkup, 21, self.build)
+
+        def broken():
+            raise RuntimeError("solver failure")
+
+        with self.assertRaises(RuntimeError):
+            replace_plan(self.checkup, broken)
+        self.assertEqual(slot_count(AssignedMeal.objects.filter(checkup=self.checkup)), 21)
+
+    def test_regenerate_bumps_revision_and_avoids_previous_checkup(self):
+        generate_plan(self.checkup)
+        first = list(AssignedMeal.objects.filter(checkup=self.checkup).values_list('food_item_id', flat=True))
+        generate_plan(self.checkup, replace=True)
+        self.assertEqual(self.checkup.plan_revision, 1)
+        second = list(AssignedMeal.objects.filter(checkup=self.checkup).values_list('food_item_id', flat=True))
+        self.assertNotEqual(first, second)
+
+        follow_up = make_checkup(self.checkup.patient, plan_type='3-Meal', dietary='Veg')
+        self.assertEqual(previous_plan_foods([follow_up])[follow_up.pk], frozenset(second))
+
+    def test_backfill_does_not_depend_on_chunking(self):
+        later = make_checkup(self.checkup.patient, plan_type='3-Meal', dietary='Veg')
+        make_checkup(make_patient(2), plan_type='3-Meal', dietary='Veg', days_ago=3)
+
+        def backfill(chunk_size):
+            AssignedMeal.objects.all().delete()
+            call_command('generate_plans', '--chunk-size', str(chunk_size), '--workers', '1',
+                         stdout=StringIO())
+            return list(AssignedMeal.objects.order_by('checkup_id', 'id')
+                        .values_list('checkup_id', 'food_item_id', 'quantity_text'))
+
+        whole = backfill(10)
+        self.assertEqual(backfill(1), whole)
+        first_foods = {f for c, f, _ in whole if c == self.checkup.pk}
+        self.assertEqual(previous_plan_foods([later])[later.pk], frozenset(first_foods))
+
+    def test_chunks_keep_each_patients_checkups_together(self):
+        pending = [(1, 'a'), (2, 'b'), (3, 'a'), (4, 'c'), (5, 'b')]
+        self.assertEqual(chunk_by_patient(pending, 2), [[1, 3], [2, 5], [4]])
+        self.assertEqual(chunk_by_patient(pending, 10), [[1, 3, 2, 5, 4]])
+
+    def test_unfillable_slots_are_recorded_not_retried(self):
+        pool = selected_engine()
+        no_dinner = lambda meal, *args, **kwargs: [] if meal == 'Dinner' else pool(meal, *args, **kwargs)
+        with mock.patch('health.generation.selected_engine', return_value=no_dinner):
+            self.assertTrue(generate_plan(self.checkup))
+        self.checkup.refresh_from_db()
+        self.assertEqual(self.checkup.unfillable_slots, 7)
+        self.assertEqual(slot_count(AssignedMeal.objects.filter(checkup=self.checkup)), 14)
+        self.assertFalse(pending_checkups().exists())
+        self.assertFalse(generate_plan(self.checkup))
+
+        self.client.force_login(User.objects.create_user('dietitian', password='x' * 10))
+        url = f'/report/{self.checkup.patient_id}/{self.checkup.id}/'
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertFalse([q for q in queries if 'health_assignedmeal' in q['sql']
+                          and q['sql'].split()[0] in ('INSERT', 'DELETE')])
+
+    def test_pending_checkups_are_generated_in_one_batch(self):
+        four = make_checkup(make_patient(2), plan_type='4-Meal', dietary='Non-Veg')
+        ensure_plan(four, 28, lambda: build_plan_rows(four, {})[:10])
+        self.assertEqual(set(pending_checkups().values_list('id', flat=True)), {self.checkup.id, four.id})
+
+        written = generate_plans(Checkup.objects.select_related('patient'))
+        self.assertEqual({c.id for c in written}, {self.checkup.id, four.id})
+        self.assertEqual(slot_count(AssignedMeal.objects.filter(checkup=four)), 28)
+        self.assertFalse(pending_checkups().exists())
+
+    def test_generate_plans_command(self):
+        out = StringIO()
+        call_command('generate_plans', '--chunk-size', '1', '--workers', '1', stdout=out)
+        self.assertIn('Generated 1 plan(s)', out.getvalue())
+        self.assertEqual(slot_count(AssignedMeal.objects.filter(checkup=self.checkup)), 21)
+
+
+class BenchmarkTests(TestCase):
+
+    def test_run_save_and_compare(self):
+        report_version = namespace('report').version()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / 'baseline.json')
+            call_command('benchmark', '--patients', '3', '--iterations', '3',
+                         '--only', 'dashboard.stats', '--only', 'report.view',
+                         '--save', path, stdout=StringIO())
+            baseline = benchmarks.load(path)
+            self.assertEqual(set(baseline['results']), {'dashboard.stats', 'report.view'})
+            self.assertEqual(baseline['results']['dashboard.stats']['queries'], 5)
+            self.assertFalse(Patient.objects.filter(address='Benchmark Lane').exists())
+            # Fragments cached for the rolled-back rows are retired with them
+            self.assertNotEqual(namespace('report').version(), report_version)
+
+            # Same numbers pass; a baseline with fewer queries fails
+            self.assertEqual(benchmarks.compare(baseline, baseline), [])
+            baseline['results']['dashboard.stats']['queries'] = 1
+            benchmarks.save(baseline, path)
+            with self.assertRaises(CommandError):
+                call_command('benchmark', '--patients', '2', '--iterations', '2',
+                             '--only', 'dashboard.stats', '--compare', path,
+                             stdout=StringIO(), stderr=StringIO())
+
+    def test_instrumentation_overhead_is_measured(self):
+        self.addCleanup(instrumentation.registry.reset)
+        out = StringIO()
+        report = benchmarks.run(patients=2, iterations=4, only={'instrumentation.overhead'},
+                                log=lambda line: out.write(line + '\n'))
+        self.assertEqual(report['results'], {})
+        overhead = report['instrumentation']
+        self.assertGreater(overhead['plain_p50_ms'], 0)
+        self.assertGreater(overhead['instrumented_p50_ms'], 0)
+        self.assertEqual(overhead['budget'], benchmarks.INSTRUMENTATION_BUDGET)
+        self.assertIn('budget', out.getvalue())
+        self.assertIn('generate_dynamic_diet_plan', instrumentation.registry.snapshot()['views'])
+
+
+class ConnectionPoolTests(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = str(Path(tmp.name) / 'pool.sqlite3')
+
+    def make_pool(self, **options):
+        validate = lambda conn: conn.execute('SELECT 1')
+        pool = dbpool.ConnectionPool(lambda: sqlite3.connect(self.path, check_same_thread=False),
+                                     validate, **options)
+        self.addCleanup(pool.close_idle)
+        return pool
+
+    def test_connections_are_reused_and_bounded(self):
+        pool = self.make_pool(max_size=2, timeout=0.05)
+        first, second = pool.checkout(), pool.checkout()
+        with self.assertRaises(dbpool.PoolTimeout):
+            pool.checkout()
+        pool.checkin(first)
+        self.assertIs(pool.checkout(), first)
+        stats = pool.stats()
+        self.assertEqual((stats['checkouts'], stats['connects'], stats['in_use']), (3, 2, 2))
+        self.assertEqual(stats['errors']['timeout'], 1)
+        self.assertEqual(len(stats['waits']), 4)
+        pool.checkin(second)
+
+    def test_broken_and_expired_connections_are_replaced(self):
+        pool = self.make_pool(max_size=1)
+        conn = pool.checkout()
+        pool.checkin(conn)
+        conn.close()                                    # server dropped it while idle
+        fresh = pool.checkout()
+        self.assertIsNot(fresh, conn)
+        self.assertEqual(pool.stats()['errors']['validate'], 1)
+        pool.checkin(fresh, reusable=False)
+
+        aged = self.make_pool(max_size=1, max_lifetime=0)
+        aged.checkin(aged.checkout())
+        self.assertEqual((aged.stats()['recycled'], aged.stats()['idle']), (1, 0))
+
+    def test_backend_checks_connections_in_and_out(self):
+        handler = ConnectionHandler({'default': {
+            'ENGINE': 'health.backends.sqlite3', 'NAME': self.path,
+            'OPTIONS': {'pool': {'max_size': 2}},
+        }})
+        wrapper = handler['default']
+        label = wrapper.pool_label()
+        self.addCleanup(lambda: dbpool._pools.pop(label).close_idle())
+
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        raw = wrapper.connection
+        wrapper.close()
+        wrapper.ensure_connection()
+        self.assertIs(wrapper.connection, raw)
+        wrapper.close()
+
+        pool = instrumentation.registry.snapshot()['db_pools'][label]
+        self.assertEqual((pool['checkouts'], pool['connects'], pool['idle']), (2, 1, 1))
+        self.assertIn('p50', pool['wait_ms'])
+        self.assertIn(f'health_db_pool_checkouts_total{{pool="{label}"}} 2',
+                      instrumentation.registry.prometheus())
+
+    def test_pool_with_persistent_connections_is_flagged(self):
+        pooled = {'ENGINE': 'health.backends.sqlite3', 'NAME': self.path,
+                  'OPTIONS': {'pool': {'max_size': 2}}}
+        with override_settings(DATABASES={'default': {**pooled, 'CONN_MAX_AGE': 0}}):
+            self.assertEqual(dbpool.check_pool_settings(None), [])
+        with override_settings(DATABASES={'default': {**pooled, 'CONN_MAX_AGE': 60}}):
+            self.assertEqual([w.id for w in dbpool.check_pool_settings(None)], ['health.W001'])
+
+
+@override_settings(HEALTH_INSTRUMENTATION=True, HEALTH_METRICS_TOKEN='scrape-me')
+class InstrumentationTests(TestCase):
+
+    def setUp(self):
+        instrumentation.registry.reset()
+        self.addCleanup(instrumentation.registry.reset)
+        self.staff = User.objects.create_user('ops', password='x' * 10, is_staff=True)
+
+    def test_views_are_recorded_with_sql_and_template_time(self):
+        self.client.force_login(self.staff)
+        patient = make_patient(1)
+        make_checkup(patient)
+        self.client.get('/')
+        self.client.get('/search_patients/', {'q': 'Pat'})
+
+        metrics = self.client.get('/metrics/').json()
+        self.assertIn('dashboard', metrics['cache'])
+        views = metrics['views']
+        home = views['home']
+        self.assertEqual(home['requests'], 1)
+        self.assertGreaterEqual(home['queries']['max'], 5)      # dashboard batch + session/user
+        self.assertGreater(home['template_ms']['max'], 0)
+        self.assertIn('search_patients', views)
+
+    def test_duplicate_queries_are_counted(self):
+        stats = instrumentation.RequestStats()
+        with connection.execute_wrapper(stats):
+            for _ in range(3):
+                list(Patient.objects.filter(id=1))
+        self.assertEqual((stats.queries, stats.duplicates), (3, 2))
+
+    def test_access_and_prometheus_format(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        self.client.force_login(User.objects.create_user('dietitian', password='x' * 10))
+        self.client.get('/')
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+
+        text = self.client.get('/metrics/prometheus/', HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(text.status_code, 200)
+        body = text.content.decode()
+        self.assertIn('health_request_duration_seconds_bucket{view="home",le="+Inf"} 1', body)
+        self.assertIn('health_db_queries_total{view="home"}', body)
@@ -28,8 +28,13 @@ urlpatterns = [
 
     # API for Pop-up Search
     path('get_patient_details/', views.get_patient_details, name='get_patient_details'),
+    path('search_patients/', views.search_patients_api, name='search_patients'),
 
     path('delete_checkup/<int:checkup_id>/', views.delete_checkup, name='delete_checkup'),
 
     path('download_pdf/<int:checkup_id>/', views.download_pdf, name='download_pdf'),
+
+    # Instrumentation (staff / bearer token)
+    path('metrics/', views.metrics_json, name='metrics_json'),
+    path('metrics/prometheus/', views.metrics_prometheus, name='metrics_prometheus'),
 ]
@@ -1,16 +1,32 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse, HttpResponse
+from django.conf import settings
+from django.http import JsonResponse, HttpResponse, HttpResponseForbidden
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
-from django.template.loader import get_template
-from django.db.models import Q
 from django.contrib import messages
-from xhtml2pdf import pisa
-from .models import Patient, Checkup, FoodItem, AssignedMeal, Disease
+from django.contrib.messages import get_messages
+from django.db import transaction
+from django.middleware.csrf import get_token
+from .models import Patient, Checkup, Disease
+from .dashboard import cached_dashboard_stats, bmi_histogram
+from .directory import patient_page
+from .search import search_patients
+from .filters import filter_pool
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import http_date, quote_etag
+from .restrictions import compile_merge, restrictions_for_checkup
+from .disease_index import get_disease_index
+from .plans import load_plan
+from .engine import diet_goal_for
+from .generation import expected_slot_count, generate_plan
+from .pdf import PdfRenderError, pdf_response, prerender
+from .cache import stats as cache_stats
+from .report_cache import ReportVersions
+from . import instrumentation, report_cache, restrictions
+import hashlib
 import json
-import random
 import math
-from datetime import timedelta
 
 # ==========================================
 # 1. DASHBOARD & STATIC PAGES
@@ -18,81 +34,8 @@ from datetime import timedelta
 
 @login_required
 def home(request):
-    from django.db.models import Avg, Count
-    from datetime import date
-    import calendar
-
-    today = timezone.now().date()
-    total_patients = Patient.objects.count()
-    today_visits   = Checkup.objects.filter(date=today).count()
-
-    # ------- BMI category counts (latest checkup per patient) -------
-    underweight = normal = overweight = obese = 0
-    bmi_sum = 0
-    bmi_count = 0
-    for p in Patient.objects.all():
-        last = Checkup.objects.filter(patient=p).order_by('date').last()
-        if last:
-            bmi_sum += float(last.bmi)
-            bmi_count += 1
-            cat = last.category
-            if 'Underweight' in cat:   underweight += 1
-            elif 'Normal'    in cat:   normal      += 1
-            elif 'Overweight' in cat:  overweight  += 1
-            elif 'Obese'     in cat:   obese       += 1
-
-    avg_bmi = round(bmi_sum / bmi_count, 1) if bmi_count else 0
-    high_risk_pct = round((obese / total_patients) * 100) if total_patients else 0
-
-    # ------- 30-day daily trends -------
-    days_labels = []
-    daily_visits = []
-    for i in range(29, -1, -1):
-        d = today - timedelta(days=i)
-        days_labels.append(d.strftime('%b %d'))
-        daily_visits.append(Checkup.objects.filter(date=d).count())
-
-    # ------- Plan-type distribution -------
-    plan_counts = {}
-    for c in Checkup.objects.values('plan_type').annotate(cnt=Count('id')):
-        plan_counts[c['plan_type'] or 'Other'] = c['cnt']
-
-    # ------- Recent activity (last 6 real checkups) -------
-    recent_checkups = (
-        Checkup.objects
-        .select_related('patient')
-        .order_by('-date', '-id')[:6]
-    )
-    recent_activity = []
-    for c in recent_checkups:
-        # Compute diet_goal inline (not a model field)
-        _bmi = float(c.bmi)
-        _goal = 'Weight Loss' if _bmi >= 25 else ('Weight Gain' if _bmi < 18.5 else 'Maintenance')
-        recent_activity.append({
-            'patient_name': c.patient.name,
-            'patient_id':   c.patient.id,
-            'date':         c.date.strftime('%b %d, %Y'),
-            'bmi':          _bmi,
-            'category':     c.category,
-            'goal':         _goal,
-            'plan':         c.plan_type,
-            'id':           c.id,
-        })
-
-    context = {
-        'total_patients':  total_patients,
-        'today_visits':    today_visits,
-        'avg_bmi':         avg_bmi,
-        'high_risk_pct':   high_risk_pct,
-        'underweight': underweight, 'normal': normal,
-        'overweight':  overweight,  'obese':  obese,
-        'days_labels':  json.dumps(days_labels),
-        'daily_visits': json.dumps(daily_visits),
-        'plan_labels':  json.dumps(list(plan_counts.keys())),
-        'plan_values':  json.dumps(list(plan_counts.values())),
-        'recent_activity': recent_activity,
-    }
-    return render(request, 'home.html', context)
+    # All dashboard aggregates come from one fixed-size batch of queries
+    return render(request, 'home.html', cached_dashboard_stats())
 
 # ==========================================
 # PROFILE & ACCOUNT
@@ -111,14 +54,8 @@ def profile(request):
     avg_bmi_q = Checkup.objects.aggregate(a=Avg('bmi'))
     avg_bmi   = round(avg_bmi_q['a'], 1) if avg_bmi_q['a'] else 0
 
-    bmi_stats = {'Underweight': 0, 'Normal': 0, 'Overweight': 0, 'Obese': 0}
-    for p in Patient.objects.all():
-        last = Checkup.objects.filter(patient=p).order_by('date').last()
-        if last:
-            for key in bmi_stats:
-                if key in last.category:
-                    bmi_stats[key] += 1
-                    break
+    # Latest checkup per patient — single aggregate query
+    bmi_stats, _ = bmi_histogram()
 
     recent = (Checkup.objects.select_related('patient')
               .order_by('-date', '-id')[:3])
@@ -163,8 +100,6 @@ def change_password(request):
 @login_required
 def patients(request):
     from django.db.models import Count, Q
-    from django.utils import timezone
-    from datetime import timedelta
 
     query      = request.GET.get('q', '').strip()
     bmi_filter = request.GET.get('bmi_filter', '')
@@ -183,45 +118,19 @@ def patients(request):
             'date_range':  date_range,
         })
 
-    all_patients = Patient.objects.all().order_by('-id')
+    totals = Patient.objects.aggregate(
+        total=Count('id'),
+        male=Count('id', filter=Q(gender='Male')),
+        female=Count('id', filter=Q(gender='Female')),
+    )
     total_visits = Checkup.objects.count()
-    male_count   = all_patients.filter(gender='Male').count()
-    female_count = all_patients.filter(gender='Female').count()
-    total_patients_count = all_patients.count()
-
-    qs = all_patients
-    if query:
-        qs = qs.filter(Q(name__icontains=query) | Q(phone__icontains=query))
 
-    today = timezone.now().date()
-    if date_range == 'today':
-        since = today
-    elif date_range == 'week':
-        since = today - timedelta(days=7)
-    elif date_range == 'month':
-        since = today - timedelta(days=30)
-    else:
-        since = None
-
-    patients_data = []
-    for p in qs:
-        checkup_qs = Checkup.objects.filter(patient=p).order_by('-date')
-        if since:
-            checkup_qs = checkup_qs.filter(date__gte=since)
-        latest = checkup_qs.first()
-
-        if bmi_filter and latest and latest.category != bmi_filter:
-            continue
-        if since and not latest:
-            continue
-        if bmi_filter and not latest:
-            continue
-
-        patients_data.append({
-            'patient':       p,
-            'latest':        latest,
-            'total_visits':  Checkup.objects.filter(patient=p).count(),
-        })
+    # Keyset-paginated, SQL-filtered directory page
+    page = patient_page(
+        query, bmi_filter, date_range,
+        after=request.GET.get('after'), before=request.GET.get('before'),
+    )
+    patients_data = page.rows
 
     error_message = None
     if any_filter and not patients_data:
@@ -229,10 +138,12 @@ def patients(request):
 
     return render(request, 'patients.html', {
         'patients_data': patients_data,
+        'next_cursor':  page.next_cursor,
+        'prev_cursor':  page.prev_cursor,
         'total_visits': total_visits,
-        'male_count':   male_count,
-        'female_count': female_count,
-        'total_patients_count': total_patients_count,
+        'male_count':   totals['male'],
+        'female_count': totals['female'],
+        'total_patients_count': totals['total'],
         'query': query,
         'bmi_filter': bmi_filter,
         'date_range': date_range,
@@ -269,6 +180,19 @@ def get_patient_details(request):
             return JsonResponse({'exists': False, 'error': 'Patient ID/Phone not found.'})
 
 
+@login_required
+def search_patients_api(request):
+    """Typeahead: ranked top-K patients by name or phone fragment."""
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), 50))
+    except ValueError:
+        limit = 10
+    results = [
+        {'id': p.id, 'name': p.name, 'phone': p.phone, 'gender': p.gender}
+        for p in search_patients(query, limit=limit)
+    ]
+    return JsonResponse({'query': query, 'results': results})
 
 
 @login_required
@@ -291,7 +215,7 @@ def new_patient(request):
         dietary  = request.POST.get('dietary', 'Non-Veg').strip()
         plan_type = request.POST.get('plan_type', '').strip()
 
-        all_diseases = list(Disease.objects.values_list('name', flat=True).order_by('name'))
+        all_diseases = get_disease_index().sorted_names()
         ctx_error = {'all_diseases_json': json.dumps(all_diseases)}
 
         # ── Server-side validation ──────────────────────────────────────────
@@ -329,36 +253,31 @@ def new_patient(request):
         diseases_str   = request.POST.get('diseases', '').strip()
         blood_pressure = request.POST.get('bp', '120/80').strip() or '120/80'
 
-        bmi, bmr, tdee, category, target_calories = calculate_metrics(
-            weight, height_cm, age, gender, activity
-        )
-
-        carbs_target   = target_calories * 0.4 / 4
-        protein_target = target_calories * 0.3 / 4
-        fat_target     = target_calories * 0.3 / 9
-
         patient, created = Patient.objects.get_or_create(
             phone=phone,
             defaults={'name': name, 'gender': gender, 'address': address}
         )
 
-        checkup = Checkup.objects.create(
+        # Metrics are computed once here and stamped with the formula version
+        checkup = Checkup(
             patient=patient,
             age=age, height=height_cm, weight=weight, activity=activity,
             dietary=dietary, plan_type=plan_type,
-            bmi=bmi, bmr=bmr, tdee=tdee, category=category,
             blood_pressure=blood_pressure,
             diseases=diseases_str,
-            protein_target=protein_target, carbs_target=carbs_target, fat_target=fat_target
         )
+        checkup.compute_metrics(gender)
+        checkup.save()
 
         # ── Link diseases (M2M) and sync legacy text field ──────────────────
         _link_diseases_to_checkup(checkup, diseases_str)
+        if generate_plan(checkup):
+            prerender_pdf(request, checkup)
 
         return redirect('generate_dynamic_diet_plan', patient_id=patient.id, checkup_id=checkup.id)
 
     # Build sorted unique disease name list from DB for the searchable dropdown
-    all_diseases = list(Disease.objects.values_list('name', flat=True).order_by('name'))
+    all_diseases = get_disease_index().sorted_names()
     return render(request, 'new_patient.html', {
         'all_diseases_json': json.dumps(all_diseases)
     })
@@ -372,7 +291,7 @@ def existing_patient(request):
         plan_type = request.POST.get('plan_type', '').strip()
         dietary   = request.POST.get('dietary', 'Non-Veg').strip()
 
-        all_diseases = list(Disease.objects.values_list('name', flat=True).order_by('name'))
+        all_diseases = get_disease_index().sorted_names()
         ctx_error = {'all_diseases_json': json.dumps(all_diseases)}
 
         try:
@@ -400,25 +319,19 @@ def existing_patient(request):
         diseases_str = request.POST.get('diseases', '').strip()
         bp           = request.POST.get('bp', '120/80').strip() or '120/80'
 
-        bmi, bmr, tdee, category, target_calories = calculate_metrics(
-            weight, height_cm, age, patient.gender, activity
-        )
-
-        carbs_target   = target_calories * 0.4 / 4
-        protein_target = target_calories * 0.3 / 4
-        fat_target     = target_calories * 0.3 / 9
-
-        checkup = Checkup.objects.create(
+        checkup = Checkup(
             patient=patient,
             age=age, height=height_cm, weight=weight, activity=activity,
             dietary=dietary, plan_type=plan_type,
-            bmi=bmi, bmr=bmr, tdee=tdee, category=category,
             blood_pressure=bp,
             diseases=diseases_str,
-            protein_target=protein_target, carbs_target=carbs_target, fat_target=fat_target
         )
+        checkup.compute_metrics(patient.gender)
+        checkup.save()
         # ── Link diseases (M2M) and sync legacy text field ──────────────────
         _link_diseases_to_checkup(checkup, diseases_str)
+        if generate_plan(checkup):
+            prerender_pdf(request, checkup)
 
         return redirect('generate_dynamic_diet_plan', patient_id=patient.id, checkup_id=checkup.id)
 
@@ -430,47 +343,24 @@ def existing_patient(request):
 
     patients_data = []
     error_message = None
+    next_cursor = prev_cursor = None
 
     if any_filter:
-        qs = Patient.objects.all()
-        if query:
-            qs = qs.filter(Q(name__icontains=query) | Q(phone__icontains=query))
-
-        today = timezone.now().date()
-        if date_range == 'today':
-            since = today
-        elif date_range == 'week':
-            since = today - timedelta(days=7)
-        elif date_range == 'month':
-            since = today - timedelta(days=30)
-        else:
-            since = None
-
-        for p in qs:
-            checkup_qs = Checkup.objects.filter(patient=p).order_by('-date')
-            if since:
-                checkup_qs = checkup_qs.filter(date__gte=since)
-            latest = checkup_qs.first()
-
-            if bmi_filter and latest and latest.category != bmi_filter:
-                continue
-            if since and not latest:
-                continue
-            if bmi_filter and not latest:
-                continue
-
-            patients_data.append({
-                'patient':      p,
-                'latest':       latest,
-                'total_visits': Checkup.objects.filter(patient=p).count(),
-            })
+        page = patient_page(
+            query, bmi_filter, date_range,
+            after=request.GET.get('after'), before=request.GET.get('before'),
+        )
+        patients_data = page.rows
+        next_cursor, prev_cursor = page.next_cursor, page.prev_cursor
 
         if not patients_data:
             error_message = "No patients match your search criteria."
 
-    all_diseases = list(Disease.objects.values_list('name', flat=True).order_by('name'))
+    all_diseases = get_disease_index().sorted_names()
     context = {
         'patients_data':     patients_data,
+        'next_cursor':       next_cursor,
+        'prev_cursor':       prev_cursor,
         'query':             query,
         'bmi_filter':        bmi_filter,
         'date_range':        date_range,
@@ -488,84 +378,30 @@ def existing_patient(request):
 def _link_diseases_to_checkup(checkup, diseases_str):
     """
     Given a comma-separated disease string from the form, resolve each name
-    against the Disease table (exact then partial match), set the M2M, and
-    sync the legacy diseases TextField.
+    against the in-memory disease index (exact then partial match), set the
+    M2M in one bulk write, and sync the legacy diseases TextField without
+    re-querying.
     """
-    checkup.disease_links.clear()
-    names = [d.strip() for d in diseases_str.split(',') if d.strip()]
-    for name in names:
-        disease = (
-            Disease.objects.filter(name__iexact=name).first()
-            or Disease.objects.filter(name__icontains=name).first()
-        )
-        if disease:
-            checkup.disease_links.add(disease)
-    checkup.sync_diseases_text()
+    index = get_disease_index()
+    disease_ids = index.resolve(diseases_str)
+    checkup.disease_links.set(disease_ids)
+    checkup.sync_diseases_text(names=index.sorted_names(disease_ids))
 
 
 # ==========================================
 # 4. CLINICAL ALGORITHM (BODY TYPE & DYNAMIC PORTION)
 # ==========================================
-
-def calculate_metrics(weight, height, age, gender, activity):
-    """
-    ENGINE A: METRIC CALCULATION
-    Returns: BMI, BMR, TDEE, Category, TARGET_CALORIES
-    """
-    # 1. BMI
-    height_m = height / 100
-    bmi = round(weight / (height_m ** 2), 2)
-    
-    # 2. BMR (Mifflin-St Jeor) — fixed gender check
-    if gender.lower() == 'female':
-        s = -161
-    else:
-        s = 5  # male or other
-    
-    bmr = (10 * weight) + (6.25 * height) - (5 * age) + s
-    bmr = round(bmr, 2)
-    
-    # 3. TDEE
-    tdee = round(bmr * activity, 2)
-    
-    # 4. Clinical Caloric Targeting (TDEE-relative)
-    if bmi < 18.5:
-        category = "Underweight"
-        # Weight Gain (Surplus of 500 kcal is a safe clinical standard)
-        target = tdee + 500
-    elif bmi < 25:
-        category = "Normal"
-        # Maintenance (Matches TDEE exactly)
-        target = tdee
-    elif bmi < 30:
-        category = "Overweight"
-        # Weight Loss (Deficit of 500 kcal)
-        target = tdee - 500
-    else:
-        category = "Obese"
-        # Aggressive Weight Loss (Deficit of 750-1000 kcal, floor at 1200)
-        target = tdee - 750
-        
-    # Safety Constraint: Never go below 1200 kcal for general health
-    if target < 1200:
-        target = 1200
-    
-    return bmi, bmr, tdee, category, int(target)
+# Engines A (metrics), C (portions) and D (weekly rotation) live in
+# health.generation; the wrappers below keep the restriction/filter entry points.
 
 def get_restricted_nutrients_from_queryset(disease_qs):
     """
     ENGINE A2 (internal): takes a Disease queryset ordered by priority asc.
     Higher-priority disease overwrites lower ones on conflicts.
-    Returns a dict: { nutrient: {'max': max_daily_g, 'banned': is_banned} }
+    Returns a read-only mapping { nutrient: {'max': max_daily_g, 'banned': is_banned} }
+    with the compiled engine rules on `.rules` (health.restrictions).
     """
-    restrictions = {}
-    for disease in disease_qs.order_by('priority'):
-        for nutrient, rule in disease.restricted_nutrients.items():
-            restrictions[nutrient] = {
-                'max': rule.get('max'),
-                'banned': rule.get('banned', False)
-            }
-    return restrictions
+    return compile_merge(disease_qs.order_by('priority', 'id'))
 
 
 def get_restricted_nutrients(diseases_str):
@@ -588,8 +424,9 @@ def get_restricted_nutrients_from_checkup(checkup):
     """
     ENGINE A2 (preferred): Uses the authoritative M2M disease_links relation
     on a Checkup instead of the legacy text field, avoiding sync drift.
+    Merges are memoised per disease-set fingerprint (health.restrictions).
     """
-    return get_restricted_nutrients_from_queryset(checkup.disease_links.all())
+    return restrictions_for_checkup(checkup)
 
 
 def _get_nutrient_list(diseases_str):
@@ -598,257 +435,71 @@ def _get_nutrient_list(diseases_str):
 
 def smart_filter(category, meal_type, diet_pref, bmi_category, restrictions=None):
     """
-    ENGINE B: SMART FILTER  (ORM-level, threshold-aware)
+    ENGINE B: SMART FILTER  (threshold-aware)
     restrictions = dict returned by get_restricted_nutrients():
         { 'sodium': {'max': 1500.0, 'banned': False}, ... }
     Smart defaults are applied when a restriction has no explicit threshold.
+    The pool is built by the engine selected in settings.HEALTH_FOOD_FILTER_ENGINE
+    (in-memory catalog snapshot by default) — see health.filters.
     """
-    SMART_DEFAULTS = {
-        'sodium':    400,    # mg  per 100 g serving
-        'sugar':      8,     # g   per 100 g serving
-        'fat':       30,     # g   per 100 g
-        'carbs':     50,     # g   per 100 g
-        'protein':   None,   # protein restriction — only filter very high-protein foods for renal
-        'fiber':     None,   # high fiber is usually good; only restrict in IBD
-        'potassium': None,
-        'calcium':   None,
-        'phosphorus':None,
-    }
+    return filter_pool(meal_type, diet_pref, bmi_category, restrictions)
 
-    # Map high-level meal labels to database categories
-    db_category = meal_type
-    if 'Snack' in meal_type or 'Mid-Morning' in meal_type:
-        db_category = 'Snack'
-
-    items = FoodItem.objects.filter(category=db_category)
-
-    # ── Dietary preference filter ────────────────────────────────────────────
-    if diet_pref == 'Veg':
-        items = items.filter(diet_type__in=['Veg', 'Vegan'])
-    elif diet_pref == 'Vegan':
-        items = items.filter(diet_type='Vegan')
-    elif diet_pref == 'Eggetarian':
-        # Eggetarian: vegetarian foods + eggs; exclude meat-based Non-Veg
-        items = items.filter(diet_type__in=['Veg', 'Vegan'])
-        # Note: Add diet_type='Egg' to FoodItem if egg dishes are in the DB
-
-    # ── BMI-based base filters ──────────────────────────────────────────────
-    if bmi_category in ['Obese', 'Overweight']:
-        items = items.exclude(sugar__gt=8)
-        items = items.filter(Q(fiber__gte=3) | Q(protein__gte=5))
-    elif bmi_category == 'Underweight':
-        items = items.filter(calories__gte=100)
-
-    # ── Disease restriction filters (ORM-level, threshold-aware) ───────────
-    if restrictions:
-        for nutrient, rule in restrictions.items():
-            if rule.get('banned'):
-                # Completely exclude any food containing this nutrient (value > 0 is excluded)
-                kwargs = {f"{nutrient}__gt": 0}
-                items = items.exclude(**kwargs)
-                continue
-
-            max_daily = rule.get('max')
-            # Fallback to Smart Defaults if no specific DB limit is found
-            per_100g_limit = None
-            if max_daily is not None:
-                # Divide daily limit by ~4 to get a rough per-100g serving threshold
-                # e.g., 1500mg daily Sodium -> 375mg per 100g max limit
-                per_100g_limit = max_daily / 4.0
-            else:
-                per_100g_limit = SMART_DEFAULTS.get(nutrient)
-                
-            if per_100g_limit is None:
-                continue   # no threshold to apply — skip
-
-            # Explicitly apply > limit exclusion using ORM kwargs
-            kwargs = {f"{nutrient}__gt": per_100g_limit}
-            items = items.exclude(**kwargs)
-
-    return list(items)
-
-def dynamic_portion_solver(food, meal_target_cal):
+def report_validators(request, checkup, versions):
     """
-    ENGINE C: DYNAMIC PORTION MATH (Step 7)
-    Adjusts portion to meet the meal target in Grams.
+    (ETag, Last-Modified) for the report page, from cached version stamps
+    only. The ETag covers everything the page shows: the checkup and its
+    metric formula, the plan write, the patient and their checkup history
+    (health.report_cache stamps), disease/food catalog versions, the
+    template, the viewer and their session — the page's logout form carries
+    a token masked from the session's CSRF secret, which rotates at login.
+    Last-Modified is the newest of the plan write and the history stamp.
     """
-    base_cal_per_100g = food.calories
-    if base_cal_per_100g <= 0:
-        return "100 g", 0
-    
-    # Required grams = (target calories / calories per 100g) * 100
-    required_grams = (meal_target_cal / base_cal_per_100g) * 100
-    
-    # Sanity checks so we don't prescribe absurd amounts
-    if required_grams > 500:
-        required_grams = 500
-    if required_grams < 20:
-        required_grams = 20
-        
-    final_grams = round(required_grams / 10) * 10 # round to nearest 10g for cleaner UI
-    
-    qty_text = f"{final_grams} g"
-    total_cal = int((final_grams / 100.0) * base_cal_per_100g)
-    
-    return qty_text, total_cal
-
-@login_required
-def generate_dynamic_diet_plan(request, patient_id, checkup_id):
-    patient = get_object_or_404(Patient, id=patient_id)
-    checkup = get_object_or_404(Checkup, id=checkup_id)
-    
-    # --- 1. RE-CALCULATE METRICS (Ensure fresh logic) ---
-    bmi, bmr, tdee, category, target_calories = calculate_metrics(
-        checkup.weight, checkup.height, checkup.age, patient.gender, checkup.activity
+    patient = checkup.patient
+    get_token(request)                                  # make sure the secret exists
+    parts = (
+        checkup.pk, checkup.metrics_version, checkup.plan_revision, checkup.plan_updated,
+        checkup.diseases, versions.stamps, versions.base,
+        patient.name, patient.phone, patient.gender,
+        restrictions.current_version(), request.user.pk,
+        getattr(request, 'session', None) and request.session.session_key,
+        request.META.get('CSRF_COOKIE'),
     )
-    
-    # Update Checkup Model with new calculations
-    checkup.bmi = bmi
-    checkup.bmr = bmr
-    checkup.tdee = tdee
-    checkup.category = category
-    
-    # Define Macro Split (40/30/30 generic for now)
-    checkup.carbs_target = target_calories * 0.4 / 4
-    checkup.protein_target = target_calories * 0.3 / 4
-    checkup.fat_target = target_calories * 0.3 / 9
-    checkup.save()
-
-    # Determine Diet Goal based on BMI
-    diet_goal = "Maintenance"
-    if bmi >= 25:
-        diet_goal = "Weight Loss"
-    elif bmi < 18.5:
-        diet_goal = "Weight Gain"
-
-    if checkup.plan_type == '3-Meal':
-        splits = {'Breakfast': 0.30, 'Lunch': 0.40, 'Dinner': 0.30}
-    else:
-        # 4-Meal Split (Replacing old 5-meal as per user request)
-        splits = {
-            'Breakfast': 0.25, 
-            'Lunch': 0.35, 
-            'Evening Snack': 0.10, 
-            'Dinner': 0.30
-        }
-
-    # --- 3. GENERATION LOOP ---
-    existing_meals = AssignedMeal.objects.filter(checkup=checkup)
-    
-    if existing_meals.exists() and existing_meals.count() != 7 * len(splits):
-        existing_meals.delete()
-    
-    if not AssignedMeal.objects.filter(checkup=checkup).exists():
-        days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        
-        # Determine disease restrictions via M2M (authoritative, avoids sync drift)
-        restricted = get_restricted_nutrients_from_checkup(checkup)
-
-        pools = {}
-        for meal in splits.keys():
-            pools[meal] = smart_filter(meal, meal, checkup.dietary, category, restricted)
-            random.Random(f"{patient.id}_{meal}").shuffle(pools[meal])
-            
-        for day in days:
-            for meal_name, pct in splits.items():
-                meal_target = target_calories * pct
-                pool = pools[meal_name]
-                
-                if pool:
-                    selected_food = pool.pop(0)
-                    pools[meal_name].append(selected_food)
-                    
-                    qty_str, final_cal = dynamic_portion_solver(selected_food, meal_target)
-                    
-                    AssignedMeal.objects.create(
-                        checkup=checkup, day=day, meal_type=meal_name,
-                        food_item=selected_food,
-                        quantity_text=qty_str,
-                        total_calories=final_cal
-                    )
-
-    # --- 4. RETRIEVAL & DISPLAY ---
-    weekly_plan = {}
-    db_meals = AssignedMeal.objects.filter(checkup=checkup)
-    days_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    
-    for day in days_order:
-        day_meals = db_meals.filter(day=day)
-        day_list = []
-        for m in day_meals.order_by('id'):
-            day_list.append({
-                'meal': m.meal_type, 'food': m.food_item.name,
-                'qty': m.quantity_text,
-                'cal': m.total_calories, 
-                'p': m.food_item.protein, 'c': m.food_item.carbs, 'f': m.food_item.fat
-            })
-        weekly_plan[day] = day_list
-
-    # Charts History & Analytics
-    history = Checkup.objects.filter(patient=patient).order_by('-id')
-    
+    etag = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+    return quote_etag(etag), versions.last_modified
+
+
+def patient_analytics(patient):
+    """Progress arrays and deltas for the report's analytics board and charts."""
     analytics_data = Checkup.objects.filter(patient=patient).order_by('date')
-    
+
     a_dates = [h.date.strftime("%b %d") for h in analytics_data]
     a_weights = [float(h.weight) for h in analytics_data]
     a_bmis = [float(h.bmi) for h in analytics_data]
-    
+
     start_weight = a_weights[0] if a_weights else 0
     current_w = a_weights[-1] if a_weights else 0
     total_weight_change = round(current_w - start_weight, 2)
-    
+
     start_bmi = a_bmis[0] if a_bmis else 0
     current_b = a_bmis[-1] if a_bmis else 0
     total_bmi_change = round(current_b - start_bmi, 2)
 
-    # --- 5. AGGREGATES & SHOPPING LIST ---
-    # Parse actual grams from quantity_text (e.g. "250 g" → 250)
-    # and scale per-100g nutrient values to get real consumed amounts.
-    weekly_totals = {'cal': 0, 'p': 0, 'c': 0, 'f': 0, 'fiber': 0, 'sugar': 0}
-    shopping_list = {}
-
-    for m in db_meals:
-        # Extract numeric grams from text like "250 g" or "100 g"
-        qty_parts = m.quantity_text.split()
-        try:
-            grams = float(qty_parts[0])
-        except (ValueError, IndexError):
-            grams = 100.0  # safe fallback
-        scale = grams / 100.0
-
-        fi = m.food_item
-        weekly_totals['cal']   += m.total_calories              # already portion-adjusted
-        weekly_totals['p']     += round(fi.protein * scale, 2)
-        weekly_totals['c']     += round(fi.carbs   * scale, 2)
-        weekly_totals['f']     += round(fi.fat     * scale, 2)
-        weekly_totals['fiber'] += round(getattr(fi, 'fiber', 0) * scale, 2)
-        weekly_totals['sugar'] += round(getattr(fi, 'sugar', 0) * scale, 2)
-
-        fname = fi.name
-        if fname in shopping_list:
-            shopping_list[fname]['qty'] += 1
-        else:
-            shopping_list[fname] = {
-                'qty': 1,
-                'unit': fi.unit_name,
-                'cat': fi.category
-            }
-
-    # Daily Averages
-    daily_avg = {k: round(v / 7, 1) for k, v in weekly_totals.items()}
-    
-    # Weight Projection (7.7 kcal ≈ 1g; 7700 kcal ≈ 1 kg)
-    # Corrected Sign: (Daily Prescribed Intake - Daily Burn)
-    daily_cal_diff = daily_avg['cal'] - tdee
-    projected_weight_change = round((daily_cal_diff * 7 * 8) / 7700, 2)  # 8-week total in kg
+    return {
+        'a_dates': json.dumps(a_dates),
+        'a_weights': json.dumps(a_weights),
+        'a_bmis': json.dumps(a_bmis),
+        'total_weight_change': total_weight_change,
+        'total_bmi_change': total_bmi_change,
+        'start_weight': start_weight,
+        'visits': len(a_dates),
+    }
 
-    # Clinical Display: For Maintenance, show 0 trend to avoid confusing the patient
-    if diet_goal == "Maintenance":
-        projected_weight_change = 0
 
-    # ─────────────────────────────────────────────────────────────────────────
-    # Prepare WhatsApp Share Text  (WhatsApp markdown: *bold*, _italic_, emojis)
-    # ─────────────────────────────────────────────────────────────────────────
+def whatsapp_link_for(patient, checkup, weekly_plan, diet_goal, target_calories):
+    """
+    wa.me share link with the plan as WhatsApp markdown (*bold*, _italic_, emojis).
+    Built lazily: only when the report's cached `wa_link` fragment misses.
+    """
     day_emojis = {
         'Monday':    '🟢', 'Tuesday':  '🔵', 'Wednesday': '🟣',
         'Thursday':  '🟠', 'Friday':   '🔴', 'Saturday':  '🟡',
@@ -903,7 +554,8 @@ def generate_dynamic_diet_plan(request, patient_id, checkup_id):
         for m in meals:
             meal_icon = meal_emojis.get(m['meal'], '🍽️')
             lines.append(f"  {meal_icon} _{m['meal']}_")
-            lines.append(f"     • {m['food']}")
+            for item in m['items']:
+                lines.append(f"     • {item['food']} ({item['qty']})")
             lines.append(f"     🔥 {m['cal']} kcal")
         lines.append("  ┄┄┄┄┄┄┄┄┄┄┄┄┄┄┄┄┄┄┄┄")
         lines.append("")
@@ -935,9 +587,74 @@ def generate_dynamic_diet_plan(request, patient_id, checkup_id):
     if not clean_phone.startswith('+'):
         clean_phone = '91' + clean_phone  # default to India (+91)
     whatsapp_link = f"https://wa.me/{clean_phone}?text={urllib.parse.quote(whatsapp_text)}"
+    return whatsapp_link
+
+
+@login_required
+def generate_dynamic_diet_plan(request, patient_id, checkup_id):
+    checkup = get_object_or_404(
+        Checkup.objects.select_related('patient'), id=checkup_id, patient_id=patient_id
+    )
+    patient = checkup.patient
+
+    # --- 1. METRICS (stamped at checkup creation; recomputed only for an old formula) ---
+    checkup.ensure_metrics()
+
+    # Repeat views of an unchanged report are answered before any plan work —
+    # unless a flash message is pending: that page must not be reused later
+    versions = ReportVersions(checkup)
+    etag, last_modified = report_validators(request, checkup, versions)
+    cacheable = not len(get_messages(request))
+    if cacheable:
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+    tdee, target_calories = checkup.tdee, checkup.target_calories
+    diet_goal = diet_goal_for(checkup.bmi)
+
+    # Disease restrictions via M2M (authoritative, avoids sync drift) — display only
+    restricted = get_restricted_nutrients_from_checkup(checkup)
+
+    # --- 2. RETRIEVAL & DISPLAY (one query for the whole week, cached per plan version) ---
+    # Plans are written when the checkup is created (health.generation).
+    plan = versions.get_or_build('plan', lambda: load_plan(checkup))
+    if plan.slot_count + checkup.unfillable_slots != expected_slot_count(checkup.plan_type):
+        # Checkup predates eager generation and was not backfilled
+        # by `manage.py generate_plans` yet
+        if generate_plan(checkup):
+            prerender_pdf(request, checkup)
+        plan = load_plan(checkup)
+        versions = ReportVersions(checkup)
+        etag, last_modified = report_validators(request, checkup, versions)
+    weekly_plan = plan.weekly_plan
+
+    # Charts History & Analytics — evaluated only when their cached fragments miss
+    history = Checkup.objects.filter(patient=patient).order_by('-id')
+    analytics = SimpleLazyObject(lambda: patient_analytics(patient))
+
+    # --- 5. AGGREGATES & SHOPPING LIST ---
+    # Portion-scaled totals and the shopping list come from the same plan load.
+    shopping_list = plan.shopping_list
+
+    # Daily Averages
+    daily_avg = plan.daily_avg
+    
+    # Weight Projection (7.7 kcal ≈ 1g; 7700 kcal ≈ 1 kg)
+    # Corrected Sign: (Daily Prescribed Intake - Daily Burn)
+    daily_cal_diff = daily_avg['cal'] - tdee
+    projected_weight_change = round((daily_cal_diff * 7 * 8) / 7700, 2)  # 8-week total in kg
+
+    # Clinical Display: For Maintenance, show 0 trend to avoid confusing the patient
+    if diet_goal == "Maintenance":
+        projected_weight_change = 0
+
+    whatsapp_link = SimpleLazyObject(
+        lambda: whatsapp_link_for(patient, checkup, weekly_plan, diet_goal, target_calories)
+    )
 
     # Restricted nutrients for display — use M2M as the authoritative source
-    restricted_nutrients = sorted(get_restricted_nutrients_from_checkup(checkup).keys())
+    restricted_nutrients = sorted(restricted.keys())
 
     # Pre-split diseases list so template doesn't need to call .split()
     diseases_list = [d.strip() for d in checkup.diseases.split(',') if d.strip()] if checkup.diseases else []
@@ -951,37 +668,30 @@ def generate_dynamic_diet_plan(request, patient_id, checkup_id):
         'projected_change': projected_weight_change,
         'restricted_nutrients': restricted_nutrients,
         'diseases_list': diseases_list,
-        # Analytics Data
-        'a_dates': json.dumps(a_dates),
-        'a_weights': json.dumps(a_weights),
-        'a_bmis': json.dumps(a_bmis),
-        'total_weight_change': total_weight_change,
-        'total_bmi_change': total_bmi_change,
-        'start_weight': start_weight,
+        'analytics': analytics,
         'whatsapp_link': whatsapp_link,
+        'report_versions': versions,
     }
-    return render(request, 'patient_report.html', context)
+    response = render(request, 'patient_report.html', context)
+    if cacheable:
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)   # always revalidate
+    return response
 
-@login_required
-def download_pdf(request, checkup_id):
-    checkup = get_object_or_404(Checkup, id=checkup_id)
+def build_pdf_context(checkup, dietitian_name):
+    """Template context for pdf_report.html (shared by the view and commands)."""
     patient = checkup.patient
     
-    # Use the same calculate_metrics engine for consistency
-    bmi, bmr, tdee, category, target_calories = calculate_metrics(
-        checkup.weight, checkup.height, checkup.age, patient.gender, checkup.activity
-    )
-    
-    diet_goal = "Maintenance"
-    if bmi >= 25:
-        diet_goal = "Weight Loss"
-    elif bmi < 18.5:
-        diet_goal = "Weight Gain"
-    
+    # Stored metrics (stamped at checkup creation, refreshed for an old formula)
+    checkup.ensure_metrics()
+    target_calories = checkup.target_calories
+    diet_goal = diet_goal_for(checkup.bmi)
+
     # Macro Targets (g)
-    protein_g  = round(target_calories * 0.30 / 4, 1)
-    carbs_g    = round(target_calories * 0.40 / 4, 1)
-    fat_g      = round(target_calories * 0.30 / 9, 1)
+    protein_g  = round(checkup.protein_target, 1)
+    carbs_g    = round(checkup.carbs_target, 1)
+    fat_g      = round(checkup.fat_target, 1)
 
     # Activity label map
     activity_map = {
@@ -990,26 +700,10 @@ def download_pdf(request, checkup_id):
     }
     activity_label = activity_map.get(round(checkup.activity, 3), f"{checkup.activity}×")
 
-    # Weekly aggregates
-    db_meals = AssignedMeal.objects.filter(checkup=checkup)
-    weekly_total_cal = sum(m.total_calories for m in db_meals)
-    daily_avg_cal    = round(weekly_total_cal / 7) if weekly_total_cal else 0
-
-    # Full weekly plan
-    weekly_plan = {}
-    days_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    
-    for day in days_order:
-        day_meals = db_meals.filter(day=day)
-        day_list = []
-        for m in day_meals.order_by('id'):
-            day_list.append({
-                'meal': m.meal_type, 'food': m.food_item.name,
-                'qty': m.quantity_text,
-                'cal': m.total_calories, 
-                'p': m.food_item.protein, 'c': m.food_item.carbs, 'f': m.food_item.fat
-            })
-        weekly_plan[day] = day_list
+    # Full weekly plan + aggregates from a single query
+    plan = load_plan(checkup)
+    weekly_plan = plan.weekly_plan
+    daily_avg_cal = round(plan.total_calories / 7) if plan.total_calories else 0
 
     bmi_color_map = {
         'Underweight': '#3b82f6',
@@ -1019,8 +713,6 @@ def download_pdf(request, checkup_id):
     }
     bmi_color = bmi_color_map.get(checkup.category, '#0891b2')
 
-    dietitian_name = request.user.get_full_name() or request.user.username.title()
-
     context = {
         'patient': patient, 
         'checkup': checkup, 
@@ -1035,20 +727,75 @@ def download_pdf(request, checkup_id):
         'bmi_color': bmi_color,
         'dietitian_name': dietitian_name,
     }
-    
-    template_path = 'pdf_report.html'
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="Report_{patient.name}_{checkup.id}.pdf"'
-    template = get_template(template_path)
-    html = template.render(context)
-    pisa_status = pisa.CreatePDF(html, dest=response)
-    if pisa_status.err:
-        return HttpResponse('Errors <pre>' + html + '</pre>')
-    return response
+    return context
+
+
+def dietitian_name_for(user):
+    return user.get_full_name() or user.username.title()
+
+
+def prerender_pdf(request, checkup):
+    """Once the plan write commits, queue this dietitian's PDF of it (HEALTH_PDF_PRERENDER)."""
+    if not settings.HEALTH_PDF_PRERENDER:
+        return
+    dietitian_name = dietitian_name_for(request.user)
+    transaction.on_commit(
+        lambda: prerender(checkup.id, build_pdf_context(checkup, dietitian_name))
+    )
+
+
+@login_required
+def download_pdf(request, checkup_id):
+    checkup = get_object_or_404(Checkup.objects.select_related('patient'), id=checkup_id)
+    context = build_pdf_context(checkup, dietitian_name_for(request.user))
+
+    # Served from the on-disk render cache; renders on the PDF worker pool on a miss
+    filename = f"Report_{checkup.patient.name}_{checkup.id}.pdf"
+    try:
+        return pdf_response(request, checkup.id, context, filename)
+    except PdfRenderError as exc:
+        return HttpResponse('Errors <pre>' + exc.html + '</pre>')
 
 @login_required
 def regenerate_plan(request, checkup_id):
-    checkup = get_object_or_404(Checkup, id=checkup_id)
-    AssignedMeal.objects.filter(checkup=checkup).delete()
+    checkup = get_object_or_404(Checkup.objects.select_related('patient'), id=checkup_id)
+    # Delete + rebuild as one atomic swap; readers never see a half-written plan
+    generate_plan(checkup, replace=True)
+    prerender_pdf(request, checkup)
     messages.success(request, "Diet plan has been regenerated with new options!")
-    return redirect('generate_dynamic_diet_plan', patient_id=checkup.patient.id, checkup_id=checkup.id)
\ No newline at end of file
+    return redirect('generate_dynamic_diet_plan', patient_id=checkup.patient.id, checkup_id=checkup.id)
+
+
+# ==========================================
+# 6. INSTRUMENTATION (opt-in, see health.instrumentation)
+# ==========================================
+
+def _metrics_allowed(request):
+    """Staff session, or `Authorization: Bearer <HEALTH_METRICS_TOKEN>` for scrapers."""
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    token = getattr(settings, 'HEALTH_METRICS_TOKEN', '')
+    return bool(token) and request.headers.get('Authorization') == f"Bearer {token}"
+
+
+def metrics_json(request):
+    """Hot-path report: per-view latency, DB and template percentiles, cache hit rates per namespace."""
+    if not _metrics_allowed(request):
+        return HttpResponseForbidden("Staff only.")
+    if request.method == 'POST' and request.POST.get('reset'):
+        instrumentation.registry.reset()
+        report_cache.stats.reset()
+        cache_stats.reset()
+    report = instrumentation.registry.snapshot()
+    report['enabled'] = getattr(settings, 'HEALTH_INSTRUMENTATION', False)
+    report['report_fragments'] = report_cache.stats.snapshot()
+    report['cache'] = cache_stats.snapshot()
+    return JsonResponse(report)
+
+
+def metrics_prometheus(request):
+    """Same counters in the Prometheus text exposition format."""
+    if not _metrics_allowed(request):
+        return HttpResponseForbidden("Staff only.")
+    return HttpResponse(instrumentation.registry.prometheus(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')